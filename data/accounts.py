@@ -0,0 +1,37 @@
+"""
+data/accounts.py - יתרות הפתיחה של החשבונות
+
+יתרות הפתיחה נשמרות לצד ספר התנועות (data/ledger/accounts.json), כך שהן שייכות
+לאחסון ולא לקוד. חשבון שלא הוגדרה לו יתרה מתחיל מאפס; חשבון ברירת המחדל מתחיל
+מ-INITIAL_BALANCE כל עוד לא הוגדר אחרת.
+"""
+import os
+import json
+from data.ledger_store import LEDGER_DIR, _atomic_write_bytes
+from data.schema import DEFAULT_ACCOUNT
+from data.statement import INITIAL_BALANCE
+
+ACCOUNTS_FILE = "accounts.json"
+
+def load_opening_balances(root=LEDGER_DIR):
+    """
+    קריאת יתרות הפתיחה שהוגדרו.
+    :param root: תיקיית האחסון
+    :return: dict {חשבון: יתרת פתיחה}
+    """
+    balances = {DEFAULT_ACCOUNT: INITIAL_BALANCE}
+    path = os.path.join(root, ACCOUNTS_FILE)
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            balances.update({str(k): float(v) for k, v in json.load(f).get("opening_balances", {}).items()})
+    return balances
+
+def save_opening_balances(balances, root=LEDGER_DIR):
+    """
+    שמירת יתרות הפתיחה (כתיבה אטומית).
+    :param balances: dict {חשבון: יתרת פתיחה}
+    """
+    os.makedirs(root, exist_ok=True)
+    payload = {"opening_balances": {str(k): float(v) for k, v in balances.items()}}
+    _atomic_write_bytes(os.path.join(root, ACCOUNTS_FILE),
+                        json.dumps(payload, indent=2, sort_keys=True, ensure_ascii=False).encode("utf-8"))
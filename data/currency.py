@@ -0,0 +1,119 @@
+"""
+data/currency.py - המרה וקטורית של סכומים למטבע תצוגה, לפי מטבע ותאריך של כל שורה
+
+שערי ההמרה מוחזקים בטבלה אחת: שורה לכל יום (DatetimeIndex ממוין) ועמודה לכל מטבע מקור,
+כשכל ערך הוא מספר יחידות מטבע היעד ליחידת מטבע מקור. כל שורה בספר התנועות מצטרפת
+לשער שלה בחיפוש בינארי על התאריך (השער האחרון הידוע באותו יום) ובאינדקס עמודת המטבע,
+וההמרה כולה היא הכפלה אחת של מערכים.
+
+התוצאה המומרת נשמרת במטמון LRU לפי (גרסת נתונים, מטבע יעד, שערים), כך שמעבר בין
+מטבעות תצוגה שכבר חושבו אינו מחשב דבר.
+"""
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from data.rollups import AMOUNT_COLUMNS, rollup_period
+
+CONVERSION_CACHE_SIZE = 8
+
+_conversion_cache = OrderedDict()
+_conversion_cache_lock = threading.Lock()
+
+def rate_table(histories):
+    """
+    בניית טבלת השערים מהיסטוריית שערים לכל מטבע.
+    ימים ללא שער (סופי שבוע, חגים) מקבלים את השער האחרון הידוע; לפני השער הראשון - את הראשון.
+    :param histories: dict {מטבע מקור: Series של שערים לפי תאריך}
+    :return: DataFrame (תאריך × מטבע) של float64
+    """
+    table = pd.DataFrame({currency: history for currency, history in histories.items() if history is not None})
+    table.index = pd.DatetimeIndex(table.index).normalize()
+    table = table[~table.index.duplicated(keep="last")].sort_index()
+    return table.ffill().bfill().astype("float64")
+
+def rates_fingerprint(table):
+    """מזהה לתוכן טבלת השערים - חלק ממפתח המטמון"""
+    return (tuple(table.columns), int(pd.util.hash_pandas_object(table, index=True).sum()))
+
+def conversion_rates(frame, table, default_currency):
+    """
+    השער של כל שורה לפי (יום, מטבע), בחיפוש בינארי ובאינדוקס מערכים בלבד.
+    :param frame: DataFrame עם עמודת 'date' ואופציונלית 'currency'
+    :param table: טבלת השערים (rate_table)
+    :param default_currency: המטבע של שורות ללא מטבע
+    :return: מערך שערים (NaN למטבע שאין לו שער)
+    """
+    if len(table) == 0:
+        return np.full(len(frame), np.nan)
+    positions = np.searchsorted(table.index.to_numpy(), frame["date"].to_numpy(dtype="datetime64[ns]"), side="right") - 1
+    positions = positions.clip(min=0)
+
+    columns = pd.Index(table.columns)
+    default_column = columns.get_indexer([default_currency])[0]
+    if "currency" in frame.columns:
+        currencies = pd.Categorical(frame["currency"])
+        # קוד -1 (ללא מטבע) בוחר את האיבר האחרון - עמודת מטבע הבסיס
+        lookup = np.append(columns.get_indexer(currencies.categories.astype(str)), default_column)
+        column = lookup[currencies.codes]
+    else:
+        column = np.full(len(frame), default_column)
+
+    # עמודה -1 (מטבע ללא שער) היא עמודת NaN שנוספת בסוף המטריצה
+    matrix = np.concatenate([table.to_numpy(dtype="float64"), np.full((len(table), 1), np.nan)], axis=1)
+    return matrix[positions, column]
+
+def _cached(cache_key, compute):
+    if cache_key[0] is None:
+        return compute()
+    with _conversion_cache_lock:
+        if cache_key in _conversion_cache:
+            _conversion_cache.move_to_end(cache_key)
+            return _conversion_cache[cache_key]
+    result = compute()
+    with _conversion_cache_lock:
+        _conversion_cache[cache_key] = result
+        while len(_conversion_cache) > CONVERSION_CACHE_SIZE:
+            _conversion_cache.popitem(last=False)
+    return result
+
+def _convert(frame, table, default_currency, target_currency, columns):
+    rates = conversion_rates(frame, table, default_currency)
+    if np.all(rates == 1.0):
+        return frame
+    converted = frame.copy()
+    for column in columns:
+        converted[column] = converted[column].to_numpy(dtype="float64") * rates
+    if "currency" in converted.columns:
+        converted["currency"] = pd.Categorical.from_codes(np.zeros(len(converted), dtype=np.int8), [target_currency])
+    return converted
+
+def convert_frame(frame, table, default_currency, target_currency, columns=("amount",), key=None):
+    """
+    המרת עמודות סכום למטבע היעד.
+    :param frame: DataFrame עם 'date', עמודות הסכום ואופציונלית 'currency'
+    :param table: טבלת השערים למטבע היעד (rate_table)
+    :param default_currency: המטבע של שורות ללא מטבע
+    :param target_currency: מטבע היעד; עמודת 'currency' בתוצאה מקבלת אותו
+    :param columns: עמודות הסכום להמרה
+    :param key: מזהה גרסה של frame (אופציונלי); ללא מזהה אין שמירה במטמון
+    :return: DataFrame מומר (frame עצמו כשכל השערים הם 1). התוצאה השמורה משותפת - אין לשנות אותה
+    """
+    cache_key = (key, "frame", default_currency, target_currency, tuple(columns), rates_fingerprint(table))
+    return _cached(cache_key, lambda: _convert(frame, table, default_currency, target_currency, columns))
+
+def convert_rollups(rollups, table, default_currency, target_currency, key=None):
+    """
+    המרת הסיכומים למטבע היעד: הסיכום היומי מומר שורה-שורה לפי (יום, מטבע), והחודשי נבנה ממנו
+    (שער חודשי יחיד לא היה מדויק לתנועות שבתוך החודש).
+    :param key: מזהה גרסה של הסיכומים (אופציונלי); ללא מזהה אין שמירה במטמון
+    :return: dict עם סיכום 'daily' וסיכום 'monthly' במטבע היעד
+    """
+    def compute():
+        daily = _convert(rollups["daily"], table, default_currency, target_currency, AMOUNT_COLUMNS)
+        if daily is rollups["daily"]:
+            return rollups
+        return {"daily": daily, "monthly": rollup_period(daily, "monthly")}
+
+    cache_key = (key, "rollups", default_currency, target_currency, rates_fingerprint(table))
+    return _cached(cache_key, compute)
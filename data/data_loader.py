@@ -1,63 +1,327 @@
 """
 data/data_loader.py - ניהול טעינת וטיפול בנתונים
 """
+import io
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import pandas as pd
 import streamlit as st
+from data import ledger_store
+from data.schema import apply_ledger_schema
+from data.date_normalizer import normalize_dates
+from data.rollups import build_rollups, update_rollups
+import services
 
-@st.cache_data(ttl=60)  # מטמון לשעה אחת בלבד לאפשר רענון נתונים
-def load_data():
-    """טעינת נתוני CSV"""
-    df = pd.read_csv("data/sample_data.csv")
-    return df
+def load_data(start_date=None, end_date=None):
+    """
+    טעינת ספר התנועות מהאחסון העמודתי, בסכמה הקנונית (data/schema.py).
+    בהרצה הראשונה קובץ ה-CSV המקורי מיובא פעם אחת לאחסון.
+    טווח תאריכים (אופציונלי) מאפשר לדלג על מחיצות חודשיות שמחוץ לטווח.
+    בכל הרצה נבדקת רק טביעת האצבע של האחסון (stat למניפסט); הנתונים נטענים מחדש
+    רק כשספר התנועות השתנה בפועל, כולל שינויים מתהליך אחר.
+    """
+    fingerprint = ledger_store.store_fingerprint()
+    if fingerprint is None:
+        ledger_store.ensure_store()
+        fingerprint = ledger_store.store_fingerprint()
+    return _load_ledger(start_date, end_date, fingerprint)
 
-def process_uploaded_csv(uploaded_file, existing_data):
-    """עיבוד קובץ CSV שהועלה והוספתו לנתונים קיימים"""
+@st.cache_data(max_entries=8)  # טביעות אצבע ישנות מפונות, ללא תפוגה לפי זמן
+def _load_ledger(start_date, end_date, fingerprint):
+    """טעינה בפועל, במטמון לפי טווח התאריכים וטביעת האצבע של האחסון"""
+    return _read_ledger(start_date, end_date)
+
+def _read_ledger(start_date=None, end_date=None, root=ledger_store.LEDGER_DIR):
+    """ספר התנועות בסכמה הקנונית, עם גרסת האחסון מאותו מניפסט שממנו נקראו הנתונים"""
+    manifest, data = ledger_store.read_snapshot(root, start=start_date, end=end_date)
+    data = apply_ledger_schema(data)
+    # גרסת הנתונים משמשת כמפתח למטמונים שנגזרים מהם (למשל filter_data) - מאותו מניפסט כמו הנתונים,
+    # כך שתוצאה לעולם לא נשמרת תחת גרסה אחרת מזו של השורות שחושבה מהן
+    data.attrs['ledger_version'] = f"{ledger_store.ledger_version(manifest)}:{start_date}:{end_date}"
+    # מצב המטמונים המצטברים - הגרסה שהנתונים משקפים, כך שהשורות שנוספו אחריה מוחלות פעם אחת בלבד
+    data.attrs['ledger_state'] = (manifest.get('store_id'), manifest['version'], start_date, end_date)
+    return data
+
+# סיכומים מצטברים לכל ספר תנועות שנטען: (store_id, start, end) -> (גרסה, סיכומים)
+ROLLUP_CACHE_SIZE = 4
+_rollup_cache = OrderedDict()
+_rollup_cache_lock = threading.Lock()
+
+# מצב חיזוי מצטבר לכל ספר תנועות שנטען ולכל הכנה (המרה וסינון): (store_id, start, end, key) -> (גרסה, מצב)
+FORECAST_STATE_CACHE_SIZE = 16
+_forecast_state_cache = OrderedDict()
+_forecast_state_cache_lock = threading.Lock()
+
+def _in_loaded_range(rows, start_date, end_date):
+    """סינון שורות לטווח שבו נטען ספר התנועות (כמו read_ledger)"""
+    if start_date is not None:
+        rows = rows[rows['date'] >= pd.Timestamp(start_date)]
+    if end_date is not None:
+        rows = rows[rows['date'] <= pd.Timestamp(end_date)]
+    return rows
+
+def _incremental(cache, lock, cache_size, data, root, build, update, extra_key=None):
+    """
+    נתון נגזר שנבנה פעם אחת לכל ספר תנועות; כשהגרסה מתקדמת בהוספות בלבד, רק השורות
+    שנוספו (מיומן הכתיבה) מוחלות עליו ב-update, ללא סריקת ספר התנועות.
+    :param extra_key: מזהה נוסף (למשל הגדרות ההמרה והסינון) - לכל מזהה נתון נגזר משלו
+    """
+    state = data.attrs.get('ledger_state')
+    if state is None:
+        return build(data)
+    store_id, version, start_date, end_date = state
+    key = (store_id, start_date, end_date, extra_key)
+    
+    with lock:
+        cached = cache.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    
+    result = None
+    if cached is not None and cached[0] < version:
+        appended = ledger_store.read_appended(root, since=cached[0], until=version)
+        if appended is not None:
+            new_rows = _in_loaded_range(apply_ledger_schema(appended), start_date, end_date)
+            result = update(cached[1], new_rows)
+    if result is None:
+        result = build(data)
+    
+    with lock:
+        cache[key] = (version, result)
+        cache.move_to_end(key)
+        while len(cache) > cache_size:
+            cache.popitem(last=False)
+    return result
+
+def ledger_rollups(data, root=ledger_store.LEDGER_DIR):
+    """
+    הסיכומים המצטברים (data/rollups.py) של ספר התנועות שנטען.
+    הסיכומים נבנים פעם אחת לכל ספר תנועות; כשהגרסה מתקדמת בהוספות בלבד, רק השורות
+    שנוספו (מיומן הכתיבה) מוחלות על הסיכומים הקיימים, ללא סריקת ספר התנועות.
+    :param data: ספר התנועות מ-load_data
+    :return: dict עם סיכום 'daily' וסיכום 'monthly' (משותף - אין לשנות אותו)
+    """
+    return _incremental(_rollup_cache, _rollup_cache_lock, ROLLUP_CACHE_SIZE, data, root,
+                        build_rollups, update_rollups)
+
+def ledger_forecast_state(data, root=ledger_store.LEDGER_DIR, prepare=None, key=None):
+    """
+    מצב החיזוי המצטבר (services.forecast_state) של ספר התנועות שנטען.
+    כמו ב-ledger_rollups, הוספות מוחלות על המצב הקיים מהשורות שנוספו בלבד
+    (services.update_forecast_state), כך שהחיזוי הבא לא עובר שוב על ההיסטוריה.
+    :param data: ספר התנועות מ-load_data
+    :param prepare: פונקציה שורות -> DataFrame עם 'date' ו-'amount', שמופעלת באותו אופן על ספר
+                    התנועות ועל השורות שנוספו (למשל המרת מטבע וסינון); None - השורות כפי שהן
+    :param key: מזהה של prepare (מטבע, שערים, מסננים) - לכל מזהה מצב משלו
+    :return: מצב החיזוי (לחיזוי: services.forecast_from_state)
+    """
+    prepare = prepare or (lambda rows: rows)
+    return _incremental(_forecast_state_cache, _forecast_state_cache_lock, FORECAST_STATE_CACHE_SIZE, data, root,
+                        lambda rows: services.forecast_state(prepare(rows)),
+                        lambda state, rows: services.update_forecast_state(state, prepare(rows)),
+                        extra_key=key)
+
+# גודל מקטע ברירת מחדל לייבוא בזרימה - מגביל את הזיכרון המרבי בזמן ייבוא
+DEFAULT_CHUNK_SIZE = 50_000
+
+def normalize_date_column(frame, signature=None, formats=None):
+    """
+    פענוח עמודת התאריך בפורמטים מעורבים (ראו date_normalizer).
+    שורות שלא ניתן לפענח מוחזרות בנפרד במקום לדחות את כל הקובץ.
+    :param frame: DataFrame עם עמודת 'date'
+    :param signature: חתימת המקור לשמירת הפורמטים שזוהו (למשל כותרות הקובץ)
+    :param formats: פורמטים שכבר נקבעו לעמודה (למשל במקטע קודם של אותו קובץ), ללא זיהוי מחדש
+    :return: (שורות תקינות עם date כ-datetime64, שורות שנדחו, רשימת הפורמטים)
+    """
+    dates, bad, formats = normalize_dates(frame['date'], signature, formats)
+    valid = frame[~bad].copy()
+    valid['date'] = dates[~bad]
+    return valid, frame[bad], formats
+
+def process_uploaded_csv(uploaded_file):
+    """
+    עיבוד קובץ CSV שהועלה והחזרת השורות שעדיין אינן בספר התנועות.
+    רק השורות שבקובץ מגובבות ונבדקות מול אינדקס הגיבובים, ללא מיזוג עם כל ספר התנועות.
+    """
     try:
         new_data = pd.read_csv(uploaded_file)
         
-        # המרת עמודת התאריך לפורמט אחיד
+        # פענוח עמודת התאריך; הפורמטים נשמרים לפי כותרות הקובץ לייבוא הבא מאותו מקור
         if 'date' in new_data.columns:
-            # ניסיון להמיר תאריכים בכל פורמט אפשרי
-            try:
-                new_data['date'] = pd.to_datetime(new_data['date'])
-                # המרה לפורמט YYYY-MM-DD אחיד
-                new_data['date'] = new_data['date'].dt.strftime('%Y-%m-%d')
-                st.success("התאריכים הומרו בהצלחה לפורמט YYYY-MM-DD")
-            except Exception as e:
-                st.warning(f"שגיאה בהמרת התאריכים: {e}. מנסה פורמט אחר...")
-                try:
-                    # ניסיון להמיר עם פורמט ספציפי
-                    new_data['date'] = pd.to_datetime(new_data['date'], format='%d/%m/%Y')
-                    new_data['date'] = new_data['date'].dt.strftime('%Y-%m-%d')
-                    st.success("התאריכים הומרו בהצלחה לפורמט YYYY-MM-DD")
-                except:
-                    st.error("לא ניתן להמיר את התאריכים. אנא בדוק שהתאריכים בפורמט תקין.")
-                    return existing_data
+            new_data, rejected, formats = normalize_date_column(new_data, signature=tuple(new_data.columns))
+            if new_data.empty:
+                st.error("לא ניתן להמיר את התאריכים. אנא בדוק שהתאריכים בפורמט תקין.")
+                return None
+            st.success(f"התאריכים פוענחו בהצלחה (פורמטים: {', '.join(formats)})")
+            if not rejected.empty:
+                st.warning(f"{len(rejected)} שורות עם תאריך לא תקין לא ייובאו.")
+                with st.expander("הצג שורות שנדחו"):
+                    st.dataframe(rejected.head(100))
         
-        # מיזוג הנתונים
-        merged_data = pd.concat([existing_data, new_data], ignore_index=True)
+        # סינון שורות שכבר קיימות (לפי גיבוב של כל העמודות)
+        ledger_store.ensure_store()
+        new_rows = ledger_store.find_new_rows(new_data)
         
-        # הסרת כפילויות (לפי כל העמודות)
-        merged_data = merged_data.drop_duplicates()
+        if new_rows.empty:
+            st.info("כל השורות בקובץ כבר קיימות בנתונים.")
+            return new_rows
         
         # הצגת הודעת הצלחה
-        st.success(f"הנתונים נוספו בהצלחה! נוספו {len(new_data)} שורות.")
+        st.success(f"נמצאו {len(new_rows)} שורות חדשות מתוך {len(new_data)} שורות בקובץ.")
         
         # אפשרות להציג חלק מהנתונים החדשים
         with st.expander("הצג את הנתונים החדשים שנוספו"):
-            st.dataframe(new_data.head(10))
+            st.dataframe(new_rows.head(10))
             
-        return merged_data
+        return new_rows
         
     except Exception as e:
         st.error(f"שגיאה בקריאת הקובץ: {e}")
-        return existing_data
+        return None
+
+def stream_csv_to_ledger(source, chunk_size=DEFAULT_CHUNK_SIZE, progress_callback=None, total_bytes=None,
+                         root=ledger_store.LEDGER_DIR):
+    """
+    ייבוא CSV גדול בזרימה: הקובץ נקרא במקטעים בגודל קבוע, וכל מקטע מנורמל,
+    מסונן מכפילויות ומתווסף לאחסון לפני קריאת המקטע הבא.
+    :param source: נתיב או אובייקט קובץ
+    :param chunk_size: מספר שורות בכל מקטע
+    :param progress_callback: פונקציה (rows_read, rows_added, fraction) לדיווח התקדמות
+    :param total_bytes: גודל הקובץ, לחישוב אחוז ההתקדמות (אופציונלי)
+    :param root: תיקיית האחסון
+    :return: (מספר שורות שנקראו, מספר שורות שנוספו, מספר שורות שנדחו בגלל תאריך לא תקין)
+    """
+    ledger_store.ensure_store(root)
+    rows_read = 0
+    rows_added = 0
+    rows_rejected = 0
+    formats = None
+    for chunk in pd.read_csv(source, chunksize=chunk_size):
+        rows_read += len(chunk)
+        if 'date' in chunk.columns:
+            # הפורמטים מזוהים במקטע הראשון ומועברים לכל המקטעים הבאים: המקטעים הקודמים כבר נוספו,
+            # ולכן מקטע מאוחר לעולם לא עובר לסדר יום-חודש אחר (ערכים בסדר ההפוך נדחים)
+            chunk, rejected, formats = normalize_date_column(chunk, signature=tuple(chunk.columns),
+                                                             formats=formats)
+            rows_rejected += len(rejected)
+        added = ledger_store.append_rows(chunk, root)
+        rows_added += len(added)
+        if progress_callback is not None:
+            fraction = None
+            if total_bytes and hasattr(source, 'tell'):
+                fraction = min(1.0, source.tell() / total_bytes)
+            progress_callback(rows_read, rows_added, fraction)
+    return rows_read, rows_added, rows_rejected
+
+def import_uploaded_csv_streaming(uploaded_file, chunk_size=DEFAULT_CHUNK_SIZE):
+    """ייבוא קובץ CSV גדול ישירות לאחסון במקטעים, עם סרגל התקדמות"""
+    progress_bar = st.progress(0.0, text="מתחיל ייבוא...")
+    
+    def report(rows_read, rows_added, fraction):
+        text = f"נקראו {rows_read:,} שורות, נוספו {rows_added:,}"
+        progress_bar.progress(fraction if fraction is not None else 0.0, text=text)
+    
+    try:
+        rows_read, rows_added, rows_rejected = stream_csv_to_ledger(
+            uploaded_file,
+            chunk_size=chunk_size,
+            progress_callback=report,
+            total_bytes=getattr(uploaded_file, 'size', None)
+        )
+    except Exception as e:
+        # מקטעים שכבר נוספו נשארים באחסון - ייבוא חוזר ידלג עליהם
+        st.error(f"שגיאה בייבוא הקובץ: {e}")
+        return False
+    
+    progress_bar.progress(1.0, text="הייבוא הושלם")
+    st.success(f"נקראו {rows_read:,} שורות, מתוכן נוספו {rows_added:,} שורות חדשות.")
+    if rows_rejected:
+        st.warning(f"{rows_rejected:,} שורות עם תאריך לא תקין לא יובאו.")
+    return True
+
+def _parse_import_file(job):
+    """
+    קריאה ונרמול של קובץ אחד בייבוא מרובה (רץ בתהליך נפרד).
+    :param job: (שם הקובץ, תוכן הקובץ כ-bytes או נתיב)
+    :return: (השורות התקינות, רשומת דיווח לקובץ)
+    """
+    name, source = job
+    started = time.perf_counter()
+    frame = pd.read_csv(io.BytesIO(source) if isinstance(source, bytes) else source)
+    report = {'file': name, 'rows': len(frame), 'rejected': 0, 'formats': ''}
+    if 'date' in frame.columns:
+        frame, rejected, formats = normalize_date_column(frame, signature=tuple(frame.columns))
+        report.update(rejected=len(rejected), formats=', '.join(formats))
+    report['parse_seconds'] = time.perf_counter() - started
+    return frame, report
+
+def import_files(files, max_workers=None, root=ledger_store.LEDGER_DIR):
+    """
+    ייבוא מרובה קבצים: הקבצים נקראים ומנורמלים במקביל במאגר תהליכים,
+    ואז מאוחדים ועוברים מעבר סינון כפילויות יחיד לפני הוספה אחת לאחסון
+    (כך שגם שורה שמופיעה בשני קבצים נוספת פעם אחת בלבד).
+    :param files: רשימת (שם הקובץ, תוכן הקובץ כ-bytes או נתיב)
+    :param max_workers: מספר תהליכים מרבי (ברירת מחדל: מספר המעבדים); 1 - ללא מקביליות
+    :param root: תיקיית האחסון
+    :return: (DataFrame דיווח לכל קובץ, DataFrame השורות שנוספו)
+    """
+    jobs = list(files)
+    workers = min(len(jobs), max_workers or os.cpu_count() or 1)
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_parse_import_file, jobs))
+    else:
+        results = [_parse_import_file(job) for job in jobs]
+    frames = [frame for frame, _ in results]
+    report = pd.DataFrame([file_report for _, file_report in results],
+                          columns=['file', 'rows', 'rejected', 'formats', 'parse_seconds'])
+
+    ledger_store.ensure_store(root)
+    started = time.perf_counter()
+    combined = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    added = ledger_store.append_rows(combined, root) if not combined.empty else combined
+    merge_seconds = time.perf_counter() - started
+
+    # שיוך השורות שנוספו לקובץ המקור לפי מיקומן בטבלה המאוחדת
+    source = np.repeat(np.arange(len(frames)), [len(frame) for frame in frames])
+    report['added'] = np.bincount(source[added.index.to_numpy(dtype=np.int64)], minlength=len(frames))
+    report.attrs['merge_seconds'] = merge_seconds
+    return report, added
+
+def import_uploaded_files(uploaded_files):
+    """ייבוא מרובה של קבצים שהועלו, עם דיווח זמנים ומספר שורות לכל קובץ"""
+    try:
+        with st.spinner(f"מייבא {len(uploaded_files)} קבצים..."):
+            report, added = import_files([(f.name, f.getvalue()) for f in uploaded_files])
+    except Exception as e:
+        st.error(f"שגיאה בייבוא הקבצים: {e}")
+        return False
+    
+    st.success(f"נוספו {len(added):,} שורות חדשות מתוך {int(report['rows'].sum()):,} שורות ב-{len(report)} קבצים "
+               f"(איחוד וסינון כפילויות: {report.attrs['merge_seconds']:.2f} שניות).")
+    st.dataframe(report, hide_index=True)
+    if report['rejected'].any():
+        st.warning(f"{int(report['rejected'].sum()):,} שורות עם תאריך לא תקין לא יובאו.")
+    return True
+
+def append_data_to_source(new_rows):
+    """הוספת שורות חדשות לאחסון המקור - נכתבות כמקטע ביומן הכתיבה בלבד"""
+    try:
+        added = ledger_store.append_rows(new_rows)
+        st.success(f"נוספו {len(added)} שורות לאחסון המקור!")
+        return True
+    except Exception as e:
+        st.error(f"שגיאה בשמירת הנתונים: {e}")
+        return False
 
 def save_data_to_source(data):
-    """שמירת נתונים לקובץ המקור"""
+    """שמירת נתונים לאחסון המקור"""
     try:
-        data.to_csv("data/sample_data.csv", index=False)
-        st.cache_data.clear()  # מחיקת המטמון כדי לחייב טעינה מחדש
+        ledger_store.write_ledger(data)
         st.success("הנתונים נשמרו בהצלחה לקובץ המקור! לחץ על Rerun כדי לראות את השינויים.")
         return True
     except Exception as e:
@@ -65,11 +329,21 @@ def save_data_to_source(data):
         return False
 
 def filter_data_by_date_range(data, date_range):
-    """סינון נתונים לפי טווח תאריכים"""
+    """
+    סינון נתונים לפי טווח תאריכים (כולל שני הקצוות), ללא שינוי הנתונים המקוריים.
+    על ספר תנועות עם DatetimeIndex ממוין (ראו data/schema.py) הסינון הוא חיפוש בינארי
+    וחיתוך רציף של השורות; אחרת מתבצע סינון רגיל לפי מסכה.
+    """
     if len(date_range) == 2:
         start_date, end_date = date_range
-        data['date'] = pd.to_datetime(data['date'])
-        mask = (data['date'] >= pd.Timestamp(start_date)) & (data['date'] <= pd.Timestamp(end_date))
+        start, end = pd.Timestamp(start_date), pd.Timestamp(end_date)
+        index = data.index
+        if isinstance(index, pd.DatetimeIndex) and index.is_monotonic_increasing:
+            lo = index.searchsorted(start, side='left')
+            hi = index.searchsorted(end, side='right')
+            return data.iloc[lo:hi]
+        dates = pd.to_datetime(data['date'])
+        mask = (dates >= start) & (dates <= end)
         return data[mask]
     return data
 
@@ -83,4 +357,74 @@ def filter_data_by_types(data, types):
     """סינון נתונים לפי סוגים"""
     if types:
         return data[data['type'].isin(types)]
-    return data 
\ No newline at end of file
+    return data 
+
+def filter_data_by_accounts(data, accounts):
+    """סינון נתונים לפי חשבונות"""
+    if accounts:
+        return data[data['account'].isin(accounts)]
+    return data
+
+# מטמון LRU לתוצאות סינון, לפי (גרסת נתונים, מפרט סינון) - משותף לכל הסשנים.
+# מוגבל גם בזיכרון: סך התוצאות השמורות עד FILTER_CACHE_LEDGER_MULTIPLE פעמים הנתונים הגדולים שסוננו
+FILTER_CACHE_SIZE = 32
+FILTER_CACHE_LEDGER_MULTIPLE = 2
+_filter_cache = OrderedDict()
+_filter_cache_lock = threading.Lock()
+
+def _frame_bytes(frame):
+    """גודל DataFrame בזיכרון (ללא תוכן אובייקטים - עותק מסונן חולק אותם עם המקור)"""
+    return int(frame.memory_usage(index=True, deep=False).sum())
+
+def _filter_spec(date_range, categories, types, accounts=None):
+    """מפרט סינון קנוני וניתן לגיבוב"""
+    dates = tuple(str(pd.Timestamp(d).date()) for d in date_range) if date_range and len(date_range) == 2 else None
+    return (dates, tuple(sorted(map(str, categories or ()))), tuple(sorted(map(str, types or ()))),
+            tuple(sorted(map(str, accounts or ()))))
+
+def filter_data(data, date_range=None, categories=None, types=None, version=None, accounts=None):
+    """
+    סינון משולב לפי טווח תאריכים, קטגוריות, סוגים וחשבונות במעבר אחד.
+    טווח התאריכים נחתך בחיפוש בינארי, ושאר התנאים מצורפים למסכה אחת - כך נוצר עותק ביניים אחד לכל היותר.
+    כאשר מועברת גרסת נתונים, התוצאה נשמרת במטמון LRU לפי (גרסה, מפרט סינון),
+    וריצה חוזרת עם אותם מסננים אינה מחשבת דבר. התוצאה השמורה משותפת - אין לשנות אותה.
+    המטמון מוגבל ל-FILTER_CACHE_SIZE תוצאות ולסך של FILTER_CACHE_LEDGER_MULTIPLE פעמים גודל הנתונים.
+    :param data: DataFrame לסינון
+    :param date_range: רשימה עם תאריך התחלה וסיום (אופציונלי)
+    :param categories: קטגוריות לכלול (ריק = הכל)
+    :param types: סוגים לכלול (ריק = הכל)
+    :param accounts: חשבונות לכלול (ריק = הכל)
+    :param version: מזהה גרסה של data (אופציונלי); ללא גרסה אין שמירה במטמון
+    :return: DataFrame מסונן
+    """
+    spec = _filter_spec(date_range, categories, types, accounts)
+    key = (version, spec)
+    if version is not None:
+        with _filter_cache_lock:
+            if key in _filter_cache:
+                _filter_cache.move_to_end(key)
+                return _filter_cache[key][0]
+    
+    result = filter_data_by_date_range(data, date_range) if spec[0] else data
+    mask = None
+    if categories:
+        mask = result['category'].isin(categories).to_numpy()
+    if types:
+        type_mask = result['type'].isin(types).to_numpy()
+        mask = type_mask if mask is None else mask & type_mask
+    if accounts:
+        account_mask = result['account'].isin(accounts).to_numpy()
+        mask = account_mask if mask is None else mask & account_mask
+    if mask is not None:
+        result = result[mask]
+    
+    if version is not None:
+        # תוצאה ללא סינון היא data עצמו ואינה תופסת זיכרון נוסף
+        size = 0 if result is data else _frame_bytes(result)
+        with _filter_cache_lock:
+            _filter_cache[key] = (result, size, _frame_bytes(data))
+            budget = FILTER_CACHE_LEDGER_MULTIPLE * max(entry[2] for entry in _filter_cache.values())
+            total = sum(entry[1] for entry in _filter_cache.values())
+            while len(_filter_cache) > FILTER_CACHE_SIZE or (total > budget and len(_filter_cache) > 1):
+                total -= _filter_cache.popitem(last=False)[1][1]
+    return result
@@ -0,0 +1,206 @@
+"""
+data/date_normalizer.py - זיהוי ופענוח וקטורי של תאריכים בפורמטים מעורבים
+
+הפורמטים מזוהים פעם אחת על מדגם מהעמודה, ואז כל קבוצת פורמט מפוענחת בקריאה וקטורית
+אחת עם format= מפורש. הפורמטים שזוהו נשמרים לפי חתימת המקור (למשל כותרות הקובץ),
+כך שייבוא חוזר מאותו בנק מדלג על שלב הזיהוי המלא.
+
+חתימה זהה אינה מבטיחה אותו מקור (שני בנקים עם אותן כותרות), ולכן הפורמטים השמורים
+נבדקים מול מדגם חדש, ולעולם אין ערבוב של יום-חודש וחודש-יום באותה עמודה: ערך שמתפענח
+רק בסדר ההפוך מעביר את כל העמודה לסדר ההפוך.
+
+ערכים שאף פורמט מהרשימה אינו מפענח (שעה ללא שניות, שברי שנייה, אזור זמן, שם חודש מלא)
+עוברים לפענוח גיבוי וקטורי - ISO8601 ואחריו mixed - לפני שהם נדחים.
+"""
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+# סדר העדיפות קובע במקרה של תיקו (למשל 01/02/2024 שמתאים לשני הסדרים);
+# חודש-יום קודם, בהתאם להתנהגות ברירת המחדל של pd.to_datetime
+CANDIDATE_FORMATS = [
+    "%Y-%m-%d",
+    "%m/%d/%Y",
+    "%d/%m/%Y",
+    "%d.%m.%Y",
+    "%Y/%m/%d",
+    "%d-%m-%Y",
+    "%m/%d/%y",
+    "%d/%m/%y",
+    "%Y%m%d",
+    "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%dT%H:%M:%S",
+    "%m/%d/%Y %H:%M",
+    "%d/%m/%Y %H:%M",
+    "%d %b %Y",
+    "%b %d, %Y",
+]
+# זוגות פורמטים שמפענחים את אותם ערכים בסדר הפוך (05/03/2024 - 3 במאי או 5 במרץ)
+REVERSED_FORMATS = {
+    "%m/%d/%Y": "%d/%m/%Y",
+    "%d/%m/%Y": "%m/%d/%Y",
+    "%m/%d/%y": "%d/%m/%y",
+    "%d/%m/%y": "%m/%d/%y",
+    "%m/%d/%Y %H:%M": "%d/%m/%Y %H:%M",
+    "%d/%m/%Y %H:%M": "%m/%d/%Y %H:%M",
+}
+# פענוח גיבוי לערכים שנותרו, לפי הסדר; mixed עוקב אחר סדר היום-חודש של העמודה
+FALLBACK_FORMATS = ["ISO8601", "mixed"]
+SAMPLE_SIZE = 500
+FORMAT_CACHE_SIZE = 256
+
+_format_cache = OrderedDict()
+_format_cache_lock = threading.Lock()
+
+def _as_text(values):
+    return values.astype("string").str.strip()
+
+def _sample(text, sample_size):
+    """מדגם של ערכים ייחודיים, בפיזור אחיד לאורך העמודה"""
+    unique = text.dropna().drop_duplicates()
+    if len(unique) <= sample_size:
+        return unique
+    positions = np.linspace(0, len(unique) - 1, sample_size).astype(int)
+    return unique.iloc[positions]
+
+def _conflicts(fmt, formats):
+    """האם fmt קורא יום-חודש בסדר ההפוך מאחד הפורמטים הדו-משמעיים שכבר נבחרו"""
+    return fmt in REVERSED_FORMATS and any(
+        other in REVERSED_FORMATS and other[:2] != fmt[:2] for other in formats)
+
+def infer_date_formats(values, sample_size=SAMPLE_SIZE):
+    """
+    זיהוי הפורמטים שמכסים את מדגם הערכים.
+    בכל שלב נבחר הפורמט שמפענח את מרב הערכים שנותרו.
+    :param values: Series עם תאריכים כטקסט
+    :param sample_size: גודל המדגם
+    :return: רשימת פורמטים לפי סדר השימוש
+    """
+    remaining = _sample(_as_text(values), sample_size)
+    formats = []
+    while not remaining.empty:
+        best_format, best_hits = None, None
+        for fmt in CANDIDATE_FORMATS:
+            # פורמט בסדר הפוך מפורמט שכבר נבחר היה מפענח חלק מהעמודה בסדר אחר
+            if fmt in formats or _conflicts(fmt, formats):
+                continue
+            hits = pd.to_datetime(remaining, format=fmt, errors="coerce").notna()
+            if best_hits is None or hits.sum() > best_hits.sum():
+                best_format, best_hits = fmt, hits
+        if best_hits is None or not best_hits.any():
+            break
+        formats.append(best_format)
+        remaining = remaining[~best_hits]
+    return formats
+
+def _day_first(formats):
+    """סדר היום-חודש של העמודה לפי הפורמט הדו-משמעי הראשון שנבחר (None - הסדר לא נקבע)"""
+    return next((fmt.startswith("%d") for fmt in formats if fmt in REVERSED_FORMATS), None)
+
+# תאריך מספרי שמתחיל בשני מספרים (05/04/2024 9am) - סדרם חייב להתאים לסדר העמודה
+_NUMERIC_PREFIX = r"^(\d{1,2})[/.\-](\d{1,2})[/.\-]"
+
+def _to_datetime(values, fmt, day_first):
+    """
+    פענוח בפורמט אחד. בפענוח הגיבוי ערכים עם אזור זמן מומרים ל-UTC ללא אזור זמן, ו-mixed
+    (שהופך יום וחודש בשקט כשהחודש אינו תקין) אינו מקבל תאריך מספרי בסדר ההפוך מסדר העמודה.
+    """
+    if fmt not in FALLBACK_FORMATS:
+        return pd.to_datetime(values, format=fmt, errors="coerce").to_numpy()
+    parsed = pd.to_datetime(values, format=fmt, dayfirst=bool(day_first), errors="coerce", utc=True)
+    parsed = parsed.dt.tz_convert(None).to_numpy(dtype="datetime64[ns]")
+    if fmt == "mixed" and day_first is not None:
+        numbers = values.str.extract(_NUMERIC_PREFIX).astype("float64").to_numpy()
+        month = numbers[:, 1] if day_first else numbers[:, 0]
+        parsed[month > 12] = np.datetime64("NaT")
+    return parsed
+
+def _parse_with_formats(text, formats, parsed, pending, order_formats=None):
+    """
+    פענוח וקטורי לכל פורמט, רק על הערכים שעדיין לא פוענחו (במקום).
+    :param order_formats: הפורמטים שקובעים את סדר היום-חודש של העמודה (ברירת מחדל: formats)
+    """
+    day_first = _day_first(formats if order_formats is None else order_formats)
+    for fmt in formats:
+        if not pending.any():
+            break
+        positions = np.flatnonzero(pending)
+        attempt = _to_datetime(text.iloc[positions], fmt, day_first)
+        hit = ~np.isnat(attempt)
+        parsed[positions[hit]] = attempt[hit]
+        pending[positions[hit]] = False
+
+def _covers_sample(text, formats):
+    """בדיקה שהפורמטים השמורים מפענחים מדגם חדש מהעמודה במלואו"""
+    sample = _sample(text, SAMPLE_SIZE)
+    parsed = np.full(len(sample), np.datetime64("NaT"), dtype="datetime64[ns]")
+    pending = np.ones(len(sample), dtype=bool)
+    _parse_with_formats(sample, formats, parsed, pending)
+    return not pending.any()
+
+def normalize_dates(values, signature=None, formats=None):
+    """
+    פענוח עמודת תאריכים בפורמטים מעורבים.
+    :param values: Series עם תאריכים (טקסט או datetime)
+    :param signature: חתימת מקור ניתנת לגיבוב (למשל כותרות הקובץ) לשמירת הפורמטים שזוהו
+    :param formats: פורמטים שכבר נקבעו לעמודה (למשל במקטע הקודם של אותו קובץ); בלי זיהוי מחדש
+                    ובלי מעבר לסדר ההפוך - ערכים שמתפענחים רק בסדר ההפוך נדחים
+    :return: (Series של datetime64, מסכת השורות שלא פוענחו, רשימת הפורמטים)
+    """
+    if pd.api.types.is_datetime64_any_dtype(values):
+        parsed = values.astype("datetime64[ns]")
+        return parsed, parsed.isna().to_numpy(), []
+
+    text = _as_text(values)
+
+    fixed = formats is not None
+    if not fixed and signature is not None:
+        with _format_cache_lock:
+            formats = _format_cache.get(signature)
+            if formats is not None:
+                _format_cache.move_to_end(signature)
+    # פורמטים שמורים שאינם מכסים מדגם חדש שייכים למקור אחר עם אותה חתימה - זיהוי מחדש
+    if not fixed and (formats is None or not _covers_sample(text, formats)):
+        formats = infer_date_formats(text)
+
+    for attempt in range(2):
+        parsed = np.full(len(text), np.datetime64("NaT"), dtype="datetime64[ns]")
+        pending = text.notna().to_numpy()
+        _parse_with_formats(text, formats, parsed, pending)
+        if not pending.any():
+            break
+        # פורמט שלא הופיע במדגם (או בייבוא הקודם מאותו מקור) - זיהוי נוסף על השאריות בלבד
+        extra = [fmt for fmt in infer_date_formats(text[pending]) if fmt not in formats]
+        reversed_order = [fmt for fmt in extra if _conflicts(fmt, formats)]
+        if reversed_order and attempt == 0 and not fixed:
+            # ערך שמתפענח רק בסדר ההפוך: כל העמודה עוברת לסדר ההפוך והערכים הדו-משמעיים מפוענחים מחדש
+            formats = [REVERSED_FORMATS.get(fmt, fmt) for fmt in formats]
+            continue
+        # אחרי המעבר, ערכים שמתפענחים רק בסדר המקורי סותרים את שאר העמודה - הם נדחים
+        extra = [fmt for fmt in extra if fmt not in reversed_order]
+        _parse_with_formats(text, extra, parsed, pending)
+        formats = formats + extra
+        break
+    
+    # ערכים בסדר ההפוך נדחים גם בפענוח הגיבוי (mixed היה קורא אותם בסדר ההפוך):
+    # הם מוצאים מהשאריות בלי שתאריך נרשם להם
+    opposite = [fmt for fmt in REVERSED_FORMATS if _conflicts(fmt, formats)]
+    if pending.any() and opposite:
+        _parse_with_formats(text, opposite, parsed.copy(), pending)
+    
+    # ערכים שאף פורמט מהרשימה אינו מפענח - פענוח גיבוי לפני שהם נדחים
+    for fmt in FALLBACK_FORMATS:
+        if not pending.any() or fmt in formats:
+            continue
+        before = pending.sum()
+        _parse_with_formats(text, [fmt], parsed, pending, formats)
+        if pending.sum() < before:
+            formats = formats + [fmt]
+
+    if signature is not None:
+        with _format_cache_lock:
+            _format_cache[signature] = formats
+            while len(_format_cache) > FORMAT_CACHE_SIZE:
+                _format_cache.popitem(last=False)
+    return pd.Series(parsed, index=values.index), np.isnat(parsed), formats
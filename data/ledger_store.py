@@ -0,0 +1,491 @@
+"""
+data/ledger_store.py - אחסון עמודתי (Parquet) של ספר התנועות, מחולק לפי חודשים
+
+מבנה התיקייה:
+    data/ledger/
+        manifest.json           # גרסה, מחיצות (חודש -> מספר שורות וקובץ) ויומן הכתיבה
+        2024-01.v3.parquet      # מחיצה לכל חודש (הסיומת היא גרסת הכתיבה של הקובץ)
+        2024-01.v3.hashes.npy   # אינדקס ממוין של גיבובי השורות במחיצה (לזיהוי כפילויות)
+        undated.v1.parquet      # שורות ללא תאריך תקין (אם יש)
+        wal/000007.parquet      # מקטעי יומן כתיבה (write-ahead log) שטרם אוחדו למחיצות
+
+כל שינוי נכתב קודם לקבצים חדשים, ורק אז המניפסט מוחלף באופן אטומי (זוהי נקודת ה-commit).
+תהליך שנופל באמצע כתיבה משאיר קבצים יתומים שאינם מופיעים במניפסט - הם מתעלמים מהם ונמחקים בכתיבה הבאה.
+הוספת שורות כותבת רק מקטע יומן חדש; איחוד היומן למחיצות (compaction) מתבצע מדי כמה הוספות.
+עמודה מתוך OPTIONAL_COLUMNS שמגיעה לראשונה בקובץ שהועלה מתווספת לאחסון בכתיבה מלאה חד-פעמית.
+כל שינוי רץ בנעילת האחסון (store_lock), כך שהוספות במקביל מכמה sessions או תהליכים אינן דורסות זו את זו.
+קריאה אינה נועלת: קורא שקבצי המניפסט שלו נמחקו באיחוד שהסתיים בינתיים חוזר על הקריאה מהמניפסט החדש.
+"""
+import os
+import json
+import uuid
+import threading
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+from data.schema import DEFAULT_ACCOUNT
+
+try:
+    import fcntl
+except ImportError:  # Windows - נעילה בין תהליכים אינה זמינה, הנעילה בתוך התהליך נשארת
+    fcntl = None
+
+LEDGER_DIR = "data/ledger"
+SOURCE_CSV = "data/sample_data.csv"
+MANIFEST_FILE = "manifest.json"
+LOCK_FILE = ".lock"
+WAL_DIR = "wal"
+UNDATED_PARTITION = "undated"
+NUMERIC_COLUMNS = ("amount", "inventory_level")
+# עמודות שנוספו לסכמה אחרי שאחסונים כבר נוצרו, והערך שמשמעותו "ריק" בהן:
+# שורות ישנות נשארות ריקות, ולצורך זיהוי כפילויות ערך ריק שווה לערך ברירת המחדל
+OPTIONAL_COLUMNS = {"account": DEFAULT_ACCOUNT, "currency": ""}
+
+# מספר ניסיונות קריאה כשקבצים הוחלפו בין קריאת המניפסט לקריאת הקבצים (ראו _read_current)
+READ_ATTEMPTS = 5
+
+# ספי איחוד יומן הכתיבה למחיצות החודשיות
+COMPACT_SEGMENTS = 16
+COMPACT_ROWS = 200_000
+
+# כל שינוי באחסון (הוספה, איחוד, כתיבה מלאה, הוספת עמודות) הוא קריאה-שינוי-כתיבה של המניפסט,
+# ולכן רץ בנעילה אחת: נעילה בתוך התהליך (כל session של Streamlit הוא thread) ונעילת קובץ בין תהליכים.
+# הנעילה חוזרת (re-entrant) - append_rows קורא ל-compact ול-add_columns בתוכה.
+_store_lock = threading.RLock()
+_store_lock_depth = 0
+
+@contextmanager
+def store_lock(root=LEDGER_DIR):
+    """נעילת האחסון לשינוי; בתוך הנעילה יש לקרוא את המניפסט מחדש לפני בחירת גרסה ומספר מקטע"""
+    global _store_lock_depth
+    with _store_lock:
+        handle = None
+        if _store_lock_depth == 0:
+            os.makedirs(root, exist_ok=True)
+            handle = open(os.path.join(root, LOCK_FILE), "a+b")
+            if fcntl is not None:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+        _store_lock_depth += 1
+        try:
+            yield
+        finally:
+            _store_lock_depth -= 1
+            if handle is not None:
+                if fcntl is not None:
+                    fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+                handle.close()
+
+def _atomic_write_bytes(path, payload):
+    """כתיבה לקובץ זמני והחלפה אטומית, כך שקורא לעולם לא יראה קובץ חלקי"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def _write_parquet(path, frame):
+    tmp_path = f"{path}.tmp"
+    frame.reset_index(drop=True).to_parquet(tmp_path, index=False)
+    with open(tmp_path, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def _hashes_file(data_file):
+    return data_file[:-len(".parquet")] + ".hashes.npy"
+
+def _write_hashes(root, data_file, hashes):
+    path = os.path.join(root, _hashes_file(data_file))
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, hashes)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def _read_hashes(root, data_file, columns):
+    """קריאת אינדקס הגיבובים של קובץ נתונים; נבנה מחדש אם חסר (אחסון ישן)"""
+    path = os.path.join(root, _hashes_file(data_file))
+    if os.path.exists(path):
+        return np.load(path)
+    frame_path = os.path.join(root, data_file)
+    if not os.path.exists(frame_path):
+        return np.empty(0, dtype=np.uint64)
+    hashes = np.unique(row_hashes(pd.read_parquet(frame_path), columns))
+    _write_hashes(root, data_file, hashes)
+    return hashes
+
+def _write_data_file(root, data_file, frame, columns, hashes=None):
+    """כתיבת קובץ נתונים ואינדקס הגיבובים שלו (לפני ה-commit)"""
+    _write_parquet(os.path.join(root, data_file), frame)
+    if hashes is None:
+        hashes = np.unique(row_hashes(frame, columns))
+    _write_hashes(root, data_file, hashes)
+
+def partition_file(manifest, partition):
+    """שם קובץ המחיצה הפעיל של חודש (אחסון ישן: YYYY-MM.parquet)"""
+    return manifest.get("files", {}).get(partition, f"{partition}.parquet")
+
+def row_hashes(df, columns):
+    """
+    גיבוב 64 ביט לכל שורה, לפי העמודות הנתונות בלבד.
+    הערכים מנורמלים לפני הגיבוב כך ששורה מ-CSV ושורה מ-Parquet מקבלות אותו גיבוב.
+    """
+    canonical = {}
+    for column in columns:
+        if column in df.columns:
+            values = df[column]
+        else:
+            values = pd.Series(np.nan, index=df.index)
+        if column == "date":
+            canonical[column] = pd.to_datetime(values, errors="coerce")
+        elif column in NUMERIC_COLUMNS:
+            canonical[column] = pd.to_numeric(values, errors="coerce").astype("float64")
+        else:
+            canonical[column] = values.astype("string").fillna(OPTIONAL_COLUMNS.get(column, ""))
+    canonical = pd.DataFrame(canonical, index=df.index)
+    return pd.util.hash_pandas_object(canonical, index=False).to_numpy()
+
+def read_manifest(root=LEDGER_DIR):
+    """קריאת קובץ המניפסט. מחזיר None אם האחסון עדיין לא נוצר"""
+    path = os.path.join(root, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def store_fingerprint(root=LEDGER_DIR):
+    """
+    טביעת אצבע זולה של גרסת האחסון: stat של המניפסט בלבד, ללא קריאת קבצים.
+    כל commit מחליף את המניפסט בקובץ חדש (os.replace), כך שכל שינוי - גם מתהליך אחר - משנה אותה.
+    מחזיר None אם האחסון עדיין לא נוצר.
+    """
+    try:
+        stat = os.stat(os.path.join(root, MANIFEST_FILE))
+    except FileNotFoundError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+def write_manifest(manifest, root=LEDGER_DIR):
+    """שמירת המניפסט בכתיבה אטומית - זוהי נקודת ה-commit של כל שינוי"""
+    payload = json.dumps(manifest, indent=2, sort_keys=True).encode("utf-8")
+    _atomic_write_bytes(os.path.join(root, MANIFEST_FILE), payload)
+
+def ledger_version(manifest):
+    """מזהה גרסה ייחודי לתוכן האחסון - משתנה בכל כתיבה, וגם כשהאחסון נוצר מחדש"""
+    return f"{manifest.get('store_id', '')}-{manifest['version']}"
+
+def month_keys(dates):
+    """מפתח מחיצה (YYYY-MM) לכל תאריך; תאריך חסר מקבל את מחיצת undated"""
+    dates = pd.to_datetime(dates, errors="coerce")
+    keys = dates.dt.strftime("%Y-%m")
+    return keys.fillna(UNDATED_PARTITION)
+
+def _referenced_files(manifest):
+    files = set()
+    for partition in manifest["partitions"]:
+        data_file = partition_file(manifest, partition)
+        files.update({data_file, _hashes_file(data_file)})
+    for segment in manifest.get("wal", []):
+        files.update({segment["file"], _hashes_file(segment["file"])})
+    return files
+
+def _remove_unreferenced(root, manifest):
+    """מחיקת קבצי נתונים שאינם מופיעים במניפסט (גרסאות קודמות וכתיבות שנקטעו)"""
+    referenced = _referenced_files(manifest)
+    for directory in (root, os.path.join(root, WAL_DIR)):
+        if not os.path.isdir(directory):
+            continue
+        for name in os.listdir(directory):
+            if not name.endswith((".parquet", ".hashes.npy", ".tmp")):
+                continue
+            relative = os.path.relpath(os.path.join(directory, name), root).replace(os.sep, "/")
+            if relative not in referenced:
+                os.remove(os.path.join(directory, name))
+
+def write_ledger(df, root=LEDGER_DIR):
+    """
+    כתיבה מלאה של ספר התנועות למחיצות חודשיות.
+    :param df: DataFrame עם עמודת 'date'
+    :param root: תיקיית האחסון
+    :return: המניפסט החדש
+    """
+    with store_lock(root):
+        os.makedirs(root, exist_ok=True)
+        df = df.copy()
+        df["date"] = pd.to_datetime(df["date"], errors="coerce")
+        keys = month_keys(df["date"])
+
+        previous = read_manifest(root) or {}
+        version = int(previous.get("version", 0)) + 1
+        partitions = {}
+        files = {}
+        for partition, frame in df.groupby(keys, sort=True):
+            files[partition] = f"{partition}.v{version}.parquet"
+            _write_data_file(root, files[partition], frame, list(df.columns))
+            partitions[partition] = int(len(frame))
+
+        manifest = {
+            "store_id": previous.get("store_id") or uuid.uuid4().hex,
+            "version": version,
+            "base_version": version,
+            "columns": list(df.columns),
+            "partitions": partitions,
+            "files": files,
+            "wal": [],
+            "wal_seq": int(previous.get("wal_seq", 0)),
+        }
+        write_manifest(manifest, root)
+
+        # מחיקת מחיצות שכבר אינן חלק מהנתונים (רק אחרי ה-commit)
+        _remove_unreferenced(root, manifest)
+        return manifest
+
+def import_csv(csv_path=SOURCE_CSV, root=LEDGER_DIR):
+    """ייבוא חד-פעמי של קובץ CSV קיים לאחסון העמודתי"""
+    return write_ledger(pd.read_csv(csv_path), root)
+
+def ensure_store(root=LEDGER_DIR, csv_path=SOURCE_CSV):
+    """יצירת האחסון מקובץ ה-CSV בפעם הראשונה בלבד"""
+    with store_lock(root):
+        manifest = read_manifest(root)
+        if manifest is None:
+            manifest = import_csv(csv_path, root)
+        return manifest
+
+def _partitions_in_range(partitions, start=None, end=None):
+    """בחירת המחיצות החופפות לטווח התאריכים - שאר המחיצות אינן נקראות כלל"""
+    if start is None and end is None:
+        return sorted(partitions)
+    first = pd.Timestamp(start).strftime("%Y-%m") if start is not None else None
+    last = pd.Timestamp(end).strftime("%Y-%m") if end is not None else None
+    selected = []
+    for partition in sorted(partitions):
+        if partition == UNDATED_PARTITION:
+            continue
+        if first is not None and partition < first:
+            continue
+        if last is not None and partition > last:
+            continue
+        selected.append(partition)
+    return selected
+
+def read_ledger(root=LEDGER_DIR, start=None, end=None):
+    """
+    קריאת ספר התנועות מהאחסון (מחיצות ומקטעי יומן שטרם אוחדו).
+    :param root: תיקיית האחסון
+    :param start: תאריך התחלה (כולל, אופציונלי)
+    :param end: תאריך סיום (כולל, אופציונלי)
+    :return: DataFrame עם כל התנועות בטווח
+    """
+    return read_snapshot(root, start, end)[1]
+
+def read_snapshot(root=LEDGER_DIR, start=None, end=None):
+    """
+    קריאת ספר התנועות יחד עם המניפסט שממנו נקרא - הגרסה שבמניפסט היא בדיוק הגרסה של הנתונים,
+    גם כשהוספה מתבצעת במקביל (קריאה נפרדת של המניפסט עלולה להקדים או לאחר את הנתונים).
+    :return: tuple (מניפסט, DataFrame עם כל התנועות בטווח)
+    """
+    def read(manifest):
+        if manifest is None:
+            raise FileNotFoundError(f"לא נמצא אחסון נתונים בתיקייה {root}")
+        files = [partition_file(manifest, p) for p in _partitions_in_range(manifest["partitions"], start, end)]
+        files += [segment["file"] for segment in manifest.get("wal", [])
+                  if _partitions_in_range(segment["months"], start, end)]
+        frames = [pd.read_parquet(os.path.join(root, f)) for f in files]
+        if not frames:
+            return manifest, pd.DataFrame(columns=manifest.get("columns", []))
+
+        df = pd.concat(frames, ignore_index=True)
+        if start is not None:
+            df = df[df["date"] >= pd.Timestamp(start)]
+        if end is not None:
+            df = df[df["date"] <= pd.Timestamp(end)]
+        return manifest, df.reset_index(drop=True)
+
+    return _read_current(root, read)
+
+def _read_current(root, read):
+    """
+    הרצת read(manifest) על המניפסט הנוכחי, ללא נעילה.
+    איחוד וכתיבה מלאה מוחקים את הקבצים הקודמים מיד אחרי ה-commit, כך שקורא שהמניפסט שלו
+    התיישן בינתיים מקבל FileNotFoundError - הוא חוזר על הקריאה מהמניפסט החדש. קובץ שחסר
+    כשהמניפסט לא השתנה הוא שגיאה אמיתית ומועבר הלאה.
+    """
+    for attempt in range(READ_ATTEMPTS):
+        manifest = read_manifest(root)
+        try:
+            return read(manifest)
+        except FileNotFoundError:
+            if attempt == READ_ATTEMPTS - 1 or read_manifest(root) == manifest:
+                raise
+
+def _align_columns(df, columns):
+    """התאמת שורות חדשות לעמודות ספר התנועות (עמודות חסרות מתווספות כריקות)"""
+    df = df.reindex(columns=columns)
+    df["date"] = pd.to_datetime(df["date"], errors="coerce")
+    return df
+
+def _new_optional_columns(df, columns):
+    """עמודות אופציונליות שמופיעות בשורות שהועלו ועדיין אינן באחסון"""
+    return [column for column in OPTIONAL_COLUMNS if column in df.columns and column not in columns]
+
+def _stored_hashes(root, data_file, columns, hash_columns):
+    """
+    גיבובי השורות של קובץ נתונים לפי hash_columns. כשהקובץ שהועלה מוסיף עמודות אופציונליות,
+    האינדקס השמור (לפי עמודות האחסון) אינו בר השוואה, והקובץ מגובב מחדש כשהשורות הקיימות
+    מקבלות את ערך ברירת המחדל של העמודות החדשות - פעם אחת, בהעלאה שמוסיפה את העמודה.
+    """
+    if hash_columns == columns:
+        return _read_hashes(root, data_file, columns)
+    return np.unique(row_hashes(pd.read_parquet(os.path.join(root, data_file)), hash_columns))
+
+def _contains(sorted_hashes, candidates):
+    """בדיקת שייכות בחיפוש בינארי במערך גיבובים ממוין"""
+    if len(sorted_hashes) == 0:
+        return np.zeros(len(candidates), dtype=bool)
+    positions = np.searchsorted(sorted_hashes, candidates).clip(max=len(sorted_hashes) - 1)
+    return sorted_hashes[positions] == candidates
+
+def find_new_rows(df, root=LEDGER_DIR):
+    """
+    זיהוי השורות שעדיין אינן בספר התנועות.
+    רק השורות החדשות מגובבות, ונבדקות מול אינדקס הגיבובים של החודשים שהן נוגעות בהם
+    ושל מקטעי היומן שטרם אוחדו, כך שעלות הבדיקה תלויה בגודל הקובץ שהועלה ולא בגודל ספר התנועות.
+    :param df: DataFrame עם השורות שהועלו
+    :param root: תיקיית האחסון
+    :return: DataFrame עם השורות הייחודיות שאינן קיימות; האינדקס הוא מיקום השורה ב-df.
+             עמודות אופציונליות שעדיין אינן באחסון נשמרות וחלק מהגיבוב (בשורות הקיימות - ערך ברירת המחדל)
+    """
+    manifest = read_manifest(root)
+    columns = manifest["columns"]
+    hash_columns = columns + _new_optional_columns(df, columns)
+    df = _align_columns(df, hash_columns).reset_index(drop=True)
+
+    hashes = row_hashes(df, hash_columns)
+    keep = ~pd.Series(hashes).duplicated().to_numpy()  # כפילויות בתוך הקובץ עצמו
+    for segment in manifest.get("wal", []):
+        keep &= ~_contains(_stored_hashes(root, segment["file"], columns, hash_columns), hashes)
+
+    keys = month_keys(df["date"]).to_numpy()
+    for partition in np.unique(keys[keep]):
+        if partition not in manifest["partitions"]:
+            continue
+        existing = _stored_hashes(root, partition_file(manifest, partition), columns, hash_columns)
+        in_partition = keep & (keys == partition)
+        present = _contains(existing, hashes[in_partition])
+        keep[np.flatnonzero(in_partition)[present]] = False
+    return df[keep]
+
+def append_rows(df, root=LEDGER_DIR):
+    """
+    הוספת שורות חדשות לספר התנועות, ללא כפילויות.
+    השורות נכתבות כמקטע יומן חדש בלבד (append-only); המחיצות עצמן נכתבות מחדש רק באיחוד התקופתי.
+    :param df: DataFrame עם השורות להוספה
+    :param root: תיקיית האחסון
+    :return: DataFrame עם השורות שנוספו בפועל (האינדקס הוא מיקום השורה ב-df)
+    """
+    with store_lock(root):
+        added = find_new_rows(df, root)
+        if added.empty:
+            return added
+
+        manifest = read_manifest(root)
+        extra = _new_optional_columns(added, manifest["columns"])
+        if extra:
+            manifest = add_columns(extra, root)
+        sequence = int(manifest.get("wal_seq", 0)) + 1
+        segment_file = f"{WAL_DIR}/{sequence:06d}.parquet"
+        os.makedirs(os.path.join(root, WAL_DIR), exist_ok=True)
+        _write_data_file(root, segment_file, added, manifest["columns"])
+
+        months = month_keys(added["date"]).value_counts()
+        version = int(manifest.get("version", 0)) + 1
+        manifest["wal"] = manifest.get("wal", []) + [{
+            "file": segment_file,
+            "rows": int(len(added)),
+            "months": {month: int(count) for month, count in months.items()},
+            "version": version,
+        }]
+        manifest["wal_seq"] = sequence
+        manifest["version"] = version
+        write_manifest(manifest, root)
+
+        wal = manifest["wal"]
+        if len(wal) >= COMPACT_SEGMENTS or sum(segment["rows"] for segment in wal) >= COMPACT_ROWS:
+            compact(root)
+        return added
+
+def add_columns(columns, root=LEDGER_DIR):
+    """
+    הוספת עמודות לאחסון קיים: כתיבה מלאה חד-פעמית שבה השורות הקיימות מקבלות ערך ריק.
+    :param columns: שמות העמודות להוספה
+    :return: המניפסט החדש
+    """
+    with store_lock(root):
+        manifest = read_manifest(root)
+        columns = [column for column in columns if column not in manifest["columns"]]
+        if not columns:
+            return manifest
+        return write_ledger(read_ledger(root).reindex(columns=manifest["columns"] + columns), root)
+
+def compact(root=LEDGER_DIR):
+    """
+    איחוד מקטעי היומן לתוך המחיצות החודשיות.
+    רק החודשים שמופיעים ביומן נכתבים מחדש, לקבצים בשם חדש; המניפסט מוחלף אטומית
+    ורק אחריו נמחקים הקבצים הישנים - נפילה בכל שלב משאירה את האחסון עקבי.
+    :param root: תיקיית האחסון
+    :return: המניפסט החדש
+    """
+    with store_lock(root):
+        manifest = read_manifest(root)
+        wal = manifest.get("wal", [])
+        if not wal:
+            return manifest
+
+        columns = manifest["columns"]
+        version = int(manifest.get("version", 0)) + 1
+        partitions = dict(manifest["partitions"])
+        files = {p: partition_file(manifest, p) for p in partitions}
+        wal_rows = pd.concat([pd.read_parquet(os.path.join(root, s["file"])) for s in wal], ignore_index=True)
+        for partition, frame in wal_rows.groupby(month_keys(wal_rows["date"]), sort=True):
+            hashes = row_hashes(frame, columns)
+            if partition in partitions:
+                existing = pd.read_parquet(os.path.join(root, files[partition]))
+                hashes = np.union1d(_read_hashes(root, files[partition], columns), hashes)
+                frame = pd.concat([existing, frame], ignore_index=True)
+            else:
+                hashes = np.unique(hashes)
+            files[partition] = f"{partition}.v{version}.parquet"
+            _write_data_file(root, files[partition], frame, columns, hashes)
+            partitions[partition] = int(len(frame))
+
+        manifest.update({"version": version, "base_version": version, "partitions": partitions, "files": files, "wal": []})
+        write_manifest(manifest, root)
+        _remove_unreferenced(root, manifest)
+        return manifest
+
+def read_appended(root=LEDGER_DIR, since=0, until=None):
+    """
+    קריאת השורות שנוספו (append) בין שתי גרסאות, לעדכון מצטבר של נתונים נגזרים.
+    אפשרי רק כשמאז הגרסה since היו הוספות בלבד - לאחר כתיבה מלאה או איחוד היומן
+    השורות כבר אינן נפרדות, ומוחזר None (יש לחשב מחדש מכל ספר התנועות).
+    :param since: הגרסה שהנתונים הנגזרים מעודכנים אליה
+    :param until: הגרסה האחרונה לכלול (ברירת מחדל: הגרסה הנוכחית)
+    :return: DataFrame עם השורות שנוספו, או None
+    """
+    def read(manifest):
+        if manifest is None or int(manifest.get("base_version", manifest["version"])) > since:
+            return None
+        last = manifest["version"] if until is None else until
+        files = [segment["file"] for segment in manifest.get("wal", [])
+                 if "version" in segment and since < segment["version"] <= last]
+        if not files:
+            return pd.DataFrame(columns=manifest["columns"])
+        return pd.concat([pd.read_parquet(os.path.join(root, f)) for f in files], ignore_index=True)
+
+    return _read_current(root, read)
+
+def row_count(manifest):
+    """מספר השורות הכולל באחסון, כולל מקטעי יומן שטרם אוחדו"""
+    return sum(manifest["partitions"].values()) + sum(s["rows"] for s in manifest.get("wal", []))
@@ -0,0 +1,117 @@
+"""
+data/rollups.py - סיכומים מצטברים של ספר התנועות (יומי / חודשי × חשבון × מטבע × קטגוריה × סוג)
+
+כל שורת סיכום מחזיקה את התנועה נטו (amount), סכום התקבולים (inflows), סכום התשלומים
+(outflows) ומספר התנועות לתקופה, חשבון, מטבע, קטגוריה וסוג. הסכומים נשמרים במטבע
+המקורי של התנועות; המרה למטבע תצוגה היא הכפלה של כל שורה בשער של (יום, מטבע) - ראו
+data/currency.py - וסיכום חודשי במטבע התצוגה נבנה מהסיכום היומי שהומר (rollup_period). הגרפים, הדוח והתחזית קוראים מהסיכומים
+במקום לסרוק את התנועות: הסכומים אדיטיביים, ולכן כל אגרגציה גסה יותר (לפי יום, חודש
+סוג או חשבון) היא groupby קטן על הסיכום.
+
+הסיכום היומי נושא את אותו מבנה כמו ספר התנועות (עמודות date/amount/account/category/type
+ו-DatetimeIndex ממוין), כך שניתן לסנן אותו ב-filter_data ולהעביר אותו ל-daily_statement
+ול-forecast_cashflow כפי שהם.
+"""
+import pandas as pd
+from data.schema import DEFAULT_ACCOUNT
+
+ROLLUP_KEYS = ["date", "account", "currency", "category", "type"]
+ROLLUP_VALUES = ["amount", "inflows", "outflows", "count"]
+AMOUNT_COLUMNS = ("amount", "inflows", "outflows")
+
+def _day(dates):
+    return dates.dt.normalize()
+
+def _month(dates):
+    return dates.dt.to_period("M").dt.to_timestamp()
+
+PERIODS = {"daily": _day, "monthly": _month}
+
+def _finish(rollup):
+    """החזרת המבנה הקנוני: קטגוריות, מיון יציב לפי תאריך ו-DatetimeIndex"""
+    for column in ("account", "currency", "category", "type"):
+        rollup[column] = rollup[column].astype("category")
+    rollup = rollup.sort_values("date", kind="mergesort")
+    rollup.index = pd.DatetimeIndex(rollup["date"].to_numpy(), name=None)
+    return rollup[ROLLUP_KEYS + ROLLUP_VALUES]
+
+def _regroup(parts):
+    grouped = parts.groupby(ROLLUP_KEYS, observed=True, dropna=False, sort=True)[ROLLUP_VALUES].sum()
+    return grouped.reset_index()
+
+def _aggregate(transactions, period):
+    """סיכום תנועות לתקופה הנתונה"""
+    amount = transactions["amount"].astype("float64")
+    accounts = transactions["account"].array if "account" in transactions.columns else DEFAULT_ACCOUNT
+    currencies = transactions["currency"].array if "currency" in transactions.columns else None
+    parts = pd.DataFrame({
+        "date": period(transactions["date"]).to_numpy(),
+        "account": accounts,
+        "currency": currencies,
+        "category": transactions["category"].array,
+        "type": transactions["type"].array,
+        "amount": amount.to_numpy(),
+        "inflows": amount.clip(lower=0).to_numpy(),
+        "outflows": (-amount).clip(lower=0).to_numpy(),
+        "count": 1,
+    })
+    return _regroup(parts)
+
+def build_rollups(ledger):
+    """
+    בניית הסיכומים מספר התנועות המלא (פעם אחת לכל גרסה).
+    :param ledger: ספר התנועות בסכמה הקנונית
+    :return: dict עם סיכום 'daily' וסיכום 'monthly'
+    """
+    return {name: _finish(_aggregate(ledger, period)) for name, period in PERIODS.items()}
+
+def rollup_period(rollup, period):
+    """
+    קיבוץ סיכום לתקופה גסה יותר (למשל סיכום יומי שהומר למטבע התצוגה -> חודשי).
+    :param period: שם תקופה מתוך PERIODS
+    """
+    parts = rollup[ROLLUP_KEYS + ROLLUP_VALUES].reset_index(drop=True)
+    parts["date"] = PERIODS[period](parts["date"]).to_numpy()
+    return _finish(_regroup(parts))
+
+def _concat(first, second):
+    """שרשור שתי מסגרות; מסגרת ריקה (למשל יום חדש לגמרי) מושמטת כדי לא לשבש את סוגי העמודות"""
+    frames = [frame.reset_index(drop=True) for frame in (first, second) if not frame.empty]
+    return pd.concat(frames, ignore_index=True) if frames else second.reset_index(drop=True)
+
+def update_rollups(rollups, new_rows):
+    """
+    עדכון מצטבר של הסיכומים בשורות שנוספו, ללא סריקת ספר התנועות.
+    רק התקופות שהשורות החדשות נוגעות בהן מקובצות מחדש.
+    :param rollups: הסיכומים הקיימים (build_rollups)
+    :param new_rows: השורות שנוספו, בסכמה הקנונית
+    :return: dict חדש עם הסיכומים המעודכנים
+    """
+    if new_rows.empty:
+        return rollups
+    updated = {}
+    for name, period in PERIODS.items():
+        rollup = rollups[name]
+        delta = _aggregate(new_rows, period)
+        touched = rollup["date"].isin(delta["date"].unique()).to_numpy()
+        merged = _regroup(_concat(rollup[touched], delta))
+        updated[name] = _finish(_concat(rollup[~touched], merged))
+    return updated
+
+def scale_rollup(rollup, factor):
+    """המרת הסכומים בסיכום בשער קבוע (למשל המרת מטבע)"""
+    if factor == 1:
+        return rollup
+    scaled = rollup.copy()
+    for column in AMOUNT_COLUMNS:
+        scaled[column] = scaled[column] * factor
+    return scaled
+
+def totals_by(rollup, key):
+    """
+    סכומי תקבולים ותשלומים לפי מפתח, מתוך סיכום מסונן.
+    :param key: 'month' או שם עמודה (למשל 'type')
+    :return: DataFrame עם עמודות inflows ו-outflows
+    """
+    group = rollup["date"].dt.to_period("M") if key == "month" else rollup[key]
+    return rollup.groupby(group, observed=True)[["inflows", "outflows"]].sum()
@@ -0,0 +1,73 @@
+"""
+data/schema.py - הסכמה הקנונית של ספר התנועות בזיכרון
+
+הסכמה מוחלת פעם אחת בזמן הטעינה, וכל העמודים עובדים מולה ללא המרות חוזרות:
+- date: datetime64[ns]
+- amount: float64 (דיוק של אגורות גם ביתרות מצטברות גדולות)
+- category, type, description, component: category (מילון ערכים + קודים קומפקטיים)
+- inventory_level: Float32 (מספר עשרוני nullable)
+- account: category; שורות ללא חשבון שייכות לחשבון ברירת המחדל (DEFAULT_ACCOUNT)
+- currency: category (קוד מטבע, למשל 'EUR'); שורה ללא מטבע רשומה במטבע הבסיס של ספר התנועות
+
+בנוסף, ספר התנועות ממוין לפי תאריך ומאונדקס ב-DatetimeIndex (ללא שם) זהה לעמודת date,
+כך שסינון לפי טווח תאריכים הוא חיפוש בינארי וחיתוך (ראו filter_data_by_date_range).
+"""
+import logging
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+LEDGER_COLUMNS = ["date", "amount", "category", "type", "description", "component", "inventory_level", "account",
+                  "currency"]
+CATEGORICAL_COLUMNS = ("category", "type", "description", "component", "account", "currency")
+DEFAULT_ACCOUNT = "Main"
+
+def apply_ledger_schema(df):
+    """
+    החלת הסכמה הקנונית על ספר התנועות.
+    עמודות חסרות מתווספות כריקות; עמודות נוספות נשמרות כפי שהן.
+    :param df: DataFrame גולמי (מ-CSV או Parquet)
+    :return: DataFrame חדש בסכמה הקנונית
+    """
+    typed = {}
+    for column in LEDGER_COLUMNS:
+        values = df[column] if column in df.columns else pd.Series(np.nan, index=df.index)
+        if column == "date":
+            typed[column] = pd.to_datetime(values, errors="coerce").astype("datetime64[ns]")
+        elif column == "amount":
+            typed[column] = pd.to_numeric(values, errors="coerce").astype("float64")
+        elif column == "inventory_level":
+            typed[column] = pd.to_numeric(values, errors="coerce").astype("Float32")
+        elif column == "account":
+            accounts = values.astype("category")
+            if accounts.isna().any():
+                if DEFAULT_ACCOUNT not in accounts.cat.categories:
+                    accounts = accounts.cat.add_categories([DEFAULT_ACCOUNT])
+                accounts = accounts.fillna(DEFAULT_ACCOUNT)
+            typed[column] = accounts
+        elif isinstance(values.dtype, pd.CategoricalDtype):
+            typed[column] = values.cat.remove_unused_categories()
+        else:
+            typed[column] = values.astype("category")
+    for column in df.columns:
+        if column not in typed:
+            typed[column] = df[column]
+    return index_by_date(pd.DataFrame(typed, index=df.index))
+
+def index_by_date(df):
+    """
+    מיון יציב לפי תאריך והגדרת DatetimeIndex ממוין.
+    שורות ללא תאריך תקין נשארות באחסון אך אינן נכללות בספר התנועות שבזיכרון.
+    """
+    undated = df["date"].isna()
+    if undated.any():
+        logger.warning(f"{int(undated.sum())} שורות ללא תאריך תקין הושמטו מספר התנועות")
+        df = df[~undated]
+    df = df.sort_values("date", kind="mergesort")
+    df.index = pd.DatetimeIndex(df["date"].to_numpy(), name=None)
+    return df
+
+def category_options(data, column):
+    """ערכי הסינון הזמינים לעמודה (ללא ערכים חסרים), ממוינים לפי סדר ההופעה"""
+    return data[column].dropna().unique().tolist()
@@ -0,0 +1,271 @@
+"""
+data/statement.py - מנוע דוח תזרים המזומנים היומי (ללא תלות ב-UI)
+
+הדוח מחושב בפעולות וקטוריות בלבד: סכום יומי ב-groupby, יתרות בסכום מצטבר
+ותקבולים/תשלומים בחיתוך (clip) של התנועה היומית נטו. העיצוב לתצוגה נפרד
+(format_statement) ומוחל רק על השורות שמוצגות בפועל: הטבלה מוצגת בעמודים, והשרת
+ממיין, חותך ומעצב רק את העמוד המבוקש (sort_statement, page_for_date, statement_page).
+
+יתרות מחושבות לכל חשבון במעבר מקובץ אחד (account_balances); התצוגה המאוחדת והתצוגה של
+חשבון בודד נגזרות מאותה תוצאה (statement_from_balances), כך ששתיהן עקביות זו עם זו.
+היתרות מחושבות על כל ההיסטוריה, וטווח התאריכים נחתך מהדוח בסוף (statement_window) -
+יתרת הפתיחה של הטווח היא היתרה בפועל באותו יום, ולא יתרת הפתיחה של החשבון.
+
+הערות הדוח והתחזית נשמרות במטמון LRU לפי מזהה (גרסת נתונים, מפרט סינון), כך שריצה
+חוזרת של הדף לא מקבצת ולא ממיינת שוב את התנועות.
+"""
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from data.schema import DEFAULT_ACCOUNT
+
+INITIAL_BALANCE = 100000.0
+NOTES_LIMIT = 3
+
+NOTES_CACHE_SIZE = 16
+_notes_cache = OrderedDict()
+_notes_cache_lock = threading.Lock()
+
+STATEMENT_COLUMNS = ["date", "amount", "cash_inflows", "cash_outflows", "opening_balance", "closing_balance", "notes"]
+
+def top_distinct(keys, values, limit=NOTES_LIMIT):
+    """
+    עד limit ערכים שונים לכל מפתח, לפי סדר ההופעה בקלט, מחוברים ב-', ' (עם '...' כשיש יותר).
+    ללא פונקציה לכל קבוצה: הסרת כפילויות (מפתח, ערך), דירוג ב-cumcount וחיתוך לפי הדירוג,
+    ואז חיבור limit העמודות כפעולות וקטוריות על טקסט.
+    :param keys: מערך מפתחות הקבוצה (למשל יום)
+    :param values: מערך ערכים באותו אורך (ערכים חסרים מושמטים)
+    :return: Series של טקסט לפי מפתח (ממוין לפי מפתח)
+    """
+    if not isinstance(values, pd.Categorical):
+        values = np.asarray(values, dtype=object)
+    # הסרת כפילויות על קודים שלמים: המופע הראשון של כל זוג (מפתח, ערך), בסדר ההופעה
+    key_codes, key_values = pd.factorize(np.asarray(keys))
+    value_codes, value_values = pd.factorize(values)
+    present = np.flatnonzero((key_codes >= 0) & (value_codes >= 0))
+    if len(present) == 0:
+        return pd.Series(dtype="string")
+    pair_codes = key_codes[present].astype(np.int64) * len(value_values) + value_codes[present]
+    first = present[~pd.Series(pair_codes).duplicated().to_numpy()]
+
+    pairs = pd.DataFrame({"key": key_codes[first], "value": value_codes[first]})
+    rank = pairs.groupby("key", sort=False).cumcount().to_numpy()
+    counts = np.bincount(pairs["key"].to_numpy(), minlength=len(key_values))
+
+    shown = pairs[rank < limit]
+    labels = pd.Series(value_values, dtype=object).astype(str).to_numpy()
+    wide = np.full((len(key_values), limit), None, dtype=object)
+    wide[shown["key"].to_numpy(), rank[rank < limit]] = labels[shown["value"].to_numpy()]
+    wide = pd.DataFrame(wide).astype("string")
+    text = wide[0]
+    for column in wide.columns[1:]:
+        text = text.where(wide[column].isna(), text + ", " + wide[column])
+    text = text.where(counts <= limit, text + "...")
+    text.index = pd.Index(key_values)
+    return text[text.notna()].sort_index()
+
+def _cached_notes(cache_key, compute):
+    if cache_key[1] is None:
+        return compute()
+    with _notes_cache_lock:
+        if cache_key in _notes_cache:
+            _notes_cache.move_to_end(cache_key)
+            return _notes_cache[cache_key]
+    result = compute()
+    with _notes_cache_lock:
+        _notes_cache[cache_key] = result
+        while len(_notes_cache) > NOTES_CACHE_SIZE:
+            _notes_cache.popitem(last=False)
+    return result
+
+def daily_notes(transactions, limit=NOTES_LIMIT, key=None):
+    """
+    הערות הדוח: עד limit תיאורים שונים לכל יום (לפי סדר ההופעה), עם '...' כשיש יותר.
+    :param transactions: DataFrame עם עמודות 'date' ו-'description'
+    :param key: מזהה של transactions (גרסת נתונים ומפרט סינון, אופציונלי); עם מזהה התוצאה נשמרת במטמון
+    :return: Series של טקסט לפי יום (משותף כשנשמר במטמון - אין לשנות אותו)
+    """
+    return _cached_notes(("daily", key, limit), lambda: top_distinct(
+        transactions["date"].dt.normalize().to_numpy(), transactions["description"].array, limit))
+
+def seasonal_notes(transactions, dates, limit=NOTES_LIMIT, key=None):
+    """
+    הערות לתקופות תחזית: התיאורים הגדולים ביותר (בערך מוחלט) שהופיעו באותו חודש בשנה בהיסטוריה.
+    ההערות של 12 החודשים נבנות יחד, כך שעם מזהה ההיסטוריה ממוינת פעם אחת לכל גרסה וסינון.
+    :param transactions: DataFrame עם עמודות 'date', 'amount' ו-'description'
+    :param dates: תאריכי התחזית
+    :param key: מזהה של transactions (גרסת נתונים ומפרט סינון, אופציונלי); עם מזהה התוצאה נשמרת במטמון
+    :return: מערך טקסט באורך dates ('' לחודש ללא היסטוריה)
+    """
+    def by_month():
+        if transactions.empty:
+            return pd.Series(dtype="string")
+        order = np.argsort(-transactions["amount"].abs().to_numpy(), kind="stable")
+        ranked = transactions.iloc[order]
+        return top_distinct(ranked["date"].dt.month.to_numpy(), ranked["description"].array, limit)
+    
+    notes = _cached_notes(("seasonal", key, limit), by_month)
+    months = pd.DatetimeIndex(dates).month
+    return notes.reindex(months).fillna("").to_numpy(dtype=object)
+
+def account_balances(transactions, opening_balances=None):
+    """
+    יתרות יומיות לכל חשבון: סכום לכל (חשבון, יום) ו-cumsum מקובץ לפי חשבון, במעבר אחד.
+    :param transactions: תנועות או סיכום יומי, עם עמודות 'date' ו-'amount' ואופציונלית 'account'
+                         (ללא עמודת חשבון - כל התנועות שייכות ל-DEFAULT_ACCOUNT)
+    :param opening_balances: dict {חשבון: יתרת פתיחה}; חשבון שאינו מופיע מתחיל מ-0
+    :return: DataFrame בעמודות account, date, amount, closing_balance - ממוין לפי חשבון ויום
+    """
+    days = transactions["date"].dt.normalize().to_numpy()
+    if "account" in transactions.columns:
+        accounts = transactions["account"].array
+    else:
+        accounts = np.full(len(transactions), DEFAULT_ACCOUNT, dtype=object)
+    amounts = pd.Series(transactions["amount"].astype("float64").to_numpy())
+    daily = amounts.groupby([accounts, days], observed=True, sort=True).sum()
+
+    balances = pd.DataFrame({
+        "account": daily.index.get_level_values(0).astype(str),
+        "date": daily.index.get_level_values(1),
+        "amount": daily.to_numpy(),
+    })
+    opening = balances["account"].map(opening_balances or {}).fillna(0.0).astype("float64")
+    balances["closing_balance"] = opening + balances.groupby("account", sort=False)["amount"].cumsum()
+    return balances
+
+def _statement_frame(days, amounts, closing, notes):
+    statement = pd.DataFrame({"date": pd.DatetimeIndex(days), "amount": np.asarray(amounts, dtype="float64")})
+    statement["cash_inflows"] = statement["amount"].clip(lower=0)
+    statement["cash_outflows"] = (-statement["amount"]).clip(lower=0)
+    statement["closing_balance"] = np.asarray(closing, dtype="float64")
+    statement["opening_balance"] = statement["closing_balance"] - statement["amount"]
+    if notes is not None:
+        statement["notes"] = notes.reindex(statement["date"]).fillna("").to_numpy()
+    else:
+        statement["notes"] = ""
+    statement["notes"] = statement["notes"].astype("string")
+    return statement[STATEMENT_COLUMNS]
+
+def statement_from_balances(balances, account=None, notes=None):
+    """
+    דוח יומי מתוך יתרות החשבונות (account_balances).
+    :param account: חשבון בודד, או None לתצוגה מאוחדת של כל החשבונות
+    :param notes: הערות לפי יום (daily_notes, אופציונלי)
+    :return: DataFrame ממוין לפי יום בעמודות STATEMENT_COLUMNS
+    """
+    if account is not None:
+        rows = balances[balances["account"] == str(account)]
+        return _statement_frame(rows["date"], rows["amount"], rows["closing_balance"], notes)
+
+    # היתרה המאוחדת היא סכום יתרות הפתיחה של החשבונות ועוד הסכום המצטבר של כולם
+    first = balances.groupby("account", sort=False).head(1)
+    opening = float((first["closing_balance"] - first["amount"]).sum())
+    daily = balances.groupby("date", sort=True)["amount"].sum()
+    return _statement_frame(daily.index, daily.to_numpy(), opening + daily.cumsum().to_numpy(), notes)
+
+def daily_statement(transactions, opening_balance=INITIAL_BALANCE, notes=None, account=None):
+    """
+    חישוב דוח תזרים יומי מתנועות (או מהסיכום היומי, ראו data/rollups.py).
+    :param transactions: DataFrame עם עמודות 'date' (datetime64) ו-'amount', ואופציונלית 'account' ו-'description'
+    :param opening_balance: יתרת הפתיחה לפני התנועה הראשונה - מספר (של DEFAULT_ACCOUNT)
+                            או dict {חשבון: יתרת פתיחה}
+    :param notes: הערות לפי יום (daily_notes); ברירת מחדל - מחושבות מעמודת 'description' אם קיימת
+    :param account: חשבון בודד, או None לתצוגה מאוחדת
+    :return: DataFrame ממוין לפי יום בעמודות STATEMENT_COLUMNS (סכומים כ-float64)
+    """
+    if not isinstance(opening_balance, dict):
+        opening_balance = {DEFAULT_ACCOUNT: opening_balance}
+    if notes is None and "description" in transactions.columns:
+        rows = transactions
+        if account is not None and "account" in transactions.columns:
+            rows = transactions[transactions["account"] == account]
+        notes = daily_notes(rows)
+    return statement_from_balances(account_balances(transactions, opening_balance), account, notes)
+
+def project_balances(amounts, opening_balance):
+    """
+    יתרות הסגירה של תזרים צפוי: יתרת הפתיחה ועוד סכום מצטבר לאורך התקופות.
+    מקבל גם מטריצה (תרחיש × תקופה) עם יתרת פתיחה לכל תרחיש - כל התרחישים בפעולה אחת.
+    :param amounts: מערך תנועה נטו לכל תקופה (או מטריצת תרחישים)
+    :param opening_balance: יתרת פתיחה (מספר, או מערך לכל תרחיש)
+    :return: מערך יתרות סגירה באותה צורה
+    """
+    amounts = np.asarray(amounts, dtype="float64")
+    opening = np.asarray(opening_balance, dtype="float64")
+    if amounts.ndim > 1 and opening.ndim == 1:
+        opening = opening[:, np.newaxis]
+    return opening + np.cumsum(amounts, axis=-1)
+
+def forecast_statement(forecast, opening_balance, notes=None):
+    """
+    הטלת תחזית על מבנה הדוח, באותו מסלול וקטורי של הדוח היומי.
+    :param forecast: DataFrame עם עמודות 'date' ו-'forecast' (services.forecast_cashflow)
+    :param opening_balance: היתרה בפועל שממנה התחזית מתחילה
+    :param notes: הערה לכל תקופה (מערך באורך התחזית, אופציונלי)
+    :return: DataFrame בעמודות STATEMENT_COLUMNS ועמודת 'forecast'
+    """
+    amounts = forecast["forecast"].to_numpy(dtype="float64")
+    if notes is not None:
+        notes = pd.Series(np.asarray(notes, dtype=object), index=pd.DatetimeIndex(forecast["date"]))
+    statement = _statement_frame(forecast["date"], amounts, project_balances(amounts, opening_balance), notes)
+    statement["forecast"] = amounts
+    return statement
+
+def statement_window(statement, start=None, end=None):
+    """
+    חיתוך הדוח לטווח תאריכים (כולל), בחיפוש בינארי על עמודת התאריך הממוינת.
+    היתרות נשארות כפי שחושבו על כל ההיסטוריה.
+    """
+    dates = statement["date"]
+    lo = dates.searchsorted(pd.Timestamp(start), side="left") if start is not None else 0
+    hi = dates.searchsorted(pd.Timestamp(end), side="right") if end is not None else len(statement)
+    return statement.iloc[lo:hi]
+
+def format_statement(rows, date_format="%d/%m/%Y", currency_symbol="$"):
+    """
+    עיצוב שורות דוח לתצוגה. מיועד לשורות המוצגות בלבד (למשל עמוד בטבלה), לא לכל הדוח.
+    :param rows: שורות מתוך daily_statement
+    :return: DataFrame עם עמודות טקסט מעוצבות
+    """
+    money = f"{currency_symbol}{{:,.2f}}".format
+    return pd.DataFrame({
+        "Date": rows["date"].dt.strftime(date_format),
+        "Opening Balance": rows["opening_balance"].map(money),
+        "Cash Inflows": rows["cash_inflows"].map(money),
+        "Cash Outflows": rows["cash_outflows"].map(money),
+        "Closing Balance": rows["closing_balance"].map(money),
+        "Notes": rows["notes"],
+    })
+
+def sort_statement(statement, column="date", ascending=True):
+    """
+    מיון הדוח לתצוגה. הדוח כבר ממוין לפי תאריך, כך שמיון לפי תאריך הוא היפוך בלבד.
+    :return: הדוח הממוין (ללא העתקה כשהסדר לא משתנה)
+    """
+    if column == "date":
+        return statement if ascending else statement.iloc[::-1]
+    order = np.argsort(statement[column].to_numpy(), kind="stable")
+    return statement.iloc[order if ascending else order[::-1]]
+
+def page_count(rows, page_size):
+    """מספר העמודים (לפחות אחד)"""
+    return max(1, -(-len(rows) // page_size))
+
+def page_for_date(statement, date, page_size, ascending=True):
+    """
+    העמוד (מ-0) שבו מופיע התאריך, או היום הקרוב הבא אחריו, בחיפוש בינארי על עמודת התאריך.
+    :param statement: הדוח ממוין לפי תאריך בסדר עולה (daily_statement)
+    :param ascending: סדר התצוגה לפי תאריך
+    """
+    if statement.empty:
+        return 0
+    position = min(int(statement["date"].searchsorted(pd.Timestamp(date))), len(statement) - 1)
+    if not ascending:
+        position = len(statement) - 1 - position
+    return position // page_size
+
+def statement_page(rows, page, page_size):
+    """חיתוך עמוד אחד מהדוח (מ-0)"""
+    start = page * page_size
+    return rows.iloc[start:start + page_size]
@@ -4,17 +4,41 @@ pages/cash_flow.py - עמוד ניתוח תזרים מזומנים
 import streamlit as st
 import pandas as pd
 import matplotlib.pyplot as plt
+import matplotlib.ticker as ticker
+import matplotlib.dates as mdates
 import numpy as np
 import logging
 import services
-from ui.components import convert_df_to_csv
+from ui.components import convert_df_to_csv, chart_tab_selector, display_chart
+from ui.chart_helpers import downsample, point_budget
 from ui.styles import get_button_css
+from data.schema import category_options
+from data.accounts import load_opening_balances, save_opening_balances
+from data.statement import (
+    INITIAL_BALANCE,
+    account_balances,
+    statement_from_balances,
+    statement_window,
+    daily_notes,
+    seasonal_notes,
+    forecast_statement,
+    format_statement,
+    sort_statement,
+    page_count,
+    page_for_date,
+    statement_page
+)
+from data.rollups import totals_by
+from data.currency import rate_table, rates_fingerprint, convert_frame, convert_rollups
 from data.data_loader import (
-    filter_data_by_date_range, 
-    filter_data_by_categories, 
-    filter_data_by_types,
+    filter_data,
+    ledger_rollups,
+    ledger_forecast_state,
     process_uploaded_csv,
-    save_data_to_source
+    append_data_to_source,
+    import_uploaded_csv_streaming,
+    import_uploaded_files,
+    DEFAULT_CHUNK_SIZE
 )
 
 logger = logging.getLogger(__name__)
@@ -42,20 +66,38 @@ def render_cash_flow_page(data):
     else:
         st.error("Could not fetch exchange rate. Please try again later.")
     
-    # Apply conversion to data
-    data_converted = data.copy()
-    if exchange_rate and base_currency != target_currency:
-        data_converted['amount'] = data_converted['amount'] * exchange_rate
-        currency_label = target_currency
-    else:
-        currency_label = base_currency
+    # המרה לפי המטבע והתאריך של כל תנועה; תנועות ללא מטבע רשומות במטבע הבסיס
+    currencies = sorted(set(category_options(data, 'currency')) | {base_currency})
+    start_date = data['date'].min() if not data.empty else pd.Timestamp('today')
+    rates = load_rate_table(tuple(currencies), target_currency, start_date.date(), pd.Timestamp('today').date())
+    missing_rates = [currency for currency in currencies if currency not in rates.columns]
+    if missing_rates:
+        st.warning(f"No exchange rate for {', '.join(missing_rates)}; these transactions are left out.")
+    currency_label = target_currency
+    
+    # גרסת הנתונים אחרי המרה - מפתח למטמון הסינון ולמטמון ההמרה
+    ledger_version = data.attrs.get('ledger_version')
+    data_version = (ledger_version, base_currency, target_currency, rates_fingerprint(rates)) if ledger_version else None
+    rollup_version = data_version + ('daily',) if data_version else None
+    data_converted = convert_frame(data, rates, base_currency, target_currency, key=ledger_version)
+    
+    # הסיכומים המצטברים (יומי/חודשי × חשבון × מטבע × קטגוריה × סוג) - הגרפים, הדוח והתחזית קוראים מהם
+    rollups = convert_rollups(ledger_rollups(data), rates, base_currency, target_currency, key=ledger_version)
+    daily_rollup = rollups['daily']
+    
+    # יתרות הפתיחה מוגדרות במטבע הבסיס ומומרות בשער של תחילת ספר התנועות;
+    # יתרות כל החשבונות מחושבות במעבר אחד על כל ההיסטוריה
+    opening_rate = rates[base_currency].iloc[0] if base_currency in rates.columns else 1.0
+    opening_balances = {account: balance * opening_rate for account, balance in load_opening_balances().items()}
+    balances = account_balances(daily_rollup, opening_balances)
     
     st.markdown("---")
     
     # אפשרויות סינון
     st.subheader("Cash Flow Statement")
     
-    col1, col2, col3 = st.columns(3)
+    account_options = category_options(data_converted, 'account')
+    col1, col2, col3, col4 = st.columns(4)
     with col1:
         # הגבלת טווח התאריכים
         min_date = pd.to_datetime('2024-01-01').date()
@@ -64,7 +106,7 @@ def render_cash_flow_page(data):
         default_start = min_date
         default_end = max_date
         
-        data_min_date = pd.to_datetime(data_converted['date']).min().date()
+        data_min_date = data_converted['date'].min().date()
         if data_min_date > min_date:
             min_date = data_min_date
             default_start = data_min_date
@@ -73,26 +115,45 @@ def render_cash_flow_page(data):
                                  min_value=min_date, max_value=max_date)
     
     with col2:
-        category_options = data_converted['category'].unique()
-        category_filter = st.multiselect("Category Filter", category_options, default=[])
+        category_filter = st.multiselect("Category Filter", category_options(data_converted, 'category'), default=[])
     
     with col3:
-        type_options = data_converted['type'].unique()
-        type_filter = st.multiselect("Type Filter", type_options, default=[])
+        type_filter = st.multiselect("Type Filter", category_options(data_converted, 'type'), default=[])
+    
+    with col4:
+        selected_account = st.selectbox("Account", [ALL_ACCOUNTS] + account_options, key="account")
+    account = None if selected_account == ALL_ACCOUNTS else selected_account
+    account_filter = [account] if account else None
     
-    # סינון הנתונים
-    data_for_cashflow = data_converted.copy()
-    data_for_cashflow = filter_data_by_date_range(data_for_cashflow, date_range)
-    data_for_cashflow = filter_data_by_categories(data_for_cashflow, category_filter)
-    data_for_cashflow = filter_data_by_types(data_for_cashflow, type_filter)
+    display_opening_balances_editor(account_options)
     
-    if data_for_cashflow.empty:
+    # סינון הנתונים - התנועות נדרשות רק להערות הדוח
+    data_for_cashflow = filter_data(data_converted, date_range, category_filter, type_filter,
+                                    version=data_version, accounts=account_filter)
+    rollup_for_cashflow = filter_data(daily_rollup, date_range, category_filter, type_filter,
+                                      version=rollup_version, accounts=account_filter)
+    
+    if rollup_for_cashflow.empty:
         st.warning("No data available for the selected date range.")
         return
     
     try:
+        # היתרות מחושבות על כל ההיסטוריה וטווח התאריכים נחתך מהדוח;
+        # בסינון קטגוריה/סוג - היתרות מחושבות על התנועות המסוננות בלבד
+        if category_filter or type_filter:
+            statement_rollup = filter_data(daily_rollup, None, category_filter, type_filter,
+                                           version=rollup_version, accounts=account_filter)
+            statement_balances = account_balances(statement_rollup, opening_balances)
+        else:
+            statement_balances = balances
+        notes_key = None if data_version is None else (
+            data_version, tuple(map(str, date_range)), tuple(category_filter), tuple(type_filter), account)
+        full_statement = statement_from_balances(statement_balances, account,
+                                                 notes=daily_notes(data_for_cashflow, key=notes_key))
+        daily_cashflow = statement_window(full_statement, *date_range) if len(date_range) == 2 else full_statement
+        
         # הצגת תזרים מזומנים
-        display_cashflow_statement(data_for_cashflow, currency_label)
+        display_cashflow_statement(rollup_for_cashflow, daily_cashflow)
     except Exception as e:
         st.error("שגיאה בהצגת תזרים המזומנים")
         logger.error(f"Error in display_cashflow_statement: {str(e)}")
@@ -100,7 +161,15 @@ def render_cash_flow_page(data):
     # תחזית
     st.markdown("---")
     try:
-        display_cashflow_forecast(data_converted, currency_label)
+        # התחזית מתחילה מהיתרה האחרונה בפועל של החשבון הנבחר (או של כל החשבונות)
+        account_statement = statement_from_balances(balances, account)
+        current_balance = account_statement['closing_balance'].iloc[-1] if not account_statement.empty else INITIAL_BALANCE
+        convert = lambda rows: convert_frame(rows, rates, base_currency, target_currency,
+                                             key=rows.attrs.get('ledger_version'))
+        display_cashflow_forecast(data_converted, daily_rollup, currency_label, rollup_version,
+                                  current_balance=current_balance, accounts=account_filter, data_version=data_version,
+                                  ledger=data, convert=convert,
+                                  conversion_key=data_version[1:] if data_version else None)
     except Exception as e:
         st.error("שגיאה בהצגת התחזית")
         logger.error(f"Error in display_cashflow_forecast: {str(e)}")
@@ -115,147 +184,180 @@ def render_cash_flow_page(data):
     
     st.markdown('</div>', unsafe_allow_html=True)
 
-def display_cashflow_statement(data_for_cashflow, currency_label):
-    """הצגת דוח תזרים מזומנים"""
-    # וידוא שעמודת התאריך היא datetime
-    data_for_cashflow['date'] = pd.to_datetime(data_for_cashflow['date'])
-    
-    # מיון לפי תאריך
-    data_for_cashflow = data_for_cashflow.sort_values('date')
-    
-    # יצירת נתוני תזרים מזומנים לפי יום
-    daily_cashflow = data_for_cashflow.groupby(data_for_cashflow['date'].dt.date).agg({
-        'amount': 'sum',
-        'description': lambda x: ", ".join(set(x)) if len(set(x)) <= 3 else ", ".join(list(set(x))[:3]) + "..."
-    }).reset_index()
-    daily_cashflow['date_str'] = daily_cashflow['date'].apply(lambda x: x.strftime('%d/%m/%Y'))
-    
-    # חישוב יתרות
-    initial_balance = 100000
-    daily_cashflow['cash_inflows'] = daily_cashflow['amount'].apply(lambda x: max(0, x))
-    daily_cashflow['cash_outflows'] = daily_cashflow['amount'].apply(lambda x: min(0, x)).abs()
-    
-    running_balance = initial_balance
-    opening_balances = []
-    closing_balances = []
-    
-    for i, row in daily_cashflow.iterrows():
-        opening_balances.append(running_balance)
-        closing_balance = running_balance + row['amount']
-        closing_balances.append(closing_balance)
-        running_balance = closing_balance
-    
-    daily_cashflow['opening_balance'] = opening_balances
-    daily_cashflow['closing_balance'] = closing_balances
-    
-    # Format for display with proper thousand separators
-    cashflow_display = pd.DataFrame({
-        'Date': daily_cashflow['date_str'],
-        'Opening Balance': daily_cashflow['opening_balance'].map(lambda x: f'${x:,.2f}'),
-        'Cash Inflows': daily_cashflow['cash_inflows'].map(lambda x: f'${x:,.2f}'),
-        'Cash Outflows': daily_cashflow['cash_outflows'].map(lambda x: f'${x:,.2f}'),
-        'Closing Balance': daily_cashflow['closing_balance'].map(lambda x: f'${x:,.2f}'),
-        'Notes': daily_cashflow['description']
-    })
-    
+ALL_ACCOUNTS = "All accounts"
+
+@st.cache_data(ttl=3600, max_entries=16, show_spinner=False)
+def load_rate_table(currencies, target_currency, start_date, end_date):
+    """טבלת שערי ההמרה (יום × מטבע) למטבע היעד, לכל מטבע בספר התנועות - נשמרת לשעה"""
+    return rate_table({currency: services.get_exchange_rate_history(currency, target_currency, start_date, end_date)
+                       for currency in currencies})
+
+def display_opening_balances_editor(accounts):
+    """עריכת יתרות הפתיחה של החשבונות (במטבע הבסיס)"""
+    with st.expander("Account Opening Balances"):
+        saved = load_opening_balances()
+        edited = {}
+        columns = st.columns(min(len(accounts), 4) or 1)
+        for i, account in enumerate(accounts):
+            with columns[i % len(columns)]:
+                edited[account] = st.number_input(account, value=float(saved.get(account, 0.0)),
+                                                  step=1000.0, key=f"opening_balance_{account}")
+        if st.button("Save Opening Balances", key="save_opening_balances"):
+            save_opening_balances({**saved, **edited})
+            st.success("Opening balances saved.")
+            st.rerun()
+
+def display_cashflow_statement(rollup_for_cashflow, daily_cashflow):
+    """הצגת דוח תזרים מזומנים (הדוח מחושב ב-data/statement.py מהסיכום היומי)"""
     # הצגת טבלה וגרפים
     table_col, graph_col = st.columns([2, 1])
     with table_col:
-        st.dataframe(cashflow_display, use_container_width=True, height=400)
+        display_statement_table(daily_cashflow, key="statement")
     with graph_col:
-        display_cashflow_charts(data_for_cashflow, daily_cashflow)
+        display_cashflow_charts(rollup_for_cashflow, daily_cashflow)
+
+STATEMENT_SORT_COLUMNS = {
+    "Date": "date",
+    "Closing Balance": "closing_balance",
+    "Cash Inflows": "cash_inflows",
+    "Cash Outflows": "cash_outflows",
+}
+PAGE_SIZES = [25, 50, 100]
+
+def _jump_to_date(statement, key, page_size, ascending):
+    """מעבר לעמוד של התאריך שנבחר (callback - רץ לפני יצירת בורר העמוד)"""
+    jump_date = st.session_state.get(f"{key}_jump")
+    if jump_date is not None:
+        st.session_state[f"{key}_page"] = page_for_date(statement, jump_date, page_size, ascending) + 1
+
+def display_statement_table(statement, key, date_format='%d/%m/%Y'):
+    """
+    טבלת דוח מחולקת לעמודים: השרת ממיין, חותך ומעצב רק את העמוד המוצג,
+    כך שגודל הטבלה שנשלחת לדפדפן אינו תלוי באורך הטווח.
+    :param statement: דוח ממוין לפי תאריך (daily_statement)
+    :param key: קידומת למפתחות הווידג'טים
+    """
+    sort_col, order_col, size_col, jump_col = st.columns(4)
+    with sort_col:
+        sort_label = st.selectbox("Sort by", list(STATEMENT_SORT_COLUMNS), key=f"{key}_sort")
+    with order_col:
+        descending = st.toggle("Descending", key=f"{key}_descending")
+    with size_col:
+        page_size = st.selectbox("Rows per page", PAGE_SIZES, key=f"{key}_page_size")
+    
+    sort_column = STATEMENT_SORT_COLUMNS[sort_label]
+    rows = sort_statement(statement, sort_column, ascending=not descending)
+    pages = page_count(rows, page_size)
+    
+    with jump_col:
+        # קפיצה לתאריך אפשרית רק כשהטבלה ממוינת לפי תאריך
+        st.date_input("Jump to date", value=None, key=f"{key}_jump",
+                      min_value=statement['date'].min() if not statement.empty else None,
+                      max_value=statement['date'].max() if not statement.empty else None,
+                      disabled=sort_column != "date",
+                      on_change=_jump_to_date, args=(statement, key, page_size, not descending))
+    
+    page_key = f"{key}_page"
+    if st.session_state.get(page_key, 1) > pages:
+        st.session_state[page_key] = pages
+    page = st.number_input("Page", min_value=1, max_value=pages, step=1, key=page_key)
+    
+    page_rows = statement_page(rows, int(page) - 1, page_size)
+    st.dataframe(format_statement(page_rows, date_format=date_format),
+                 use_container_width=True, hide_index=True, height=400)
+    st.caption(f"Page {int(page)} of {pages} ({len(rows):,} rows)")
+
+CHART_TABS = ["Monthly Cash Flow", "Balance Over Time", "Income vs Expenses"]
+# רצועות היתרה מהסימולציה (עמודות מתוך services.SIMULATION_PERCENTILES)
+BALANCE_BANDS = ["p5", "p25", "p50", "p75", "p95"]
 
-def display_cashflow_charts(data_for_cashflow, daily_cashflow):
-    """הצגת גרפים של תזרים מזומנים"""
+@st.fragment
+def display_cashflow_charts(rollup_for_cashflow, daily_cashflow):
+    """
+    הצגת גרפים של תזרים מזומנים.
+    רק הגרף של הלשונית הנבחרת נבנה; מעבר לשונית מריץ מחדש את ה-fragment בלבד ולא את כל העמוד.
+    """
     st.markdown('<div style="margin-bottom:16px;"></div>', unsafe_allow_html=True)
-    tab1, tab2, tab3 = st.tabs(["Monthly Cash Flow", "Balance Over Time", "Income vs Expenses"])
+    selected_tab = chart_tab_selector(CHART_TABS, key="cashflow_chart_tab")
     
-    with tab1:
-        display_monthly_cashflow_chart(data_for_cashflow)
-    with tab2:
+    if selected_tab == CHART_TABS[0]:
+        display_monthly_cashflow_chart(rollup_for_cashflow)
+    elif selected_tab == CHART_TABS[1]:
         display_balance_over_time_chart(daily_cashflow)
-    with tab3:
-        display_income_vs_expenses_chart(data_for_cashflow)
+    else:
+        display_income_vs_expenses_chart(rollup_for_cashflow)
 
-def display_monthly_cashflow_chart(data_for_cashflow):
+def display_monthly_cashflow_chart(rollup_for_cashflow):
     """Monthly cash flow chart with improved formatting"""
-    import matplotlib.ticker as ticker
-    
-    # Ensure date column is datetime
-    data_for_cashflow = data_for_cashflow.copy()
-    data_for_cashflow['date'] = pd.to_datetime(data_for_cashflow['date'])
-    
-    # Group by month
-    data_for_cashflow['month'] = data_for_cashflow['date'].dt.to_period('M')
-    monthly_inflows = data_for_cashflow[data_for_cashflow['amount'] > 0].groupby('month')['amount'].sum()
-    monthly_outflows = data_for_cashflow[data_for_cashflow['amount'] < 0].groupby('month')['amount'].sum().abs()
-    monthly_cashflow = pd.DataFrame({'Inflows': monthly_inflows, 'Outflows': monthly_outflows}).fillna(0)
+    # Group by month (from the daily rollup)
+    monthly_cashflow = totals_by(rollup_for_cashflow, 'month').rename(
+        columns={'inflows': 'Inflows', 'outflows': 'Outflows'})
     
     try:
-        fig, ax = plt.subplots(figsize=(4, 3), facecolor='#181943')
-        ax.set_facecolor('#181943')
-        
-        # Plot bars
-        monthly_cashflow.plot(kind='bar', ax=ax, color=['#00CFFF', '#9966FF'], width=0.8)
-        
-        # Format x-axis labels
-        labels = [str(period) for period in monthly_cashflow.index]
-        if len(labels) > 8:
-            # Show fewer labels if too many
-            step = max(1, len(labels) // 8)
-            for i, label in enumerate(ax.get_xticklabels()):
-                if i % step != 0:
-                    label.set_visible(False)
-                else:
-                    # Format as MMM YY
-                    period = monthly_cashflow.index[i]
-                    label.set_text(period.strftime('%b %y'))
-        else:
-            # Format all labels as MMM YY
-            formatted_labels = [period.strftime('%b %y') for period in monthly_cashflow.index]
-            ax.set_xticklabels(formatted_labels)
-        
-        # Format y-axis with comma thousands separator
-        ax.yaxis.set_major_formatter(ticker.FuncFormatter(lambda x, p: f'${x:,.0f}'))
-        
-        # Styling
-        ax.set_xlabel('Month', fontsize=8, color='white', fontweight='bold')
-        ax.set_ylabel('Amount', fontsize=8, color='white', fontweight='bold')
-        ax.set_title('Monthly Cash Flow', fontsize=10, color='white', pad=15, fontweight='bold')
-        ax.tick_params(axis='x', labelrotation=45, labelsize=7, colors='white')
-        ax.tick_params(axis='y', labelsize=7, colors='white')
-        
-        # Spines
-        for spine in ax.spines.values():
-            spine.set_color('white')
-            spine.set_linewidth(0.5)
-        
-        # Grid
-        ax.grid(axis='y', linestyle='--', alpha=0.3, color='white')
-        ax.set_axisbelow(True)
-        
-        # Legend
-        ax.legend(fontsize=8, facecolor='#23255d', edgecolor='white', labelcolor='white', 
-                 framealpha=0.9, loc='upper left')
-        
-        plt.tight_layout()
-        st.pyplot(fig)
+        display_chart(draw_monthly_cashflow_chart, monthly_cashflow, width=4, height=3)
     except Exception as e:
         st.warning(f"Unable to display chart: {str(e)}")
 
+def draw_monthly_cashflow_chart(ax, monthly_cashflow):
+    """ציור גרף התזרים החודשי"""
+    # Plot bars
+    monthly_cashflow.plot(kind='bar', ax=ax, color=['#00CFFF', '#9966FF'], width=0.8)
+    
+    # Format x-axis labels
+    labels = [str(period) for period in monthly_cashflow.index]
+    if len(labels) > 8:
+        # Show fewer labels if too many
+        step = max(1, len(labels) // 8)
+        for i, label in enumerate(ax.get_xticklabels()):
+            if i % step != 0:
+                label.set_visible(False)
+            else:
+                # Format as MMM YY
+                period = monthly_cashflow.index[i]
+                label.set_text(period.strftime('%b %y'))
+    else:
+        # Format all labels as MMM YY
+        formatted_labels = [period.strftime('%b %y') for period in monthly_cashflow.index]
+        ax.set_xticklabels(formatted_labels)
+    
+    # Format y-axis with comma thousands separator
+    ax.yaxis.set_major_formatter(ticker.FuncFormatter(lambda x, p: f'${x:,.0f}'))
+    
+    # Styling
+    ax.set_xlabel('Month', fontsize=8, color='white', fontweight='bold')
+    ax.set_ylabel('Amount', fontsize=8, color='white', fontweight='bold')
+    ax.set_title('Monthly Cash Flow', fontsize=10, color='white', pad=15, fontweight='bold')
+    ax.tick_params(axis='x', labelrotation=45, labelsize=7, colors='white')
+    ax.tick_params(axis='y', labelsize=7, colors='white')
+    
+    # Spines
+    for spine in ax.spines.values():
+        spine.set_color('white')
+        spine.set_linewidth(0.5)
+    
+    # Grid
+    ax.grid(axis='y', linestyle='--', alpha=0.3, color='white')
+    ax.set_axisbelow(True)
+    
+    # Legend
+    ax.legend(fontsize=8, facecolor='#23255d', edgecolor='white', labelcolor='white', 
+             framealpha=0.9, loc='upper left')
+    
+    ax.figure.tight_layout()
+
 def display_balance_over_time_chart(daily_cashflow):
     """Balance over time chart with improved formatting"""
-    import matplotlib.ticker as ticker
-    import matplotlib.dates as mdates
-    
     balance_over_time = pd.DataFrame({
-        'Date': pd.to_datetime(daily_cashflow['date']), 
+        'Date': daily_cashflow['date'], 
         'Balance': daily_cashflow['closing_balance']
     }).set_index('Date')
+    # הקו מצויר עם נקודה אחת לכל פיקסל לכל היותר, תוך שמירה על שיאים ושפל
+    balance_over_time = downsample(balance_over_time, point_budget(4), column='Balance')
     
-    fig, ax = plt.subplots(figsize=(4, 3), facecolor='#181943')
-    ax.set_facecolor('#181943')
-    
+    display_chart(draw_balance_over_time_chart, balance_over_time, width=4, height=3)
+
+def draw_balance_over_time_chart(ax, balance_over_time):
+    """ציור גרף היתרה לאורך זמן"""
     # Plot line
     balance_over_time.plot(ax=ax, color='#00CFFF', linewidth=2.5, legend=False)
     
@@ -293,49 +395,46 @@ def display_balance_over_time_chart(daily_cashflow):
     ax.fill_between(balance_over_time.index, balance_over_time['Balance'], 
                     alpha=0.1, color='#00CFFF')
     
-    plt.tight_layout()
-    st.pyplot(fig)
+    ax.figure.tight_layout()
 
-def display_income_vs_expenses_chart(data_for_cashflow):
+def display_income_vs_expenses_chart(rollup_for_cashflow):
     """גרף הכנסות מול הוצאות"""
-    income_by_type = data_for_cashflow[data_for_cashflow['amount'] > 0].groupby('type')['amount'].sum().reset_index()
-    expense_by_type = data_for_cashflow[data_for_cashflow['amount'] < 0].groupby('type')['amount'].sum().abs().reset_index()
-    
-    fig1, ax1 = plt.subplots(figsize=(2.5, 1.8), facecolor='#181943')
-    ax1.set_facecolor('#181943')
-    income_by_type.plot(kind='bar', x='type', y='amount', ax=ax1, legend=False, rot=0, color='#00CFFF')
-    ax1.set_xlabel('Type', fontsize=7, color='white')
-    ax1.set_ylabel('Amount', fontsize=7, color='white')
-    ax1.set_title('Income Sources', fontsize=8, color='white')
-    ax1.tick_params(axis='x', labelrotation=30, labelsize=6, colors='white')
-    ax1.tick_params(axis='y', labelsize=6, colors='white')
-    ax1.spines['bottom'].set_color('white')
-    ax1.spines['top'].set_color('white')
-    ax1.spines['left'].set_color('white')
-    ax1.spines['right'].set_color('white')
-    ax1.grid(axis='y', linestyle='--', alpha=0.2, color='white')
-    st.pyplot(fig1)
-    
-    fig2, ax2 = plt.subplots(figsize=(2.5, 1.8), facecolor='#181943')
-    ax2.set_facecolor('#181943')
-    expense_by_type.plot(kind='bar', x='type', y='amount', ax=ax2, legend=False, rot=0, color='#9966FF')
-    ax2.set_xlabel('Type', fontsize=7, color='white')
-    ax2.set_ylabel('Amount', fontsize=7, color='white')
-    ax2.set_title('Expense Categories', fontsize=8, color='white')
-    ax2.tick_params(axis='x', labelrotation=30, labelsize=6, colors='white')
-    ax2.tick_params(axis='y', labelsize=6, colors='white')
-    ax2.spines['bottom'].set_color('white')
-    ax2.spines['top'].set_color('white')
-    ax2.spines['left'].set_color('white')
-    ax2.spines['right'].set_color('white')
-    ax2.grid(axis='y', linestyle='--', alpha=0.2, color='white')
-    st.pyplot(fig2)
+    by_type = totals_by(rollup_for_cashflow, 'type')
+    income_by_type = by_type.loc[by_type['inflows'] > 0, 'inflows'].rename('amount').rename_axis('type').reset_index()
+    expense_by_type = by_type.loc[by_type['outflows'] > 0, 'outflows'].rename('amount').rename_axis('type').reset_index()
+    
+    display_chart(draw_type_totals_chart, income_by_type, 'Income Sources', '#00CFFF', width=2.5, height=1.8)
+    display_chart(draw_type_totals_chart, expense_by_type, 'Expense Categories', '#9966FF', width=2.5, height=1.8)
+
+def draw_type_totals_chart(ax, totals_by_type, title, color):
+    """ציור גרף עמודות של סכומים לפי סוג"""
+    totals_by_type.plot(kind='bar', x='type', y='amount', ax=ax, legend=False, rot=0, color=color)
+    ax.set_xlabel('Type', fontsize=7, color='white')
+    ax.set_ylabel('Amount', fontsize=7, color='white')
+    ax.set_title(title, fontsize=8, color='white')
+    ax.tick_params(axis='x', labelrotation=30, labelsize=6, colors='white')
+    ax.tick_params(axis='y', labelsize=6, colors='white')
+    ax.spines['bottom'].set_color('white')
+    ax.spines['top'].set_color('white')
+    ax.spines['left'].set_color('white')
+    ax.spines['right'].set_color('white')
+    ax.grid(axis='y', linestyle='--', alpha=0.2, color='white')
 
-def display_cashflow_forecast(data_converted, currency_label):
-    """הצגת תחזית תזרים מזומנים"""
+def display_cashflow_forecast(data_converted, daily_rollup, currency_label, rollup_version=None,
+                              current_balance=INITIAL_BALANCE, accounts=None, data_version=None, ledger=None,
+                              convert=None, conversion_key=None):
+    """
+    הצגת תחזית תזרים מזומנים (ממצב החיזוי המצטבר של ספר התנועות).
+    :param current_balance: היתרה שממנה התחזית מתחילה (היתרה האחרונה בדוח)
+    :param accounts: חשבונות לכלול (ריק = הכל)
+    :param data_version: גרסת data_converted - מפתח למטמון הסינון ולמטמון ההערות
+    :param ledger: ספר התנועות מ-load_data, במטבע המקורי
+    :param convert: המרת שורות של ספר התנועות למטבע היעד
+    :param conversion_key: מזהה ההמרה (מטבע בסיס, מטבע יעד, שערים)
+    """
     st.subheader(f"Cash Flow Forecast ({currency_label})")
     
-    forecast_col1, forecast_col2, forecast_col3 = st.columns(3)
+    forecast_col1, forecast_col2, forecast_col3, forecast_col4 = st.columns(4)
     with forecast_col1:
         forecast_min_date = pd.to_datetime('today').date()
         forecast_max_date = pd.to_datetime('2027-12-31').date()
@@ -349,96 +448,118 @@ def display_cashflow_forecast(data_converted, currency_label):
                                           max_value=forecast_max_date,
                                           key="forecast_date_range")
     with forecast_col2:
-        forecast_category_options = data_converted['category'].unique()
         forecast_category_filter = st.multiselect("Forecast Category Filter", 
-                                                forecast_category_options, default=[])
+                                                category_options(data_converted, 'category'), default=[])
     with forecast_col3:
-        forecast_type_options = data_converted['type'].unique()
         forecast_type_filter = st.multiselect("Forecast Type Filter", 
-                                            forecast_type_options, default=[])
-    
-    # סינון נתונים לתחזית
-    forecast_data_for_cashflow = data_converted.copy()
-    forecast_data_for_cashflow['date'] = pd.to_datetime(forecast_data_for_cashflow['date'])
-    forecast_data_for_cashflow = filter_data_by_date_range(forecast_data_for_cashflow, forecast_date_range)
-    forecast_data_for_cashflow = filter_data_by_categories(forecast_data_for_cashflow, forecast_category_filter)
-    forecast_data_for_cashflow = filter_data_by_types(forecast_data_for_cashflow, forecast_type_filter)
+                                            category_options(data_converted, 'type'), default=[])
+    with forecast_col4:
+        # ההתאמה של כל מודל נשמרת במטמון (services.fit_forecast_model) - מעבר בין מודלים לא מתאים מחדש
+        forecast_model = st.selectbox("Forecast Model", list(services.FORECAST_MODELS),
+                                      format_func=lambda name: name.replace('_', ' ').title(),
+                                      key="forecast_model")
     
     # חישוב תחזית
     try:
-        forecast_data = forecast_data_for_cashflow[['date', 'amount']].copy()
-        forecast_data['date'] = pd.to_datetime(forecast_data['date'])
-        
-        if forecast_data.empty:
+        # מצב החיזוי (סכומים חודשיים והתאמות המודלים) נבנה פעם אחת מספר התנועות לכל המרה וסינון;
+        # הוספת תנועות מעדכנת אותו מהשורות שנוספו בלבד, ומעבר בין מודלים לא מקבץ שוב את ההיסטוריה
+        forecast_state = history_forecast_state(ledger, convert, conversion_key, forecast_date_range,
+                                                forecast_category_filter, forecast_type_filter, accounts)
+        if forecast_state['matrix']['values'].size == 0:
             st.warning("אין נתוני תזרים בטווח התאריכים שנבחר לתחזית.")
-            forecast_data = data_converted[['date', 'amount']].copy()
-            forecast_data['date'] = pd.to_datetime(forecast_data['date'])
-        
-        forecast_df = services.forecast_cashflow(forecast_data, periods=6)
+            forecast_state = history_forecast_state(ledger, convert, conversion_key, None, None, None, accounts)
+        forecast_df = services.forecast_from_state(forecast_state, periods=6, model=forecast_model)
         
         if not forecast_df.empty:
-            display_forecast_results(forecast_df, forecast_data_for_cashflow)
+            # הערות התחזית: התנועות הגדולות שחוזרות באותו חודש בשנה - נבנות פעם אחת לכל גרסה וסינון
+            history = filter_data(data_converted, None, forecast_category_filter, forecast_type_filter,
+                                  version=data_version, accounts=accounts)
+            notes_key = None if data_version is None else (
+                data_version, tuple(forecast_category_filter), tuple(forecast_type_filter), tuple(accounts or ()))
+            # רצועות אי-ודאות והסתברות לחוסר מסימולציית מונטה קרלו סביב אותה תחזית
+            simulation = services.simulate_from_state(forecast_state, periods=6, opening_balance=current_balance,
+                                                      model=forecast_model)
+            display_forecast_results(forecast_df, current_balance, seasonal_notes(history, forecast_df['date'], key=notes_key),
+                                     simulation)
         else:
             st.info("No forecast data available.")
+        
+        if st.toggle("Backtest forecast models", key="show_backtest"):
+            # הבדיקה רצה על כל ההיסטוריה (בלי טווח התאריכים של התחזית), עם אותם מסננים
+            backtest_data = filter_data(daily_rollup, None, forecast_category_filter, forecast_type_filter,
+                                        version=rollup_version, accounts=accounts)
+            backtest_key = (rollup_version, tuple(forecast_category_filter), tuple(forecast_type_filter),
+                            tuple(accounts or ()))
+            display_backtest_results(backtest_data, None if rollup_version is None else backtest_key)
             
     except Exception as e:
         st.error(f"Forecast error: {str(e)}")
         import traceback
         st.code(traceback.format_exc())
 
-def display_forecast_results(forecast_df, forecast_data_for_cashflow):
-    """הצגת תוצאות התחזית"""
-    last_balance = forecast_data_for_cashflow['amount'].cumsum().iloc[-1] if not forecast_data_for_cashflow.empty else 100000
-    
-    forecast_display = pd.DataFrame()
-    forecast_display['date'] = forecast_df['date']
-    forecast_display['date_str'] = forecast_display['date'].dt.strftime('%Y-%m-%d')
-    
-    opening_balances = [last_balance]
-    closing_balances = []
-    cash_inflows = []
-    cash_outflows = []
-    
-    for i, value in enumerate(forecast_df['forecast']):
-        if i > 0:
-            opening_balances.append(closing_balances[i-1])
-        inflow = max(0, value)
-        outflow = abs(min(0, value))
-        cash_inflows.append(inflow)
-        cash_outflows.append(outflow)
-        closing_balance = opening_balances[i] + value
-        closing_balances.append(closing_balance)
-    
-    forecast_display['opening_balance'] = opening_balances
-    forecast_display['cash_inflows'] = cash_inflows
-    forecast_display['cash_outflows'] = cash_outflows
-    forecast_display['closing_balance'] = closing_balances
-    forecast_display['forecast'] = forecast_df['forecast']
+def history_forecast_state(ledger, convert, conversion_key, date_range, categories, types, accounts):
+    """
+    מצב החיזוי המצטבר (ledger_forecast_state) של התנועות המסוננות במטבע היעד.
+    ההמרה והסינון מופעלים פעם אחת על ספר התנועות, ואחר כך רק על השורות שנוספו.
+    """
+    def prepare(rows):
+        return filter_data(convert(rows), date_range, categories, types, accounts=accounts)[['date', 'amount']]
+    
+    key = (conversion_key, tuple(map(str, date_range or ())), tuple(categories or ()), tuple(types or ()),
+           tuple(accounts or ()))
+    return ledger_forecast_state(ledger, prepare=prepare, key=key)
+
+def display_backtest_results(backtest_data, key=None):
+    """
+    טבלת דיוק מודלי החיזוי בבדיקה היסטורית (services.backtest_models).
+    :param key: מזהה גרסת הנתונים והסינון - התוצאה נשמרת במטמון לפיו
+    """
+    with st.spinner("מריץ בדיקה היסטורית של מודלי החיזוי..."):
+        backtest = services.backtest_models(backtest_data, key=key)
+    if backtest['origins'] == 0:
+        st.info("אין מספיק היסטוריה לבדיקה של מודלי החיזוי.")
+        return
+    scores = backtest['scores'].reset_index()
+    scores['model'] = scores['model'].str.replace('_', ' ').str.title()
+    st.caption(f"{backtest['origins']} rolling origins, {services.BACKTEST_HORIZON} months ahead")
+    st.dataframe(scores.rename(columns={'model': 'Model', 'mae': 'MAE', 'mape': 'MAPE (%)', 'bias': 'Bias',
+                                        'count': 'Forecasts'}),
+                 hide_index=True, use_container_width=True)
+
+def display_forecast_results(forecast_df, last_balance, notes=None, simulation=None):
+    """
+    הצגת תוצאות התחזית.
+    :param last_balance: היתרה בפועל שממנה התחזית מתחילה
+    :param notes: הערה לכל תקופת תחזית (seasonal_notes)
+    :param simulation: תוצאת services.simulate_cashflow (אופציונלי) - רצועות והסתברות לחוסר
+    """
+    # ההטלה על מבנה הדוח מתבצעת במנוע הדוח (data/statement.py) - סכום מצטבר וקטורי
+    forecast_display = forecast_statement(forecast_df, last_balance, notes)
     
     if forecast_display.empty or forecast_display['date'].isnull().all() or forecast_display['forecast'].isnull().all():
         st.warning("אין נתוני תחזית בטווח התאריכים שנבחר.")
         return
     
-    # טבלת תחזית
-    forecast_table = pd.DataFrame({
-        'Date': forecast_display['date_str'],
-        'Opening Balance': forecast_display['opening_balance'].map('${:,.2f}'.format),
-        'Cash Inflows': forecast_display['cash_inflows'].map('${:,.2f}'.format),
-        'Cash Outflows': forecast_display['cash_outflows'].map('${:,.2f}'.format),
-        'Closing Balance': forecast_display['closing_balance'].map('${:,.2f}'.format),
-        'Notes': forecast_display.get('description', ['']*len(forecast_display))
-    })
-    
     st.subheader("Forecast Visualization")
     
+    bands = None
+    if simulation is not None and not np.isnan(simulation['shortfall_probability']):
+        bands = simulation['bands']
+        st.metric(f"Probability of a negative balance within {len(bands)} months",
+                  f"{simulation['shortfall_probability']:.1%}")
+    
     forecast_table_col, forecast_graph_col = st.columns([2, 1])
     with forecast_table_col:
-        st.dataframe(forecast_table, use_container_width=True, height=400)
+        display_statement_table(forecast_display, key="forecast_table", date_format='%Y-%m-%d')
     with forecast_graph_col:
-        display_forecast_charts(forecast_display)
+        display_forecast_charts(forecast_display, bands)
 
-def display_forecast_charts(forecast_display):
-    """הצגת גרפי תחזית"""
+@st.fragment
+def display_forecast_charts(forecast_display, bands=None):
+    """
+    הצגת גרפי תחזית (רק הלשונית הנבחרת, ב-fragment נפרד).
+    :param bands: רצועות האחוזונים של היתרה (simulate_cashflow), אופציונלי
+    """
     st.markdown('<div style="margin-bottom:16px;"></div>', unsafe_allow_html=True)
     
     forecast_chart_data = pd.DataFrame({
@@ -446,14 +567,17 @@ def display_forecast_charts(forecast_display):
         'Forecast': forecast_display['forecast'],
         'Balance': forecast_display['closing_balance']
     }).set_index('Date')
+    if bands is not None:
+        for column in BALANCE_BANDS:
+            forecast_chart_data[column] = bands[column].to_numpy()
     
-    chart_tab1, chart_tab2, chart_tab3 = st.tabs(["Monthly Cash Flow", "Balance Over Time", "Income vs Expenses"])
+    selected_tab = chart_tab_selector(CHART_TABS, key="forecast_chart_tab")
     
-    with chart_tab1:
+    if selected_tab == CHART_TABS[0]:
         display_monthly_forecast_chart(forecast_chart_data)
-    with chart_tab2:
+    elif selected_tab == CHART_TABS[1]:
         display_balance_forecast_chart(forecast_chart_data)
-    with chart_tab3:
+    else:
         display_income_expense_forecast_chart(forecast_display)
 
 def display_monthly_forecast_chart(forecast_chart_data):
@@ -463,33 +587,7 @@ def display_monthly_forecast_chart(forecast_chart_data):
             forecast_chart_data_month = forecast_chart_data.resample('ME').sum()
             
             if not forecast_chart_data_month.empty:
-                fig, ax = plt.subplots(figsize=(3, 2.3), facecolor='#181943')
-                ax.set_facecolor('#181943')
-                forecast_chart_data_month[['Forecast']].plot(kind='bar', ax=ax, rot=30, color='#00CFFF')
-                
-                if len(forecast_chart_data_month.index) > 0:
-                    xlabels = [item.strftime('%Y-%m-%d') for item in forecast_chart_data_month.index.to_list()]
-                    ax.set_xticklabels(xlabels)
-                
-                ax.set_xlabel('Month', fontsize=8, color='white')
-                ax.set_ylabel('Forecast', fontsize=8, color='white')
-                ax.set_title('Monthly Cash Flow Forecast', fontsize=10, color='white', pad=15)
-                ax.tick_params(axis='x', labelrotation=30, labelsize=6, colors='white')
-                ax.tick_params(axis='y', labelsize=6, colors='white')
-                ax.spines['bottom'].set_color('white')
-                ax.spines['top'].set_color('white')
-                ax.spines['left'].set_color('white')
-                ax.spines['right'].set_color('white')
-                ax.grid(axis='y', linestyle='--', alpha=0.2, color='white')
-                
-                for i, val in enumerate(forecast_chart_data_month['Forecast']):
-                    if not pd.isna(val):
-                        ax.text(i, val + (0.1 * val if val > 0 else -0.1 * abs(val)), 
-                               f'${int(val)}', ha='center', va='bottom' if val > 0 else 'top', 
-                               fontsize=6, color='white')
-                
-                plt.tight_layout()
-                st.pyplot(fig)
+                display_chart(draw_monthly_forecast_chart, forecast_chart_data_month[['Forecast']], width=3, height=2.3)
             else:
                 st.warning("אין נתונים מספיקים להצגת גרף תחזית חודשי.")
         else:
@@ -497,35 +595,75 @@ def display_monthly_forecast_chart(forecast_chart_data):
     except Exception as e:
         st.warning(f"לא ניתן להציג את גרף התחזית החודשי: {str(e)}")
 
+def draw_monthly_forecast_chart(ax, forecast_chart_data_month):
+    """ציור גרף התחזית החודשית"""
+    forecast_chart_data_month.plot(kind='bar', ax=ax, rot=30, color='#00CFFF')
+    
+    if len(forecast_chart_data_month.index) > 0:
+        xlabels = [item.strftime('%Y-%m-%d') for item in forecast_chart_data_month.index.to_list()]
+        ax.set_xticklabels(xlabels)
+    
+    ax.set_xlabel('Month', fontsize=8, color='white')
+    ax.set_ylabel('Forecast', fontsize=8, color='white')
+    ax.set_title('Monthly Cash Flow Forecast', fontsize=10, color='white', pad=15)
+    ax.tick_params(axis='x', labelrotation=30, labelsize=6, colors='white')
+    ax.tick_params(axis='y', labelsize=6, colors='white')
+    ax.spines['bottom'].set_color('white')
+    ax.spines['top'].set_color('white')
+    ax.spines['left'].set_color('white')
+    ax.spines['right'].set_color('white')
+    ax.grid(axis='y', linestyle='--', alpha=0.2, color='white')
+    
+    for i, val in enumerate(forecast_chart_data_month['Forecast']):
+        if not pd.isna(val):
+            ax.text(i, val + (0.1 * val if val > 0 else -0.1 * abs(val)), 
+                   f'${int(val)}', ha='center', va='bottom' if val > 0 else 'top', 
+                   fontsize=6, color='white')
+    
+    ax.figure.tight_layout()
+
 def display_balance_forecast_chart(forecast_chart_data):
     """גרף תחזית יתרה"""
     try:
         if not forecast_chart_data.empty and not forecast_chart_data['Balance'].isnull().all():
-            fig, ax = plt.subplots(figsize=(3, 2.3), facecolor='#181943')
-            ax.set_facecolor('#181943')
-            forecast_chart_data[['Balance']].plot(ax=ax, color='#00CFFF', linewidth=2)
-            
-            date_formatter = plt.matplotlib.dates.DateFormatter('%Y-%m-%d')
-            ax.xaxis.set_major_formatter(date_formatter)
-            
-            ax.set_xlabel('Date', fontsize=8, color='white')
-            ax.set_ylabel('Balance', fontsize=8, color='white')
-            ax.set_title('Projected Balance Over Time', fontsize=10, color='white', pad=15)
-            ax.tick_params(axis='x', labelsize=6, colors='white')
-            ax.tick_params(axis='y', labelsize=6, colors='white')
-            ax.spines['bottom'].set_color('white')
-            ax.spines['top'].set_color('white')
-            ax.spines['left'].set_color('white')
-            ax.spines['right'].set_color('white')
-            ax.grid(axis='y', linestyle='--', alpha=0.2, color='white')
-            
-            plt.tight_layout()
-            st.pyplot(fig)
+            columns = ['Balance'] + [column for column in BALANCE_BANDS if column in forecast_chart_data.columns]
+            balance_forecast = downsample(forecast_chart_data[columns], point_budget(3), column='Balance')
+            display_chart(draw_balance_forecast_chart, balance_forecast, width=3, height=2.3)
         else:
             st.warning("אין נתוני מאזן זמינים להצגת גרף.")
     except Exception as e:
         st.warning(f"לא ניתן להציג את גרף המאזן: {str(e)}")
 
+def draw_balance_forecast_chart(ax, balance_forecast):
+    """ציור גרף היתרה החזויה, עם רצועות הסימולציה כשהן קיימות"""
+    has_bands = set(BALANCE_BANDS).issubset(balance_forecast.columns)
+    if has_bands:
+        dates = balance_forecast.index
+        ax.fill_between(dates, balance_forecast['p5'], balance_forecast['p95'], color='#00CFFF', alpha=0.12,
+                        linewidth=0, label='5-95%')
+        ax.fill_between(dates, balance_forecast['p25'], balance_forecast['p75'], color='#00CFFF', alpha=0.25,
+                        linewidth=0, label='25-75%')
+        ax.plot(dates, balance_forecast['p50'], color='white', linewidth=1, linestyle='--', label='Median')
+        ax.axhline(0, color='#FF5C5C', linewidth=0.8, alpha=0.6)
+    ax.plot(balance_forecast.index, balance_forecast['Balance'], color='#00CFFF', linewidth=2, label='Balance')
+    if has_bands:
+        ax.legend(fontsize=6, labelcolor='white', facecolor='none', edgecolor='none')
+    
+    ax.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m-%d'))
+    
+    ax.set_xlabel('Date', fontsize=8, color='white')
+    ax.set_ylabel('Balance', fontsize=8, color='white')
+    ax.set_title('Projected Balance Over Time', fontsize=10, color='white', pad=15)
+    ax.tick_params(axis='x', labelsize=6, colors='white')
+    ax.tick_params(axis='y', labelsize=6, colors='white')
+    ax.spines['bottom'].set_color('white')
+    ax.spines['top'].set_color('white')
+    ax.spines['left'].set_color('white')
+    ax.spines['right'].set_color('white')
+    ax.grid(axis='y', linestyle='--', alpha=0.2, color='white')
+    
+    ax.figure.tight_layout()
+
 def display_income_expense_forecast_chart(forecast_display):
     """גרף תחזית הכנסות מול הוצאות"""
     try:
@@ -534,34 +672,8 @@ def display_income_expense_forecast_chart(forecast_display):
             expense_types = forecast_display[forecast_display['forecast'] < 0]['forecast'].abs()
             
             if not income_types.empty or not expense_types.empty:
-                fig, ax = plt.subplots(figsize=(3, 2.3), facecolor='#181943')
-                ax.set_facecolor('#181943')
-                
-                if not income_types.empty:
-                    income_types.plot(kind='bar', color='#00CFFF', ax=ax, position=0, width=0.4, label='Income')
-                if not expense_types.empty:
-                    expense_types.plot(kind='bar', color='#9966FF', ax=ax, position=1, width=0.4, label='Expense')
-                
-                ax.set_xlabel('Period', fontsize=8, color='white')
-                ax.set_ylabel('Amount', fontsize=8, color='white')
-                ax.set_title('Income vs Expenses (Forecast)', fontsize=10, color='white', pad=15)
-                
-                if len(forecast_display['date']) > 0:
-                    xlabels = [item.strftime('%Y-%m-%d') for item in forecast_display['date']]
-                    if len(xlabels) == len(ax.get_xticklabels()):
-                        ax.set_xticklabels(xlabels, rotation=30)
-                
-                ax.tick_params(axis='x', labelsize=6, colors='white')
-                ax.tick_params(axis='y', labelsize=6, colors='white')
-                ax.spines['bottom'].set_color('white')
-                ax.spines['top'].set_color('white')
-                ax.spines['left'].set_color('white')
-                ax.spines['right'].set_color('white')
-                ax.grid(axis='y', linestyle='--', alpha=0.2, color='white')
-                ax.legend(fontsize=6, facecolor='#23255d', edgecolor='#23255d', labelcolor='white')
-                
-                plt.tight_layout()
-                st.pyplot(fig)
+                display_chart(draw_income_expense_forecast_chart, income_types, expense_types,
+                              forecast_display['date'], width=3, height=2.3)
             else:
                 st.warning("אין נתוני הכנסות/הוצאות זמינים להצגת גרף.")
         else:
@@ -569,6 +681,33 @@ def display_income_expense_forecast_chart(forecast_display):
     except Exception as e:
         st.warning(f"לא ניתן להציג את גרף ההכנסות והוצאות: {str(e)}")
 
+def draw_income_expense_forecast_chart(ax, income_types, expense_types, dates):
+    """ציור גרף התחזית של הכנסות מול הוצאות"""
+    if not income_types.empty:
+        income_types.plot(kind='bar', color='#00CFFF', ax=ax, position=0, width=0.4, label='Income')
+    if not expense_types.empty:
+        expense_types.plot(kind='bar', color='#9966FF', ax=ax, position=1, width=0.4, label='Expense')
+    
+    ax.set_xlabel('Period', fontsize=8, color='white')
+    ax.set_ylabel('Amount', fontsize=8, color='white')
+    ax.set_title('Income vs Expenses (Forecast)', fontsize=10, color='white', pad=15)
+    
+    if len(dates) > 0:
+        xlabels = [item.strftime('%Y-%m-%d') for item in dates]
+        if len(xlabels) == len(ax.get_xticklabels()):
+            ax.set_xticklabels(xlabels, rotation=30)
+    
+    ax.tick_params(axis='x', labelsize=6, colors='white')
+    ax.tick_params(axis='y', labelsize=6, colors='white')
+    ax.spines['bottom'].set_color('white')
+    ax.spines['top'].set_color('white')
+    ax.spines['left'].set_color('white')
+    ax.spines['right'].set_color('white')
+    ax.grid(axis='y', linestyle='--', alpha=0.2, color='white')
+    ax.legend(fontsize=6, facecolor='#23255d', edgecolor='#23255d', labelcolor='white')
+    
+    ax.figure.tight_layout()
+
 def handle_data_export_import(data_converted):
     """טיפול בייצוא וייבוא נתונים"""
     csv = convert_df_to_csv(data_converted)
@@ -586,24 +725,43 @@ def handle_data_export_import(data_converted):
     
     # העלאת קובץ CSV חדש
     uploaded_file = st.file_uploader("העלה קובץ CSV להוספת נתונים", type=["csv"])
-    if uploaded_file is not None:
-        merged_data = process_uploaded_csv(uploaded_file, data_converted)
+    
+    # ייבוא בזרימה לקבצים גדולים - ללא טעינת כל הקובץ לזיכרון
+    with st.expander("ייבוא קובץ גדול"):
+        streaming_mode = st.checkbox("ייבוא בזרימה ישירות לאחסון", key="streaming_import")
+        chunk_size = st.number_input("שורות בכל מקטע", min_value=1_000, max_value=1_000_000,
+                                     value=DEFAULT_CHUNK_SIZE, step=10_000, key="import_chunk_size")
+    
+    # ייבוא מרובה קבצים (למשל כל דוחות הבנק והאשראי של סוף החודש) בסינון כפילויות אחד
+    with st.expander("ייבוא מרובה קבצים"):
+        uploaded_files = st.file_uploader("העלה קבצי CSV", type=["csv"], accept_multiple_files=True,
+                                          key="batch_import_files")
+        if uploaded_files and st.button("ייבא את כל הקבצים"):
+            if import_uploaded_files(uploaded_files):
+                st.button("רענן את הנתונים")  # הדוח נשאר מוצג עד לרענון הבא
+    
+    if uploaded_file is not None and streaming_mode:
+        if st.button("התחל ייבוא בזרימה"):
+            if import_uploaded_csv_streaming(uploaded_file, chunk_size=int(chunk_size)):
+                st.rerun()
+    elif uploaded_file is not None:
+        new_rows = process_uploaded_csv(uploaded_file)
         
-        if merged_data is not data_converted:  # אם הנתונים השתנו
-            # אפשרות להוריד את הקובץ המשולב
-            csv_merged = merged_data.to_csv(index=False).encode('utf-8')
+        if new_rows is not None and not new_rows.empty:  # אם יש שורות חדשות
+            # אפשרות להוריד את השורות החדשות
+            csv_new_rows = convert_df_to_csv(new_rows)
             download_col1, download_col2 = st.columns(2)
             
             with download_col1:
                 st.download_button(
-                    label="הורד את כל הנתונים (CSV)",
-                    data=csv_merged,
-                    file_name='merged_cashflow_data.csv',
+                    label="הורד את השורות החדשות (CSV)",
+                    data=csv_new_rows,
+                    file_name='new_cashflow_rows.csv',
                     mime='text/csv',
                 )
             
             with download_col2:
                 save_to_source = st.button("שמור נתונים לקובץ המקור ורענן")
                 if save_to_source:
-                    if save_data_to_source(merged_data):
-                        st.rerun() 
\ No newline at end of file
+                    if append_data_to_source(new_rows):
+                        st.rerun()
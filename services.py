@@ -6,7 +6,14 @@ services.py - מודול שירותים עיקריים ל-CashFlowIQ
 - analyze_contract: ניתוח חוזה באמצעות GPT
 - ask_contract_question: מענה לשאלות על החוזה
 - get_exchange_rate: שליפת שערי חליפין בזמן אמת
+- get_exchange_rate_history: שליפת שערי חליפין יומיים לטווח תאריכים
+- forecast_many: חיזוי של סדרות רבות בקריאה אחת (מטריצת סדרה × חודש)
+- fit_forecast_model: התאמת מודל חיזוי מהרשם FORECAST_MODELS (עם מטמון)
 - forecast_cashflow: חיזוי תזרים מזומנים
+- forecast_state / update_forecast_state / forecast_from_state: מצב חיזוי מצטבר שמתעדכן בתנועות שנוספו
+- one_step_residuals: שגיאות חיזוי צעד-אחד של מודל בתוך המדגם
+- simulate_cashflow / simulate_from_state: סימולציית מונטה קרלו של היתרה (רצועות אחוזונים והסתברות לחוסר)
+- backtest_models: בדיקה היסטורית (rolling origin) של כל מודלי החיזוי
 
 כל פונקציה מתועדת ומופרדת באחריותה.
 """
@@ -22,6 +29,10 @@ import requests
 import pandas as pd
 import numpy as np
 from datetime import timedelta
+from collections import OrderedDict
+import hashlib
+import threading
+from concurrent.futures import ProcessPoolExecutor
 import logging
 
 # הגדרת logging
@@ -212,41 +223,678 @@ def get_exchange_rate(base_currency, target_currency):
     # Last fallback: returning None will show error in UI
     return None
 
-def forecast_cashflow(df, periods=12):
+def get_exchange_rate_history(base_currency, target_currency, start_date, end_date):
     """
-    חיזוי תזרים מזומנים על בסיס נתונים היסטוריים.
+    שליפת שערי חליפין יומיים לטווח תאריכים (ימי מסחר בלבד).
+    במקרה של כשל מוחזר השער העדכני (get_exchange_rate) כשער קבוע מתחילת הטווח.
+    :param base_currency: מטבע מקור (למשל 'USD')
+    :param target_currency: מטבע יעד (למשל 'ILS')
+    :param start_date: תאריך התחלה
+    :param end_date: תאריך סיום
+    :return: Series של שערים לפי תאריך (DatetimeIndex ממוין), או None אם אין שער כלל
+    """
+    start = pd.Timestamp(start_date).normalize()
+    if base_currency == target_currency:
+        return pd.Series([1.0], index=pd.DatetimeIndex([start]), name=target_currency)
+    
+    try:
+        url = (f"https://api.frankfurter.app/{start:%Y-%m-%d}..{pd.Timestamp(end_date):%Y-%m-%d}"
+               f"?from={base_currency}&to={target_currency}")
+        response = requests.get(url, timeout=5)
+        if response.status_code == 200:
+            rates = response.json().get('rates', {})
+            history = pd.Series({day: values.get(target_currency) for day, values in rates.items()}, dtype="float64")
+            history = history.dropna()
+            if not history.empty:
+                history.index = pd.to_datetime(history.index)
+                logger.debug(f"Got {len(history)} daily rates from frankfurter.app")
+                return history.sort_index().rename(target_currency)
+    except Exception as e:
+        logger.debug(f"Rate history API error: {e}")
+    
+    rate = get_exchange_rate(base_currency, target_currency)
+    if rate is None:
+        return None
+    return pd.Series([float(rate)], index=pd.DatetimeIndex([start]), name=target_currency)
+
+FORECAST_HISTORY_MONTHS = 6
+
+def monthly_matrix(df, series_col="series"):
+    """
+    סיכום נתונים בפורמט ארוך למטריצה צפופה (סדרה × חודש) של סכומים חודשיים.
+    :param df: DataFrame עם עמודות series_col, 'date' ו-'amount'
+    :param series_col: עמודת מזהה הסדרה
+    :return: dict עם:
+             'series' - מזהי הסדרות (ממוינים), 'months' - PeriodIndex של החודשים,
+             'values' - מטריצת סכומים, 'observed' - מסכת חודשים עם תנועות,
+             'last_date' - התאריך האחרון של כל סדרה
+    """
+    dates = pd.to_datetime(df['date']).to_numpy(dtype='datetime64[ns]')
+    valid = ~np.isnat(dates)
+    codes, series = pd.factorize(df[series_col].to_numpy()[valid], sort=True)
+    dates = dates[valid]
+    amounts = np.nan_to_num(pd.to_numeric(df['amount'], errors='coerce').to_numpy(dtype='float64')[valid])
+    
+    month_ordinals = dates.astype('datetime64[M]').astype(np.int64)
+    first_month = month_ordinals.min() if len(month_ordinals) else 0
+    n_months = int(month_ordinals.max() - first_month + 1) if len(month_ordinals) else 0
+    cells = codes * n_months + (month_ordinals - first_month)
+    size = len(series) * n_months
+    
+    last_date = pd.Series(dates).groupby(codes).max().to_numpy(dtype='datetime64[ns]')
+    return {
+        'series': pd.Index(series),
+        'months': pd.period_range(pd.Period(np.datetime64(int(first_month), 'M'), 'M'), periods=n_months, freq='M'),
+        'values': np.bincount(cells, weights=amounts, minlength=size).reshape(len(series), n_months),
+        'observed': np.bincount(cells, minlength=size).reshape(len(series), n_months) > 0,
+        'last_date': last_date,
+    }
+
+def _fit_baseline(values, observed, history=FORECAST_HISTORY_MONTHS):
+    """
+    ממוצע החודשים האחרונים ועוד מגמה (השינוי הממוצע מהחודש הראשון לאחרון), לכל הסדרות יחד.
+    רק חודשים עם תנועות נספרים, כמו ב-groupby חודשי על התנועות.
+    """
+    rows = np.arange(len(values))
+    counts = observed.sum(axis=1)
+    # דירוג החודשים מהסוף: החודש האחרון עם תנועות מקבל 1
+    rank_from_end = np.cumsum(observed[:, ::-1], axis=1)[:, ::-1]
+    recent = observed & (rank_from_end <= history)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # סדרה ללא חודשים עם תנועות (למשל לפני נקודת חיתוך בבדיקה היסטורית) - רמה 0
+        recent_mean = np.where(counts > 0, (values * recent).sum(axis=1) / recent.sum(axis=1), 0.0)
+        first = values[rows, observed.argmax(axis=1)]
+        last = values[rows, values.shape[1] - 1 - observed[:, ::-1].argmax(axis=1)]
+        trend = np.where(counts > 1, (last - first) / (counts - 1), 0.0)
+    return {'level': recent_mean, 'trend': trend}
+
+def _predict_baseline(state, periods):
+    return state['level'][:, np.newaxis] + state['trend'][:, np.newaxis] * np.arange(1, periods + 1)
+
+def _fit_seasonal_naive(values, observed, season=12):
+    """
+    הערך של אותו חודש בעונה האחרונה. כשיש פחות מעונה מלאה - החודש האחרון חוזר על עצמו.
+    """
+    if values.shape[1] >= season:
+        last_season = values[:, -season:]
+    else:
+        last_season = np.repeat(values[:, -1:] if values.shape[1] else np.zeros((len(values), 1)), season, axis=1)
+    return {'last_season': last_season}
+
+def _predict_seasonal_naive(state, periods):
+    return state['last_season'][:, np.arange(periods) % state['last_season'].shape[1]]
+
+def _fitted_seasonal_naive(values, observed, season=12):
+    """התחזית בתוך המדגם: אותו חודש בעונה הקודמת, או החודש הקודם בעונה הראשונה"""
+    n_months = values.shape[1]
+    fitted = np.full(values.shape, np.nan)
+    first_season = min(season, n_months)
+    fitted[:, 1:first_season] = values[:, :first_season - 1]
+    if n_months > season:
+        fitted[:, season:] = values[:, :-season]
+    return fitted
+
+def _holt_winters_run(values, level, trend, seasonal, start, alpha, beta, gamma, seasonal_model, fitted=None):
+    """
+    רקורסיית ההחלקה מחודש start עד סוף המטריצה. המצב שלפני החודש האחרון נשמר כנקודת ביקורת,
+    כך שהוספת תנועות לחודש האחרון או לחודשים חדשים ממשיכה ממנה (_update_holt_winters).
+    :param fitted: מטריצה (אופציונלית) שמקבלת את תחזית הצעד-האחד של כל חודש לפני עדכונו
+    """
+    n_months = values.shape[1]
+    season = seasonal.shape[1]
+    seasonal = seasonal.copy()
+    checkpoint = None
+    for t in range(start, n_months):
+        if t == n_months - 1:
+            checkpoint = {'level': level, 'trend': trend, 'seasonal': seasonal.copy(), 'month': t}
+        position = t % season
+        if fitted is not None:
+            fitted[:, t] = level + trend + seasonal[:, position]
+        observation = values[:, t]
+        previous_level = level
+        level = alpha * (observation - seasonal[:, position]) + (1 - alpha) * (level + trend)
+        trend = beta * (level - previous_level) + (1 - beta) * trend
+        if seasonal_model:
+            seasonal[:, position] = gamma * (observation - level) + (1 - gamma) * seasonal[:, position]
+    return {'level': level, 'trend': trend, 'seasonal': seasonal, 'next_position': n_months % season,
+            'seasonal_model': seasonal_model, 'checkpoint': checkpoint}
+
+def _fit_holt_winters(values, observed, alpha=0.3, beta=0.1, gamma=0.2, season=12, fitted=None):
+    """
+    Holt-Winters אדיטיבי (ETS(A,A,A)): רמה, מגמה ועונתיות מוחלקות אקספוננציאלית.
+    הרקורסיה רצה על החודשים וכל צעד מעדכן את כל הסדרות יחד.
+    פחות משתי עונות מלאות אינן מספיקות לאתחול העונתיות - אז המודל הוא Holt (רמה ומגמה בלבד).
+    """
+    n_series, n_months = values.shape
+    seasonal_model = n_months >= 2 * season
+    if seasonal_model:
+        level = values[:, :season].mean(axis=1)
+        trend = (values[:, season:2 * season].mean(axis=1) - level) / season
+        seasonal = values[:, :season] - level[:, np.newaxis]
+    else:
+        level = values[:, 0].copy() if n_months else np.zeros(n_series)
+        trend = values[:, 1] - values[:, 0] if n_months > 1 else np.zeros(n_series)
+        seasonal = np.zeros((n_series, season))
+    return _holt_winters_run(values, level, trend, seasonal, 0, alpha, beta, gamma, seasonal_model, fitted)
+
+def _fitted_holt_winters(values, observed, **params):
+    """התחזית בתוך המדגם: תחזית הצעד-האחד של הרקורסיה בכל חודש"""
+    fitted = np.full(values.shape, np.nan)
+    _fit_holt_winters(values, observed, fitted=fitted, **params)
+    return fitted
+
+def _update_holt_winters(state, values, observed, start, alpha=0.3, beta=0.1, gamma=0.2, season=12):
+    """
+    המשך ההחלקה מנקודת הביקורת אחרי שנוספו תנועות מהחודש start ואילך.
+    :return: המצב המעודכן, או None כשהשינוי נוגע בחודשים שלפני נקודת הביקורת או באתחול
+             (אז יש להתאים מחדש)
+    """
+    checkpoint = state['checkpoint']
+    seasonal_model = values.shape[1] >= 2 * season
+    initialized_through = 2 * season if seasonal_model else 2
+    if (checkpoint is None or start < checkpoint['month'] or start < initialized_through or
+            seasonal_model != state['seasonal_model']):
+        return None
+    return _holt_winters_run(values, checkpoint['level'], checkpoint['trend'], checkpoint['seasonal'],
+                             checkpoint['month'], alpha, beta, gamma, seasonal_model)
+
+def _predict_holt_winters(state, periods):
+    steps = np.arange(1, periods + 1)
+    season = state['seasonal'].shape[1]
+    positions = (state['next_position'] + steps - 1) % season
+    return (state['level'][:, np.newaxis] + state['trend'][:, np.newaxis] * steps +
+            state['seasonal'][:, positions])
+
+def _seasonal_design(months, season):
+    """מטריצת תכנון: חותך, מגמה ומשתני דמה לכל חודש בעונה (מלבד הראשון)"""
+    columns = [np.ones(len(months)), months.astype('float64')]
+    columns += [(months % season == position).astype('float64') for position in range(1, season)]
+    return np.column_stack(columns)
+
+def _fit_linear_seasonal(values, observed, season=12):
+    """
+    מגמה לינארית ועונתיות חודשית בריבועים פחותים. מטריצת התכנון משותפת לכל הסדרות,
+    ולכן פתרון אחד (lstsq) מחזיר את המקדמים של כולן.
+    כשאין מספיק חודשים להערכת העונתיות - מגמה לינארית בלבד.
+    """
+    n_months = values.shape[1]
+    if n_months < season + 2:
+        season = 1
+    design = _seasonal_design(np.arange(n_months), season)
+    if n_months == 0:
+        coefficients = np.zeros((len(values), design.shape[1]))
+    else:
+        coefficients = np.linalg.lstsq(design, values.T, rcond=None)[0].T
+    return {'coefficients': coefficients, 'n_months': n_months, 'season': season}
+
+def _predict_linear_seasonal(state, periods):
+    months = np.arange(state['n_months'], state['n_months'] + periods)
+    return state['coefficients'] @ _seasonal_design(months, state['season']).T
+
+def _fitted_linear_seasonal(values, observed, season=12):
+    """התחזית בתוך המדגם: המגמה והעונתיות שהותאמו, בכל חודש"""
+    state = _fit_linear_seasonal(values, observed, season)
+    return state['coefficients'] @ _seasonal_design(np.arange(values.shape[1]), state['season']).T
+
+# רשם מודלי החיזוי: שם -> פונקציית התאמה (מטריצה -> מצב), פונקציית חיזוי (מצב, תקופות -> מטריצה)
+# ופרמטרי ברירת המחדל. מודל חדש נרשם בהוספת רשומה. פונקציית 'update' (אופציונלית) ממשיכה מצב
+# קיים אחרי הוספת תנועות (update_forecast_state); מודל בלעדיה מותאם מחדש ממטריצת הסכומים.
+# פונקציית 'fitted' (אופציונלית) מחזירה את תחזית הצעד-האחד של המודל בתוך המדגם (one_step_residuals).
+FORECAST_MODELS = {
+    'baseline': {'fit': _fit_baseline, 'predict': _predict_baseline,
+                 'params': {'history': FORECAST_HISTORY_MONTHS}},
+    'seasonal_naive': {'fit': _fit_seasonal_naive, 'predict': _predict_seasonal_naive,
+                       'fitted': _fitted_seasonal_naive, 'params': {'season': 12}},
+    'holt_winters': {'fit': _fit_holt_winters, 'predict': _predict_holt_winters, 'update': _update_holt_winters,
+                     'fitted': _fitted_holt_winters, 'params': {'alpha': 0.3, 'beta': 0.1, 'gamma': 0.2, 'season': 12}},
+    'linear_seasonal': {'fit': _fit_linear_seasonal, 'predict': _predict_linear_seasonal,
+                        'fitted': _fitted_linear_seasonal, 'params': {'season': 12}},
+}
+
+FIT_CACHE_SIZE = 32
+
+_fit_cache = OrderedDict()
+_fit_cache_lock = threading.Lock()
+
+def _model_params(model, params):
+    """בדיקת שם המודל והפרמטרים, והשלמת ברירות המחדל"""
+    if model not in FORECAST_MODELS:
+        raise ValueError(f"מודל חיזוי לא מוכר: {model}")
+    defaults = FORECAST_MODELS[model]['params']
+    unknown = set(params) - set(defaults)
+    if unknown:
+        raise ValueError(f"פרמטרים לא מוכרים למודל {model}: {sorted(unknown)}")
+    return {**defaults, **params}
+
+def series_fingerprint(matrix):
+    """מזהה לתוכן מטריצת הסדרות (monthly_matrix) - חלק ממפתח מטמון ההתאמות"""
+    digest = hashlib.blake2b(digest_size=16)
+    values = np.ascontiguousarray(matrix['values'], dtype='float64')
+    digest.update(str(values.shape).encode())
+    digest.update(values.tobytes())
+    digest.update(np.ascontiguousarray(matrix['observed']).tobytes())
+    return digest.hexdigest()
+
+def fit_forecast_model(matrix, model='baseline', **params):
+    """
+    התאמת מודל חיזוי לכל הסדרות במטריצה.
+    ההתאמה נשמרת במטמון LRU לפי (תוכן הסדרות, מודל, פרמטרים), כך שחיזוי חוזר או שינוי
+    אופק החיזוי משתמשים בהתאמה הקיימת.
+    :param matrix: מטריצת הסדרות (monthly_matrix)
+    :param model: שם מודל מתוך FORECAST_MODELS
+    :param params: פרמטרים למודל (דורסים את ברירות המחדל)
+    :return: מצב המודל המותאם (dict של מערכים). המצב השמור משותף - אין לשנות אותו
+    """
+    params = _model_params(model, params)
+    
+    cache_key = (series_fingerprint(matrix), model, tuple(sorted(params.items())))
+    with _fit_cache_lock:
+        if cache_key in _fit_cache:
+            _fit_cache.move_to_end(cache_key)
+            return _fit_cache[cache_key]
+    state = FORECAST_MODELS[model]['fit'](np.asarray(matrix['values'], dtype='float64'), matrix['observed'], **params)
+    with _fit_cache_lock:
+        _fit_cache[cache_key] = state
+        while len(_fit_cache) > FIT_CACHE_SIZE:
+            _fit_cache.popitem(last=False)
+    return state
+
+def predict_forecast_model(state, model, periods):
+    """
+    חיזוי מתוך מצב מודל מותאם (fit_forecast_model).
+    :return: מטריצת תחזית (סדרה × תקופה)
+    """
+    return FORECAST_MODELS[model]['predict'](state, periods)
+
+def _add_months(dates, months):
+    """
+    הוספת חודשים לתאריכים כמו pd.DateOffset(months=...) - יום שחורג מאורך החודש נחתך לסופו.
+    :param dates: מערך datetime64 (לכל סדרה)
+    :param months: מערך מספרי חודשים להוספה (לכל תקופה)
+    :return: מטריצת datetime64 (סדרה × תקופה)
+    """
+    month_start = dates.astype('datetime64[M]')
+    offset = dates - month_start.astype('datetime64[ns]')
+    target = month_start[:, np.newaxis] + months[np.newaxis, :]
+    month_length = ((target + 1).astype('datetime64[D]') - target.astype('datetime64[D]')).astype('timedelta64[ns]')
+    return target.astype('datetime64[ns]') + np.minimum(offset[:, np.newaxis], month_length - np.timedelta64(1, 'D') +
+                                                         (offset[:, np.newaxis] % np.timedelta64(1, 'D')))
+
+def forecast_many(df, periods=12, series_col="series", model='baseline', **params):
+    """
+    חיזוי של סדרות רבות (למשל לפי קטגוריה, סוג או חשבון) בקריאה אחת.
+    כל הסדרות מסוכמות למטריצה צפופה (סדרה × חודש) והתחזית מחושבת בפעולות מערך בלבד.
+    :param df: DataFrame בפורמט ארוך עם עמודות series_col, 'date' ו-'amount'
+    :param periods: מספר תקופות לחיזוי (חודשים קדימה)
+    :param series_col: עמודת מזהה הסדרה
+    :param model: שם מודל מתוך FORECAST_MODELS
+    :param params: פרמטרים למודל
+    :return: DataFrame בפורמט ארוך: series_col, 'step', 'date', 'forecast'
+    """
+    matrix = monthly_matrix(df, series_col)
+    state = fit_forecast_model(matrix, model, **params)
+    return _forecast_frame(matrix, predict_forecast_model(state, model, periods), series_col)
+
+def _forecast_frame(matrix, forecast, series_col):
+    """מטריצת תחזית (סדרה × תקופה) -> DataFrame בפורמט ארוך"""
+    periods = forecast.shape[1]
+    dates = _add_months(matrix['last_date'], np.arange(1, periods + 1))
+    n_series = len(matrix['series'])
+    return pd.DataFrame({
+        series_col: np.repeat(matrix['series'].to_numpy(), periods),
+        'step': np.tile(np.arange(1, periods + 1), n_series),
+        'date': dates.ravel(),
+        'forecast': forecast.ravel(),
+    })
+
+def _single_series(df):
+    """נתוני סדרה אחת בפורמט הארוך של forecast_many"""
+    return pd.DataFrame({'series': 0, 'date': df['date'].to_numpy(), 'amount': df['amount'].to_numpy()})
+
+def forecast_cashflow(df, periods=12, model='baseline', **params):
+    """
+    חיזוי תזרים מזומנים על בסיס נתונים היסטוריים (סדרה אחת - ראו forecast_many).
     :param df: DataFrame עם נתוני תזרים (עמודות: 'date', 'amount')
     :param periods: מספר תקופות לחיזוי (חודשים קדימה)
+    :param model: שם מודל מתוך FORECAST_MODELS
+    :param params: פרמטרים למודל
     :return: DataFrame עם תחזית (עמודות: 'date', 'forecast')
     """
     # בדיקה שהעמודות קיימות
     if 'date' not in df.columns or 'amount' not in df.columns:
         raise ValueError("DataFrame חייב לכלול עמודות 'date' ו-'amount'")
     
-    # המרת תאריכים ומיון
-    df = df.copy()
-    df['date'] = pd.to_datetime(df['date'])
-    df = df.sort_values('date')
+    if pd.to_datetime(df['date']).isna().all():
+        return pd.DataFrame({'date': pd.NaT, 'forecast': np.nan}, index=range(periods))
+    
+    return forecast_many(_single_series(df), periods, model=model, **params)[['date', 'forecast']]
+
+FORECAST_STATE_CACHE_SIZE = 8
+
+_forecast_state_cache = OrderedDict()
+_forecast_state_cache_lock = threading.Lock()
+
+def forecast_state(df, series_col=None, key=None):
+    """
+    מצב חיזוי מצטבר: הסטטיסטיקות המספיקות לכל המודלים - מטריצת הסכומים החודשיים
+    (monthly_matrix) - והמצבים המותאמים של המודלים (רמה, מגמה, עונתיות וכו'), שנוספים
+    בחיזוי הראשון של כל מודל (forecast_from_state). מעבר על התנועות נעשה פעם אחת בלבד;
+    תנועות שנוספות מוחלות ב-update_forecast_state.
+    :param df: DataFrame עם עמודות 'date' ו-'amount' (ו-series_col לכמה סדרות)
+    :param series_col: עמודת מזהה הסדרה (None - סדרה אחת)
+    :param key: מזהה גרסה של df (אופציונלי); עם מזהה המצב נשמר במטמון LRU לפיו
+    :return: dict עם 'matrix', 'fits', 'residuals' (שאריות המודלים לסימולציה) ו-'series_col'
+    """
+    def build():
+        if series_col is None and ('date' not in df.columns or 'amount' not in df.columns):
+            raise ValueError("DataFrame חייב לכלול עמודות 'date' ו-'amount'")
+        frame = _single_series(df) if series_col is None else df
+        return {'matrix': monthly_matrix(frame, series_col or 'series'), 'fits': {}, 'residuals': {},
+                'series_col': series_col}
+    
+    if key is None:
+        return build()
+    cache_key = (key, series_col)
+    with _forecast_state_cache_lock:
+        if cache_key in _forecast_state_cache:
+            _forecast_state_cache.move_to_end(cache_key)
+            return _forecast_state_cache[cache_key]
+    state = build()
+    with _forecast_state_cache_lock:
+        _forecast_state_cache[cache_key] = state
+        while len(_forecast_state_cache) > FORECAST_STATE_CACHE_SIZE:
+            _forecast_state_cache.popitem(last=False)
+    return state
+
+def _extend_matrix(matrix, added):
+    """
+    הוספת מטריצת סכומים של תנועות חדשות למטריצה קיימת (הרחבה לסדרות ולחודשים חדשים לפי הצורך).
+    :return: (המטריצה המעודכנת, החודש הראשון שהשתנה - או 0 כשמיקום הסדרות או החודשים הקיימים זז)
+    """
+    if len(matrix['series']) == 0:
+        return added, 0
+    series = matrix['series'].union(added['series'])
+    months = pd.period_range(min(matrix['months'][0], added['months'][0]),
+                             max(matrix['months'][-1], added['months'][-1]), freq='M')
+    old_rows, new_rows = series.get_indexer(matrix['series']), series.get_indexer(added['series'])
+    old_start, new_start = months.get_loc(matrix['months'][0]), months.get_loc(added['months'][0])
+    old_cells = np.ix_(old_rows, old_start + np.arange(len(matrix['months'])))
+    new_cells = np.ix_(new_rows, new_start + np.arange(len(added['months'])))
+    
+    values = np.zeros((len(series), len(months)))
+    values[old_cells] = matrix['values']
+    values[new_cells] += added['values']
+    observed = np.zeros(values.shape, dtype=bool)
+    observed[old_cells] = matrix['observed']
+    observed[new_cells] |= added['observed']
+    last_date = np.full(len(series), np.datetime64('NaT'), dtype='datetime64[ns]')
+    last_date[old_rows] = matrix['last_date']
+    last_date[new_rows] = np.fmax(last_date[new_rows], added['last_date'])
     
-    # חישוב ממוצע נע
-    avg_monthly = df.groupby(df['date'].dt.to_period('M'))['amount'].sum()
-    last_6_months_avg = avg_monthly.tail(6).mean()
+    shifted = len(series) != len(matrix['series']) or old_start != 0
+    extended = {'series': series, 'months': months, 'values': values, 'observed': observed, 'last_date': last_date}
+    return extended, 0 if shifted else new_start
+
+def update_forecast_state(state, new_rows):
+    """
+    עדכון מצטבר של מצב החיזוי בתנועות שנוספו: רק השורות החדשות מסוכמות (O(שורות חדשות)),
+    ומודלים עם פונקציית 'update' ממשיכים מנקודת הביקורת שלהם כשהשינוי נוגע רק בחודש
+    האחרון ואילך. מודלים אחרים מותאמים מחדש ממטריצת הסכומים בחיזוי הבא (ללא מעבר על התנועות).
+    :param state: מצב קיים (forecast_state)
+    :param new_rows: התנועות שנוספו, באותו מבנה כמו הנתונים המקוריים
+    :return: מצב חדש (המצב הקיים לא משתנה)
+    """
+    series_col = state['series_col']
+    frame = _single_series(new_rows) if series_col is None else new_rows
+    added = monthly_matrix(frame, series_col or 'series')
+    if len(added['series']) == 0:
+        return state
+    matrix, start = _extend_matrix(state['matrix'], added)
     
-    # קו מגמה פשוט - לוקח את השינוי הממוצע לחודש
-    if len(avg_monthly) > 1:
-        trend = (avg_monthly.iloc[-1] - avg_monthly.iloc[0]) / (len(avg_monthly) - 1)
+    fits = {}
+    if start > 0:
+        for (model, params), fitted in state['fits'].items():
+            update = FORECAST_MODELS[model].get('update')
+            updated = update(fitted, matrix['values'], matrix['observed'], start, **dict(params)) if update else None
+            if updated is not None:
+                fits[(model, params)] = updated
+    return {'matrix': matrix, 'fits': fits, 'residuals': {}, 'series_col': series_col}
+
+def forecast_from_state(state, periods=12, model='baseline', **params):
+    """
+    חיזוי ממצב חיזוי מצטבר. ההתאמה של כל (מודל, פרמטרים) נשמרת במצב, כך ששינוי אופק החיזוי
+    או חיזוי חוזר מריצים רק את פונקציית החיזוי.
+    :param state: מצב החיזוי (forecast_state / update_forecast_state)
+    :return: כמו forecast_cashflow לסדרה אחת, וכמו forecast_many כשהמצב נבנה עם series_col
+    """
+    params = _model_params(model, params)
+    matrix, series_col = state['matrix'], state['series_col']
+    if series_col is None and len(matrix['series']) == 0:
+        return pd.DataFrame({'date': pd.NaT, 'forecast': np.nan}, index=range(periods))
+    
+    fit_key = (model, tuple(sorted(params.items())))
+    fitted = state['fits'].get(fit_key)
+    if fitted is None:
+        fitted = FORECAST_MODELS[model]['fit'](matrix['values'], matrix['observed'], **params)
+        state['fits'][fit_key] = fitted
+    forecast = _forecast_frame(matrix, predict_forecast_model(fitted, model, periods), series_col or 'series')
+    return forecast[['date', 'forecast']] if series_col is None else forecast
+
+SIMULATION_PATHS = 5_000
+SIMULATION_CHUNK_PATHS = 50_000
+SIMULATION_PERCENTILES = (5, 25, 50, 75, 95)
+SIMULATION_METHODS = ('residuals', 'bootstrap')
+
+def _simulate_chunk(job):
+    """
+    מסלולי יתרה לקבוצת מסלולים אחת (רץ בתהליך נפרד כשיש הרבה מסלולים).
+    :param job: (SeedSequence, מספר מסלולים, מאגר הדגימה, מרכז לכל תקופה, יתרת פתיחה)
+    :return: מטריצת יתרות (מסלול × תקופה)
+    """
+    seed, n_paths, pool, center, opening_balance = job
+    rng = np.random.default_rng(seed)
+    flows = center + pool[rng.integers(0, len(pool), size=(n_paths, len(center)))]
+    return opening_balance + np.cumsum(flows, axis=1)
+
+def one_step_residuals(matrix, model='baseline', min_train=FORECAST_HISTORY_MONTHS, **params):
+    """
+    שאריות המודל בתוך המדגם: הסכום בפועל פחות תחזית הצעד-האחד של המודל המותאם בכל חודש.
+    כך השאריות הן מה שהמודל הנבחר לא מסביר, ולא מגמה או עונתיות שהוא כבר חוזה.
+    מודל עם פונקציית 'fitted' מחזיר את התחזית בתוך המדגם ישירות; לאחרים המודל מותאם
+    בכל חודש לחודשים שלפניו (החל מ-min_train).
+    :param matrix: מטריצת הסדרות (monthly_matrix)
+    :param model: שם מודל מתוך FORECAST_MODELS
+    :param min_train: מספר החודשים שלפני השארית הראשונה בהתאמה המתגלגלת
+    :return: מטריצת שאריות (סדרה × חודש), NaN בחודשים ללא תנועות או ללא תחזית
+    """
+    spec = FORECAST_MODELS[model]
+    params = _model_params(model, params)
+    values, observed = matrix['values'], matrix['observed']
+    if 'fitted' in spec:
+        fitted = spec['fitted'](values, observed, **params)
     else:
-        trend = 0
+        fitted = np.full(values.shape, np.nan)
+        for t in range(max(1, min(min_train, values.shape[1] - 1)), values.shape[1]):
+            fitted[:, t] = spec['predict'](spec['fit'](values[:, :t], observed[:, :t], **params), 1)[:, 0]
+    return np.where(observed, values - fitted, np.nan)
+
+def simulate_cashflow(df, periods=12, opening_balance=0.0, n_paths=SIMULATION_PATHS, method='residuals',
+                      model='baseline', seed=0, threshold=0.0, percentiles=SIMULATION_PERCENTILES,
+                      max_workers=None, **params):
+    """
+    סימולציית מונטה קרלו של התזרים החודשי והיתרה, על בסיס forecast_cashflow.
+    כל התזרימים נדגמים למטריצה אחת (מסלול × תקופה) והיתרות הן סכום מצטבר שלה.
+    :param df: DataFrame עם נתוני תזרים (עמודות: 'date', 'amount')
+    :param periods: מספר תקופות לחיזוי (חודשים קדימה)
+    :param opening_balance: היתרה שממנה המסלולים מתחילים
+    :param n_paths: מספר המסלולים
+    :param method: 'residuals' - התחזית ועוד שארית מדוגמת של המודל (one_step_residuals);
+                   'bootstrap' - תזרים חודשי היסטורי מדוגם כפי שהוא
+    :param model: שם מודל מתוך FORECAST_MODELS (לשיטת 'residuals')
+    :param seed: זרע לדגימה - אותו זרע נותן אותה תוצאה בכל מספר תהליכים
+    :param threshold: יתרה שמתחתיה נחשב חוסר
+    :param percentiles: האחוזונים לרצועות
+    :param max_workers: מספר תהליכים מרבי (ברירת מחדל: מספר המעבדים); 1 - ללא מקביליות.
+                        מאגר תהליכים משמש רק כשיש יותר מקבוצת מסלולים אחת (SIMULATION_CHUNK_PATHS)
+    :param params: פרמטרים למודל
+    :return: dict עם:
+             'bands' - DataFrame: 'date', 'forecast', עמודת p<q> לכל אחוזון ו-'shortfall'
+                       (ההסתברות שהיתרה ירדה מתחת לסף עד אותה תקופה),
+             'shortfall_probability' - ההסתברות לחוסר בתוך האופק כולו
+    """
+    return simulate_from_state(forecast_state(df), periods, opening_balance, n_paths, method, model, seed,
+                               threshold, percentiles, max_workers, **params)
+
+def simulate_from_state(state, periods=12, opening_balance=0.0, n_paths=SIMULATION_PATHS, method='residuals',
+                        model='baseline', seed=0, threshold=0.0, percentiles=SIMULATION_PERCENTILES,
+                        max_workers=None, **params):
+    """
+    סימולציית מונטה קרלו ממצב חיזוי מצטבר של סדרה אחת (forecast_state) - ראו simulate_cashflow.
+    התחזית וההתאמה נלקחות מהמצב, והשאריות של כל (מודל, פרמטרים) נשמרות בו.
+    """
+    if method not in SIMULATION_METHODS:
+        raise ValueError(f"שיטת סימולציה לא מוכרת: {method}")
+    forecast = forecast_from_state(state, periods, model, **params)
     
-    # חיזוי - ממוצע אחרון + מגמה
-    last_date = df['date'].max()
-    forecast_dates = [last_date + pd.DateOffset(months=i+1) for i in range(periods)]
-    forecast_values = [last_6_months_avg + trend * (i+1) for i in range(periods)]
+    matrix = state['matrix']
+    history = matrix['values'].ravel()
+    if len(history) == 0 or forecast['forecast'].isna().all():
+        bands = forecast.assign(**{f'p{q}': np.nan for q in percentiles}, shortfall=np.nan)
+        return {'bands': bands, 'shortfall_probability': np.nan}
+    if method == 'residuals':
+        residuals_key = (model, tuple(sorted(_model_params(model, params).items())))
+        if residuals_key not in state['residuals']:
+            residuals = one_step_residuals(matrix, model, **params)
+            state['residuals'][residuals_key] = residuals[~np.isnan(residuals)]
+        pool = state['residuals'][residuals_key]
+        if len(pool) == 0:
+            pool = np.zeros(1)  # פחות משני חודשים - אין שאריות, הרצועות הן התחזית עצמה
+        center = forecast['forecast'].to_numpy(dtype='float64')
+    else:
+        pool, center = history, np.zeros(periods)
     
-    # יצירת DataFrame עם התחזית
-    result = pd.DataFrame({
-        'date': forecast_dates,
-        'forecast': forecast_values
-    })
+    # חלוקה קבועה לקבוצות וזרע לכל קבוצה מ-SeedSequence: התוצאה לא תלויה במספר התהליכים
+    sizes = np.diff(np.append(np.arange(0, n_paths, SIMULATION_CHUNK_PATHS), n_paths))
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    jobs = [(chunk_seed, int(size), pool, center, float(opening_balance)) for chunk_seed, size in zip(seeds, sizes)]
+    workers = min(len(jobs), max_workers or os.cpu_count() or 1)
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            balances = np.concatenate(list(executor.map(_simulate_chunk, jobs)))
+    else:
+        balances = np.concatenate([_simulate_chunk(job) for job in jobs])
+    
+    shortfall = (np.minimum.accumulate(balances, axis=1) < threshold).mean(axis=0)
+    bands = forecast.copy()
+    for q, band in zip(percentiles, np.percentile(balances, percentiles, axis=0)):
+        bands[f'p{q}'] = band
+    bands['shortfall'] = shortfall
+    return {'bands': bands, 'shortfall_probability': float(shortfall[-1])}
+
+BACKTEST_HORIZON = 3
+BACKTEST_MIN_TRAIN_MONTHS = 6
+BACKTEST_ORIGIN_CHUNK = 12
+BACKTEST_SERIES_CHUNK = 2_000
+BACKTEST_CACHE_SIZE = 8
+
+_backtest_cache = OrderedDict()
+_backtest_cache_lock = threading.Lock()
+
+def _backtest_chunk(job):
+    """
+    סכומי שגיאות לקבוצת נקודות חיתוך ולקבוצת סדרות (רץ בתהליך נפרד כשיש כמה קבוצות).
+    :param job: (ערכים, מסכת חודשים עם תנועות, נקודות חיתוך, אופק, מודלים)
+    :return: מערך (מודל × צעד × 5): סכום |שגיאה|, סכום |שגיאה|/|ערך|, מספר ערכים שונים מאפס,
+             סכום שגיאה (תחזית פחות ערך), מספר תחזיות
+    """
+    values, observed, origins, horizon, models = job
+    sums = np.zeros((len(models), horizon, 5))
+    for origin in origins:
+        # סדרה שעוד לא התחילה בנקודת החיתוך אינה נחזית ואינה נספרת בה
+        started = observed[:, :origin].any(axis=1)
+        actual = values[started, origin:origin + horizon]
+        nonzero = actual != 0
+        for index, model in enumerate(models):
+            spec = FORECAST_MODELS[model]
+            state = spec['fit'](values[started, :origin], observed[started, :origin], **spec['params'])
+            error = spec['predict'](state, horizon) - actual
+            with np.errstate(invalid='ignore', divide='ignore'):
+                relative = np.where(nonzero, np.abs(error) / np.abs(actual), 0.0)
+            sums[index, :, 0] += np.abs(error).sum(axis=0)
+            sums[index, :, 1] += relative.sum(axis=0)
+            sums[index, :, 2] += nonzero.sum(axis=0)
+            sums[index, :, 3] += error.sum(axis=0)
+            sums[index, :, 4] += len(actual)
+    return sums
+
+def _backtest_scores(sums, index):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return pd.DataFrame({
+            'mae': sums[..., 0] / sums[..., 4],
+            'mape': 100 * sums[..., 1] / sums[..., 2],
+            'bias': sums[..., 3] / sums[..., 4],
+            'count': sums[..., 4].astype(np.int64),
+        }, index=index)
+
+def _run_backtest(df, horizon, series_col, models, min_train, step, max_workers):
+    if series_col is None:
+        df, series_col = _single_series(df), 'series'
+    matrix = monthly_matrix(df, series_col)
+    values, observed = matrix['values'], matrix['observed']
+    origins = np.arange(min_train, values.shape[1] - horizon + 1, step)
+    
+    series_chunks = [slice(start, start + BACKTEST_SERIES_CHUNK) for start in range(0, len(values), BACKTEST_SERIES_CHUNK)]
+    origin_chunks = [origins[start:start + BACKTEST_ORIGIN_CHUNK] for start in range(0, len(origins), BACKTEST_ORIGIN_CHUNK)]
+    jobs = [(values[rows], observed[rows], chunk, horizon, models) for rows in series_chunks for chunk in origin_chunks]
+    workers = min(len(jobs), max_workers or os.cpu_count() or 1)
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_backtest_chunk, jobs))
+    else:
+        results = [_backtest_chunk(job) for job in jobs]
+    sums = np.sum(results, axis=0) if results else np.zeros((len(models), horizon, 5))
+    
+    by_step = _backtest_scores(sums.reshape(-1, 5), pd.MultiIndex.from_product(
+        [list(models), range(1, horizon + 1)], names=['model', 'step']))
+    scores = _backtest_scores(sums.sum(axis=1), pd.Index(list(models), name='model'))
+    return {'scores': scores.sort_values('mae', kind='mergesort'), 'by_step': by_step, 'origins': len(origins)}
+
+def backtest_models(df, horizon=BACKTEST_HORIZON, series_col=None, models=None, min_train=BACKTEST_MIN_TRAIN_MONTHS,
+                    step=1, max_workers=None, key=None):
+    """
+    בדיקה היסטורית של מודלי החיזוי בנקודות חיתוך מתגלגלות: בכל חודש חיתוך כל מודל מותאם
+    לחודשים שלפניו וחוזה horizon חודשים קדימה, והתחזית מושווית לסכומים בפועל.
+    סדרות שאין להן תנועות לפני חודש החיתוך אינן נכללות בו.
+    :param df: DataFrame עם עמודות 'date' ו-'amount' (ו-series_col לכמה סדרות)
+    :param horizon: מספר החודשים קדימה בכל חיתוך
+    :param series_col: עמודת מזהה הסדרה (None - סדרה אחת)
+    :param models: שמות מודלים מתוך FORECAST_MODELS (ברירת מחדל: כולם), עם פרמטרי ברירת המחדל
+    :param min_train: מספר החודשים המינימלי לפני החיתוך הראשון
+    :param step: מספר החודשים בין נקודות חיתוך
+    :param max_workers: מספר תהליכים מרבי (ברירת מחדל: מספר המעבדים); 1 - ללא מקביליות.
+                        נקודות החיתוך והסדרות מחולקות לקבוצות (BACKTEST_ORIGIN_CHUNK, BACKTEST_SERIES_CHUNK)
+                        שרצות במאגר תהליכים כשיש יותר מקבוצה אחת
+    :param key: מזהה גרסה של df (למשל attrs['ledger_version']); ללא מזהה אין שמירה במטמון
+    :return: dict עם:
+             'scores' - DataFrame לפי מודל (ממוין לפי MAE): 'mae', 'mape' (באחוזים, על חודשים
+                        שהסכום בהם שונה מאפס), 'bias' (תחזית פחות בפועל) ו-'count',
+             'by_step' - אותם מדדים לפי (מודל, צעד), 'origins' - מספר נקודות החיתוך
+    """
+    models = tuple(FORECAST_MODELS) if models is None else tuple(models)
+    unknown = set(models) - set(FORECAST_MODELS)
+    if unknown:
+        raise ValueError(f"מודל חיזוי לא מוכר: {sorted(unknown)}")
     
+    cache_key = (key, horizon, series_col, models, min_train, step)
+    if key is not None:
+        with _backtest_cache_lock:
+            if cache_key in _backtest_cache:
+                _backtest_cache.move_to_end(cache_key)
+                return _backtest_cache[cache_key]
+    result = _run_backtest(df, horizon, series_col, models, min_train, step, max_workers)
+    if key is not None:
+        with _backtest_cache_lock:
+            _backtest_cache[cache_key] = result
+            while len(_backtest_cache) > BACKTEST_CACHE_SIZE:
+                _backtest_cache.popitem(last=False)
     return result
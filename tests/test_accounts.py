@@ -0,0 +1,37 @@
+"""
+tests/test_accounts.py - בדיקות יחידה ליתרות הפתיחה של החשבונות
+"""
+import unittest
+import tempfile
+import shutil
+import sys
+import os
+
+# הוספת הנתיב של הפרויקט
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data.accounts import load_opening_balances, save_opening_balances
+from data.schema import DEFAULT_ACCOUNT
+from data.statement import INITIAL_BALANCE
+
+class TestOpeningBalances(unittest.TestCase):
+    """בדיקות לשמירה ולקריאה של יתרות הפתיחה"""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_default_account_starts_at_initial_balance(self):
+        """בדיקה שללא הגדרה רק לחשבון ברירת המחדל יש יתרת פתיחה"""
+        self.assertEqual(load_opening_balances(self.root), {DEFAULT_ACCOUNT: INITIAL_BALANCE})
+
+    def test_roundtrip(self):
+        """בדיקה שיתרות שנשמרו נקראות בחזרה ודורסות את ברירת המחדל"""
+        save_opening_balances({DEFAULT_ACCOUNT: 5000, 'Visa': -250.5}, self.root)
+
+        self.assertEqual(load_opening_balances(self.root), {DEFAULT_ACCOUNT: 5000.0, 'Visa': -250.5})
+
+if __name__ == '__main__':
+    unittest.main()
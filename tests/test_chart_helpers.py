@@ -0,0 +1,102 @@
+"""
+tests/test_chart_helpers.py - בדיקות יחידה למטמון הגרפים
+"""
+import unittest
+from unittest import mock
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+import sys
+import os
+
+# הוספת הנתיב של הפרויקט
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ui import chart_helpers
+from ui.chart_helpers import chart_fingerprint, render_chart, downsample, lttb_indices, point_budget
+
+calls = []
+
+def draw_line(ax, series):
+    calls.append(len(series))
+    ax.plot(series.to_numpy())
+
+def draw_broken(ax, series):
+    raise ValueError("broken")
+
+class TestChartCache(unittest.TestCase):
+    """בדיקות לרינדור הגרפים ולמטמון"""
+
+    def setUp(self):
+        chart_helpers._chart_cache.clear()
+        calls.clear()
+        self.series = pd.Series([1.0, 3.0, 2.0], index=pd.period_range('2024-01', periods=3, freq='M'))
+
+    def test_identical_chart_is_rendered_once(self):
+        """בדיקה שגרף זהה מוחזר מהמטמון ושהפיגורה נסגרת"""
+        first = render_chart(draw_line, self.series)
+        second = render_chart(draw_line, self.series.copy())
+
+        self.assertTrue(first.startswith(b'\x89PNG'))
+        self.assertIs(first, second)
+        self.assertEqual(calls, [3])
+        self.assertEqual(plt.get_fignums(), [])
+
+    def test_fingerprint_depends_on_values_and_size(self):
+        """בדיקה ששינוי בנתונים או בגודל יוצר גרף חדש"""
+        changed = self.series.copy()
+        changed.iloc[0] = 5.0
+
+        self.assertNotEqual(chart_fingerprint(self.series), chart_fingerprint(changed))
+        render_chart(draw_line, self.series)
+        render_chart(draw_line, self.series, width=6)
+        self.assertEqual(len(calls), 2)
+
+    def test_figure_is_closed_on_error(self):
+        """בדיקה שהפיגורה משוחררת גם כשהציור נכשל"""
+        with self.assertRaises(ValueError):
+            render_chart(draw_broken, self.series)
+        self.assertEqual(plt.get_fignums(), [])
+
+    def test_cache_is_bounded(self):
+        """בדיקה שהמטמון מפנה את הגרפים הישנים ביותר"""
+        with mock.patch.object(chart_helpers, 'CHART_CACHE_SIZE', 4):
+            for i in range(7):
+                render_chart(draw_line, self.series + i, dpi=10)
+
+            self.assertEqual(len(chart_helpers._chart_cache), 4)
+
+class TestDownsample(unittest.TestCase):
+    """בדיקות להקטנת סדרות זמן לציור"""
+
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        index = pd.date_range('2015-01-01', periods=5000, freq='D')
+        self.balance = pd.DataFrame({'Balance': np.cumsum(rng.normal(0, 100, len(index)))}, index=index)
+
+    def test_budget_and_extremes(self):
+        """בדיקה שהסדרה מוקטנת לתקציב הנקודות ושומרת על הקצוות, השיא והשפל"""
+        reduced = downsample(self.balance, 400, column='Balance')
+
+        self.assertLessEqual(len(reduced), 402)
+        self.assertTrue(reduced.index.is_monotonic_increasing)
+        self.assertEqual(reduced.index[0], self.balance.index[0])
+        self.assertEqual(reduced.index[-1], self.balance.index[-1])
+        self.assertEqual(reduced['Balance'].max(), self.balance['Balance'].max())
+        self.assertEqual(reduced['Balance'].min(), self.balance['Balance'].min())
+
+    def test_short_series_unchanged(self):
+        """בדיקה שסדרה קצרה מהתקציב אינה משתנה"""
+        short = self.balance.iloc[:100]
+        self.assertIs(downsample(short, point_budget(4), column='Balance'), short)
+
+    def test_lttb_keeps_spike(self):
+        """בדיקה שקפיצה בודדת נבחרת בדלי שלה"""
+        y = np.zeros(1000)
+        y[500] = 10.0
+        self.assertIn(500, lttb_indices(np.arange(1000, dtype=float), y, 50))
+
+if __name__ == '__main__':
+    unittest.main()
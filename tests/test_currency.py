@@ -0,0 +1,71 @@
+"""
+tests/test_currency.py - בדיקות יחידה להמרת המטבע לפי תנועה
+"""
+import unittest
+import numpy as np
+import pandas as pd
+import sys
+import os
+
+# הוספת הנתיב של הפרויקט
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data import currency
+from data.currency import rate_table, conversion_rates, convert_frame, convert_rollups
+from data.rollups import build_rollups
+from data.schema import apply_ledger_schema
+
+class TestCurrencyConversion(unittest.TestCase):
+    """בדיקות לשיוך שער לכל שורה ולמטמון ההמרה"""
+
+    def setUp(self):
+        self.rates = rate_table({
+            'EUR': pd.Series([1.1, 1.2], index=pd.to_datetime(['2024-01-02', '2024-01-05'])),
+            'USD': pd.Series([1.0], index=pd.to_datetime(['2024-01-01'])),
+        })
+        self.ledger = apply_ledger_schema(pd.DataFrame({
+            'date': ['2024-01-01', '2024-01-03', '2024-01-06', '2024-01-06'],
+            'amount': [10.0, 10.0, 10.0, -20.0],
+            'currency': ['EUR', 'EUR', None, 'EUR'],
+        }))
+        currency._conversion_cache.clear()
+
+    def test_rate_per_day_and_currency(self):
+        """בדיקה שכל שורה מקבלת את השער האחרון הידוע של המטבע שלה, ושורה ללא מטבע - את שער הבסיס"""
+        rates = conversion_rates(self.ledger, self.rates, 'USD')
+
+        np.testing.assert_allclose(rates, [1.1, 1.1, 1.0, 1.2])
+
+    def test_unknown_currency_has_no_rate(self):
+        """בדיקה שמטבע ללא שער אינו מומר בשער שגוי"""
+        ledger = self.ledger.assign(currency=pd.Categorical(['GBP', 'EUR', None, 'EUR']))
+
+        self.assertTrue(np.isnan(conversion_rates(ledger, self.rates, 'USD')[0]))
+
+    def test_converted_frame_is_cached_per_target(self):
+        """בדיקה שההמרה נשמרת לפי גרסה ומטבע יעד, ושהמקור אינו משתנה"""
+        converted = convert_frame(self.ledger, self.rates, 'USD', 'USD', key='v1')
+
+        self.assertEqual(list(converted['amount']), [11.0, 11.0, 10.0, -24.0])
+        self.assertEqual(set(converted['currency']), {'USD'})
+        self.assertIs(convert_frame(self.ledger, self.rates, 'USD', 'USD', key='v1'), converted)
+        self.assertEqual(list(self.ledger['amount']), [10.0, 10.0, 10.0, -20.0])
+
+    def test_same_currency_is_not_copied(self):
+        """בדיקה שכאשר כל השערים הם 1 מוחזרים הנתונים עצמם"""
+        ledger = self.ledger.assign(currency=pd.Categorical([None] * 4))
+
+        self.assertIs(convert_frame(ledger, self.rates, 'USD', 'USD'), ledger)
+
+    def test_rollups_match_converted_ledger(self):
+        """בדיקה שהמרת הסיכומים זהה לבניית סיכומים מספר תנועות מומר"""
+        rollups = convert_rollups(build_rollups(self.ledger), self.rates, 'USD', 'USD')
+        expected = build_rollups(convert_frame(self.ledger, self.rates, 'USD', 'USD'))
+
+        for name in ('daily', 'monthly'):
+            self.assertAlmostEqual(rollups[name]['amount'].sum(), expected[name]['amount'].sum())
+            self.assertAlmostEqual(rollups[name]['outflows'].sum(), 24.0)
+        self.assertEqual(len(rollups['monthly']), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,7 +2,12 @@
 tests/test_data_loader.py - בדיקות יחידה למודול data_loader
 """
 import unittest
+from unittest import mock
+import numpy as np
 import pandas as pd
+import io
+import tempfile
+import shutil
 import sys
 import os
 from datetime import datetime
@@ -10,11 +15,21 @@ from datetime import datetime
 # הוספת הנתיב של הפרויקט
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from data import ledger_store
+from data import data_loader
+from data.schema import index_by_date
 from data.data_loader import (
+    filter_data,
     filter_data_by_date_range,
     filter_data_by_categories,
-    filter_data_by_types
+    filter_data_by_types,
+    filter_data_by_accounts,
+    stream_csv_to_ledger,
+    import_files,
+    ledger_rollups,
+    ledger_forecast_state
 )
+from data.schema import apply_ledger_schema
 
 class TestDataLoader(unittest.TestCase):
     """בדיקות למודול data_loader"""
@@ -41,6 +56,32 @@ class TestDataLoader(unittest.TestCase):
         self.assertTrue(all(filtered['date'] >= pd.Timestamp(start_date)))
         self.assertTrue(all(filtered['date'] <= pd.Timestamp(end_date)))
     
+    def test_filter_by_date_range_does_not_mutate(self):
+        """בדיקה שהסינון אינו משנה את הנתונים המקוריים"""
+        data = self.test_data.assign(date=self.test_data['date'].dt.strftime('%Y-%m-%d'))
+        
+        filter_data_by_date_range(data, [datetime(2024, 1, 3).date(), datetime(2024, 1, 7).date()])
+        
+        self.assertEqual(data['date'].dtype, object)
+    
+    def test_filter_by_date_range_on_date_index(self):
+        """בדיקה שסינון על אינדקס תאריכים ממוין מחזיר חיתוך זהה ללא העתקה"""
+        # נתונים לא ממוינים עם תאריכים כפולים
+        shuffled = self.test_data.sample(frac=1, random_state=1)
+        shuffled = pd.concat([shuffled, shuffled.head(3)])
+        indexed = index_by_date(shuffled)
+        start_date = datetime(2024, 1, 3).date()
+        end_date = datetime(2024, 1, 7).date()
+        
+        filtered = filter_data_by_date_range(indexed, [start_date, end_date])
+        expected = filter_data_by_date_range(shuffled.reset_index(drop=True), [start_date, end_date])
+        
+        self.assertEqual(len(filtered), len(expected))
+        self.assertTrue(filtered['date'].is_monotonic_increasing)
+        self.assertTrue(all(filtered['date'] >= pd.Timestamp(start_date)))
+        self.assertTrue(all(filtered['date'] <= pd.Timestamp(end_date)))
+        self.assertTrue(np.shares_memory(filtered['amount'].to_numpy(), indexed['amount'].to_numpy()))
+    
     def test_filter_by_categories(self):
         """בדיקת סינון לפי קטגוריות"""
         filtered = filter_data_by_categories(self.test_data, ['Income'])
@@ -79,5 +120,250 @@ class TestDataLoader(unittest.TestCase):
         self.assertTrue(all(filtered['type'] == 'Sale'))
         self.assertTrue(all(filtered['category'] == 'Income'))
 
+class TestFilterPlan(unittest.TestCase):
+    """בדיקות לסינון המשולב ולמטמון שלו"""
+    
+    def setUp(self):
+        self.test_data = index_by_date(pd.DataFrame({
+            'date': pd.date_range(start='2024-01-01', periods=10, freq='D'),
+            'amount': [100, -50, 200, -75, 150, -100, 300, -125, 250, -80],
+            'category': ['Income', 'Expense'] * 5,
+            'type': ['Sale', 'Material', 'Service', 'Utility', 'Sale',
+                    'Material', 'Service', 'Salary', 'Sale', 'Utility']
+        }))
+        self.date_range = [datetime(2024, 1, 1).date(), datetime(2024, 1, 5).date()]
+        data_loader._filter_cache.clear()
+    
+    def test_matches_chained_filters(self):
+        """בדיקה שהסינון המשולב זהה לשרשור המסננים הנפרדים"""
+        fused = filter_data(self.test_data, self.date_range, ['Income'], ['Sale'])
+        
+        chained = filter_data_by_date_range(self.test_data, self.date_range)
+        chained = filter_data_by_categories(chained, ['Income'])
+        chained = filter_data_by_types(chained, ['Sale'])
+        
+        pd.testing.assert_frame_equal(fused, chained)
+    
+    def test_account_filter(self):
+        """בדיקה שסינון לפי חשבון משתלב במסכה המשולבת"""
+        data = self.test_data.assign(account=['Main', 'Visa'] * 5)
+        
+        fused = filter_data(data, self.date_range, ['Income'], accounts=['Main'])
+        chained = filter_data_by_accounts(filter_data(data, self.date_range, ['Income']), ['Main'])
+        
+        pd.testing.assert_frame_equal(fused, chained)
+        self.assertEqual(len(fused), 3)
+    
+    def test_memoized_by_version_and_spec(self):
+        """בדיקה שאותה גרסה ואותו מפרט מחזירים את התוצאה השמורה"""
+        first = filter_data(self.test_data, self.date_range, ['Income'], [], version='v1')
+        again = filter_data(self.test_data, tuple(self.date_range), ['Income'], None, version='v1')
+        other_version = filter_data(self.test_data, self.date_range, ['Income'], [], version='v2')
+        
+        self.assertIs(first, again)
+        self.assertIsNot(first, other_version)
+    
+    def test_cache_is_bounded(self):
+        """בדיקה שהמטמון מפנה את הרשומות הישנות ביותר"""
+        for i in range(data_loader.FILTER_CACHE_SIZE + 5):
+            filter_data(self.test_data, version=f'v{i}')
+        
+        self.assertEqual(len(data_loader._filter_cache), data_loader.FILTER_CACHE_SIZE)
+        self.assertNotIn(('v0', data_loader._filter_spec(None, None, None)), data_loader._filter_cache)
+    
+    def test_cache_is_bounded_by_size(self):
+        """בדיקה שסך התוצאות השמורות לא עולה על FILTER_CACHE_LEDGER_MULTIPLE פעמים גודל הנתונים"""
+        ledger_bytes = data_loader._frame_bytes(self.test_data)
+        for i in range(10):
+            filter_data(self.test_data, self.date_range, version=f'v{i}')
+        
+        cached = sum(entry[1] for entry in data_loader._filter_cache.values())
+        self.assertLessEqual(cached, data_loader.FILTER_CACHE_LEDGER_MULTIPLE * ledger_bytes)
+        self.assertLess(len(data_loader._filter_cache), 10)
+        self.assertIn(('v9', data_loader._filter_spec(self.date_range, None, None)), data_loader._filter_cache)
+
+class TestStreamingImport(unittest.TestCase):
+    """בדיקות לייבוא בזרימה במקטעים"""
+    
+    def setUp(self):
+        """יצירת אחסון זמני עם שורה אחת קיימת"""
+        self.tmp_dir = tempfile.mkdtemp()
+        self.root = os.path.join(self.tmp_dir, "ledger")
+        ledger_store.write_ledger(pd.DataFrame({
+            'date': ['2024-01-01'], 'amount': [100.0], 'category': ['Income']
+        }), self.root)
+    
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+    
+    def test_stream_in_chunks(self):
+        """בדיקה שהקובץ נקרא במקטעים, מנורמל ומסונן מכפילויות"""
+        lines = ["date,amount,category", "2024-01-01,100.0,Income"]
+        lines += [f"2024-02-{day:02d},{day}.0,Expense" for day in range(1, 11)]
+        lines += ["not-a-date,5.0,Expense"]
+        source = io.StringIO("\n".join(lines))
+        progress = []
+        
+        rows_read, rows_added, rows_rejected = stream_csv_to_ledger(
+            source, chunk_size=4, root=self.root,
+            progress_callback=lambda read, added, fraction: progress.append((read, added))
+        )
+        
+        self.assertEqual((rows_read, rows_added, rows_rejected), (12, 10, 1))
+        self.assertEqual(progress, [(4, 3), (8, 7), (12, 10)])
+        self.assertEqual(len(ledger_store.read_ledger(self.root)), 11)
+    
+    def test_chunks_share_the_first_chunk_formats(self):
+        """בדיקה שכל המקטעים מפוענחים בסדר היום-חודש שזוהה במקטע הראשון"""
+        lines = ["date,amount,category", "01/03/2024,1.0,Expense", "02/03/2024,2.0,Expense",
+                 "13/03/2024,3.0,Expense", "03/04/2024,4.0,Expense"]
+        
+        rows_read, rows_added, rows_rejected = stream_csv_to_ledger(
+            io.StringIO("\n".join(lines)), chunk_size=2, root=self.root)
+        
+        self.assertEqual((rows_read, rows_added, rows_rejected), (4, 3, 1))
+        dates = ledger_store.read_ledger(self.root).sort_values('amount')['date']
+        self.assertEqual(list(dates), [pd.Timestamp('2024-01-03'), pd.Timestamp('2024-02-03'),
+                                       pd.Timestamp('2024-03-04'), pd.Timestamp('2024-01-01')])
+
+class TestBatchImport(unittest.TestCase):
+    """בדיקות לייבוא מרובה קבצים"""
+    
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.root = os.path.join(self.tmp_dir, "ledger")
+        ledger_store.write_ledger(pd.DataFrame({
+            'date': ['2024-01-01'], 'amount': [100.0], 'category': ['Income']
+        }), self.root)
+    
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+    
+    def test_files_are_merged_with_one_dedup_pass(self):
+        """בדיקה שכפילויות בין הקבצים ומול האחסון מסוננות, עם דיווח לכל קובץ"""
+        bank = b"date,amount,category\n2024-01-01,100.0,Income\n2024-02-01,-20.0,Expense\n"
+        card = b"date,amount,category\n01/02/2024,-20.0,Expense\n15/02/2024,-5.0,Expense\nbad,1.0,Expense\n"
+        
+        report, added = import_files([('bank.csv', bank), ('card.csv', card)], max_workers=2, root=self.root)
+        
+        self.assertEqual(len(added), 2)
+        self.assertEqual(list(report['file']), ['bank.csv', 'card.csv'])
+        self.assertEqual(list(report['rows']), [2, 3])
+        self.assertEqual(list(report['rejected']), [0, 1])
+        self.assertEqual(list(report['added']), [1, 1])
+        self.assertTrue((report['parse_seconds'] >= 0).all())
+        self.assertEqual(len(ledger_store.read_ledger(self.root)), 3)
+
+class TestLedgerRollups(unittest.TestCase):
+    """בדיקות למטמון הסיכומים ומצב החיזוי המצטברים"""
+    
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.root = os.path.join(self.tmp_dir, "ledger")
+        ledger_store.write_ledger(pd.DataFrame({
+            'date': ['2024-01-01', '2024-01-02'], 'amount': [100.0, -30.0],
+            'category': ['Income', 'Expense'], 'type': ['Sale', 'Rent']
+        }), self.root)
+        data_loader._rollup_cache.clear()
+        data_loader._forecast_state_cache.clear()
+    
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+    
+    def _load(self):
+        return data_loader._read_ledger(root=self.root)
+    
+    def _load_during_append(self, rows):
+        """טעינה שבמהלכה הוספה מתבצעת מיד אחרי קריאת המניפסט הראשונה"""
+        read_manifest = ledger_store.read_manifest
+        pending = [rows]
+        
+        def read_then_append(root=ledger_store.LEDGER_DIR):
+            manifest = read_manifest(root)
+            if pending:
+                ledger_store.append_rows(pending.pop(), self.root)
+            return manifest
+        
+        with mock.patch.object(ledger_store, 'read_manifest', read_then_append):
+            return self._load()
+    
+    def test_version_matches_loaded_rows(self):
+        """בדיקה שהוספה בזמן הטעינה אינה נספרת פעמיים בסיכומים המצטברים"""
+        data = self._load_during_append(pd.DataFrame({
+            'date': ['2024-02-01'], 'amount': [-5.0], 'category': ['Expense'], 'type': ['Rent']
+        }))
+        ledger_rollups(data, root=self.root)
+        
+        daily = ledger_rollups(self._load(), root=self.root)['daily']
+        february = daily[daily['date'] == pd.Timestamp('2024-02-01')]
+        self.assertEqual(february['amount'].sum(), -5.0)
+        self.assertEqual(february['count'].sum(), 1)
+    
+    def test_version_label_matches_loaded_rows(self):
+        """בדיקה שגרסת הנתונים (מפתח המטמונים) היא הגרסה של השורות שנטענו ולא גרסה מאוחרת יותר"""
+        before = ledger_store.read_manifest(self.root)
+        data = self._load_during_append(pd.DataFrame({
+            'date': ['2024-02-01'], 'amount': [-5.0], 'category': ['Expense'], 'type': ['Rent']
+        }))
+        
+        self.assertEqual(len(data), 2)
+        self.assertEqual(data.attrs['ledger_version'], f"{ledger_store.ledger_version(before)}:None:None")
+        self.assertNotEqual(self._load().attrs['ledger_version'], data.attrs['ledger_version'])
+    
+    def test_append_updates_rollups_from_log(self):
+        """בדיקה שאחרי הוספה הסיכומים מתעדכנים מהשורות שנוספו בלבד"""
+        first = ledger_rollups(self._load(), root=self.root)
+        self.assertIs(ledger_rollups(self._load(), root=self.root), first)
+        ledger_store.append_rows(pd.DataFrame({
+            'date': ['2024-01-02'], 'amount': [-5.0], 'category': ['Expense'], 'type': ['Rent']
+        }), self.root)
+        
+        data = self._load()
+        # ספר תנועות ריק - אם הסיכומים היו נבנים מחדש, הם היו ריקים
+        stale = data.iloc[:0].copy()
+        stale.attrs = data.attrs
+        rollups = ledger_rollups(stale, root=self.root)
+        
+        daily = rollups['daily']
+        self.assertEqual(daily.loc[daily['type'] == 'Rent', 'amount'].iloc[0], -35.0)
+        self.assertEqual(daily['count'].sum(), 3)
+    
+    def test_append_updates_forecast_state_from_log(self):
+        """בדיקה שאחרי הוספה מצב החיזוי מתעדכן מהשורות שנוספו בלבד"""
+        first = ledger_forecast_state(self._load(), root=self.root)
+        self.assertIs(ledger_forecast_state(self._load(), root=self.root), first)
+        ledger_store.append_rows(pd.DataFrame({
+            'date': ['2024-03-02'], 'amount': [-5.0], 'category': ['Expense'], 'type': ['Rent']
+        }), self.root)
+        
+        data = self._load()
+        stale = data.iloc[:0].copy()
+        stale.attrs = data.attrs
+        state = ledger_forecast_state(stale, root=self.root)
+        
+        self.assertEqual(len(state['matrix']['months']), 3)
+        self.assertEqual(state['matrix']['values'][0, -1], -5.0)
+    
+    def test_prepared_forecast_state_per_key(self):
+        """בדיקה שכל הכנה (סינון/המרה) מקבלת מצב משלה ושההוספה עוברת דרך אותה הכנה"""
+        def expenses(rows):
+            return filter_data(rows, None, ['Expense'])[['date', 'amount']].assign(amount=lambda f: f['amount'] * 2)
+        
+        everything = ledger_forecast_state(self._load(), root=self.root)
+        first = ledger_forecast_state(self._load(), root=self.root, prepare=expenses, key='expenses')
+        self.assertIsNot(first, everything)
+        self.assertEqual(first['matrix']['values'][0, 0], -60.0)
+        ledger_store.append_rows(pd.DataFrame({
+            'date': ['2024-02-02', '2024-02-03'], 'amount': [-5.0, 50.0],
+            'category': ['Expense', 'Income'], 'type': ['Rent', 'Sale']
+        }), self.root)
+        
+        data = self._load()
+        stale = data.iloc[:0].copy()
+        stale.attrs = data.attrs
+        state = ledger_forecast_state(stale, root=self.root, prepare=expenses, key='expenses')
+        
+        self.assertEqual(state['matrix']['values'].tolist(), [[-60.0, -10.0]])
+
 if __name__ == '__main__':
     unittest.main() 
\ No newline at end of file
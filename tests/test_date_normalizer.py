@@ -0,0 +1,132 @@
+"""
+tests/test_date_normalizer.py - בדיקות יחידה לזיהוי ופענוח תאריכים בפורמטים מעורבים
+"""
+import unittest
+import pandas as pd
+import sys
+import os
+
+# הוספת הנתיב של הפרויקט
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data import date_normalizer
+from data.date_normalizer import infer_date_formats, normalize_dates
+
+class TestDateNormalizer(unittest.TestCase):
+    """בדיקות לפענוח עמודת תאריכים"""
+
+    def setUp(self):
+        date_normalizer._format_cache.clear()
+
+    def test_mixed_formats(self):
+        """בדיקה שכל קבוצת פורמט מפוענחת נכון"""
+        values = pd.Series(['2024-01-15', '15/02/2024', '2024-03-01', '20.04.2024'])
+
+        dates, bad, formats = normalize_dates(values)
+
+        self.assertFalse(bad.any())
+        self.assertEqual(list(dates.dt.strftime('%Y-%m-%d')),
+                         ['2024-01-15', '2024-02-15', '2024-03-01', '2024-04-20'])
+        self.assertEqual(formats[0], '%Y-%m-%d')
+
+    def test_bad_rows_are_reported(self):
+        """בדיקה ששורות שאינן תאריך מסומנות במקום להכשיל את כל העמודה"""
+        values = pd.Series(['2024-01-15', 'not-a-date', None, '2024-01-16'])
+
+        dates, bad, _ = normalize_dates(values)
+
+        self.assertEqual(list(bad), [False, True, True, False])
+        self.assertEqual(dates.iloc[3], pd.Timestamp('2024-01-16'))
+
+    def test_day_first_is_inferred_from_sample(self):
+        """בדיקה שערך שאינו חד-משמעי מפוענח לפי הפורמט שזוהה משאר העמודה"""
+        values = pd.Series(['25/01/2024', '01/02/2024', '28/02/2024'])
+
+        self.assertEqual(infer_date_formats(values), ['%d/%m/%Y'])
+        dates, _, _ = normalize_dates(values)
+        self.assertEqual(dates.iloc[1], pd.Timestamp('2024-02-01'))
+
+    def test_formats_are_cached_per_signature(self):
+        """בדיקה שייבוא חוזר מאותו מקור משתמש בפורמטים שנשמרו"""
+        signature = ('date', 'amount')
+        normalize_dates(pd.Series(['25/01/2024', '28/02/2024']), signature)
+
+        # ערך דו-משמעי בלבד - ללא המטמון היה מפוענח כחודש-יום
+        dates, _, formats = normalize_dates(pd.Series(['01/02/2024']), signature)
+
+        self.assertEqual(formats, ['%d/%m/%Y'])
+        self.assertEqual(dates.iloc[0], pd.Timestamp('2024-02-01'))
+
+    def test_same_signature_other_order_is_reinferred(self):
+        """בדיקה שקובץ יום-חודש עם אותן כותרות כמו קובץ חודש-יום קודם אינו מפוענח כחודש-יום"""
+        signature = ('date', 'description', 'amount')
+        normalize_dates(pd.Series(['01/25/2024', '02/28/2024']), signature)
+
+        dates, bad, formats = normalize_dates(pd.Series(['05/03/2024', '20/02/2024']), signature)
+
+        self.assertEqual(formats, ['%d/%m/%Y'])
+        self.assertEqual(list(dates), [pd.Timestamp('2024-03-05'), pd.Timestamp('2024-02-20')])
+        self.assertFalse(bad.any())
+
+    def test_orders_are_never_mixed(self):
+        """בדיקה שערך שמתפענח רק ביום-חודש מחוץ למדגם מעביר את כל העמודה ליום-חודש"""
+        ambiguous = [f'{day:02d}/{month:02d}/{year}' for year in range(2015, 2025)
+                     for month in range(1, 13) for day in range(1, 13)]
+        # הערך החד-משמעי במקום השני - מחוץ למדגם הפרוס לאורך הערכים הייחודיים
+        values = pd.Series(ambiguous[:1] + ['20/02/2024'] + ambiguous[1:1000])
+
+        dates, bad, formats = normalize_dates(values)
+
+        self.assertEqual(formats, ['%d/%m/%Y'])
+        self.assertEqual(dates.iloc[0], pd.Timestamp('2015-01-01'))
+        self.assertEqual(dates.iloc[2], pd.Timestamp('2015-01-02'))
+        self.assertFalse(bad.any())
+
+    def test_fixed_formats_are_not_switched(self):
+        """בדיקה שעם פורמטים קבועים אין מעבר לסדר ההפוך - ערכים בסדר ההפוך נדחים"""
+        dates, bad, formats = normalize_dates(pd.Series(['05/03/2024', '20/02/2024']), formats=['%m/%d/%Y'])
+
+        self.assertEqual(dates.iloc[0], pd.Timestamp('2024-05-03'))
+        self.assertEqual(list(bad), [False, True])
+        self.assertEqual(formats, ['%m/%d/%Y'])
+
+    def test_values_outside_the_format_list(self):
+        """בדיקה שערכים שאינם ברשימת הפורמטים מפוענחים בפענוח הגיבוי ולא נדחים"""
+        values = pd.Series(['2024-01-05 10:30', '2024-01-05T10:30:00.250', '2024-01-05T10:30:00Z',
+                            'January 5, 2024', '05-Jan-2024'])
+
+        dates, bad, formats = normalize_dates(values)
+
+        self.assertFalse(bad.any())
+        self.assertEqual(list(dates), [pd.Timestamp('2024-01-05 10:30'), pd.Timestamp('2024-01-05 10:30:00.250'),
+                                       pd.Timestamp('2024-01-05 10:30'), pd.Timestamp('2024-01-05'),
+                                       pd.Timestamp('2024-01-05')])
+        self.assertEqual(formats[-2:], ['ISO8601', 'mixed'])
+
+    def test_fallback_keeps_the_column_order(self):
+        """בדיקה שפענוח הגיבוי ופורמט עם שעה עוקבים אחר סדר היום-חודש של העמודה"""
+        day_first, _, _ = normalize_dates(pd.Series(['13/03/2024', '05/04/2024 9am', '4/3/2024 10:30']))
+        month_first, _, _ = normalize_dates(pd.Series(['03/13/2024', '05/04/2024 9am', '4/3/2024 10:30']))
+
+        self.assertEqual(list(day_first[1:]), [pd.Timestamp('2024-04-05 09:00'), pd.Timestamp('2024-03-04 10:30')])
+        self.assertEqual(list(month_first[1:]), [pd.Timestamp('2024-05-04 09:00'), pd.Timestamp('2024-04-03 10:30')])
+
+    def test_fallback_never_reads_the_other_order(self):
+        """בדיקה שפענוח הגיבוי אינו מקבל ערך שמתפענח רק בסדר ההפוך מסדר העמודה"""
+        # אחרי המעבר ליום-חודש, 02/25/2024 מתפענח רק בסדר חודש-יום
+        _, bad, formats = normalize_dates(pd.Series(['01/03/2024', '20/02/2024', '02/25/2024']))
+        self.assertEqual(formats[0], '%d/%m/%Y')
+        self.assertEqual(list(bad), [False, False, True])
+
+        dates, bad, _ = normalize_dates(pd.Series(['01/03/2024', '3/14/2024 9am', '13/03/2024 9am']))
+        self.assertEqual(dates.iloc[1], pd.Timestamp('2024-03-14 09:00'))
+        self.assertEqual(list(bad), [False, False, True])
+
+    def test_garbage_is_still_rejected(self):
+        """בדיקה שפענוח הגיבוי אינו מקבל ערכים שאינם תאריך"""
+        _, bad, _ = normalize_dates(pd.Series(['2024-01-05', 'abc', '2024-13-45', '']))
+
+        self.assertEqual(list(bad), [False, True, True, True])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,347 @@
+"""
+tests/test_ledger_store.py - בדיקות יחידה לאחסון העמודתי של ספר התנועות
+"""
+import unittest
+from unittest import mock
+import threading
+import pandas as pd
+import tempfile
+import shutil
+import sys
+import os
+
+# הוספת הנתיב של הפרויקט
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data import ledger_store
+from data.schema import DEFAULT_ACCOUNT
+
+class TestLedgerStore(unittest.TestCase):
+    """בדיקות לאחסון המחולק לפי חודשים"""
+
+    def setUp(self):
+        """הכנת תיקייה זמנית וקובץ CSV לדוגמה"""
+        self.tmp_dir = tempfile.mkdtemp()
+        self.root = os.path.join(self.tmp_dir, "ledger")
+        self.csv_path = os.path.join(self.tmp_dir, "sample.csv")
+        pd.DataFrame({
+            'date': ['2024-01-05', '2024-01-20', '2024-02-10', '2024-03-01', '2024-03-15'],
+            'amount': [100.0, -50.0, 200.0, -75.0, 150.0],
+            'category': ['Income', 'Expense', 'Income', 'Expense', 'Income'],
+            'type': ['Sale', 'Material', 'Service', 'Utility', 'Sale']
+        }).to_csv(self.csv_path, index=False)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_csv_import_creates_monthly_partitions(self):
+        """בדיקה שייבוא CSV יוצר מחיצה לכל חודש"""
+        manifest = ledger_store.ensure_store(self.root, self.csv_path)
+
+        self.assertEqual(manifest['partitions'], {'2024-01': 2, '2024-02': 1, '2024-03': 2})
+        for month in ['2024-01', '2024-02', '2024-03']:
+            data_file = ledger_store.partition_file(manifest, month)
+            self.assertTrue(data_file.startswith(month))
+            self.assertTrue(os.path.exists(os.path.join(self.root, data_file)))
+
+    def test_import_happens_only_once(self):
+        """בדיקה שה-CSV מיובא רק בפעם הראשונה"""
+        ledger_store.ensure_store(self.root, self.csv_path)
+        os.remove(self.csv_path)
+
+        manifest = ledger_store.ensure_store(self.root, self.csv_path)
+        self.assertEqual(manifest['version'], 1)
+
+    def test_read_roundtrip(self):
+        """בדיקה שקריאה מלאה מחזירה את כל השורות"""
+        ledger_store.ensure_store(self.root, self.csv_path)
+        df = ledger_store.read_ledger(self.root)
+
+        self.assertEqual(len(df), 5)
+        self.assertAlmostEqual(df['amount'].sum(), 325.0)
+        self.assertTrue(pd.api.types.is_datetime64_any_dtype(df['date']))
+
+    def test_read_range_skips_partitions(self):
+        """בדיקה שקריאה בטווח לא ניגשת למחיצות שמחוץ לטווח"""
+        manifest = ledger_store.ensure_store(self.root, self.csv_path)
+        # מחיקת מחיצה מחוץ לטווח - הקריאה עדיין צריכה להצליח
+        os.remove(os.path.join(self.root, ledger_store.partition_file(manifest, '2024-01')))
+
+        df = ledger_store.read_ledger(self.root, start='2024-02-01', end='2024-03-10')
+
+        self.assertEqual(len(df), 2)
+        self.assertTrue(all(df['date'] >= pd.Timestamp('2024-02-01')))
+        self.assertTrue(all(df['date'] <= pd.Timestamp('2024-03-10')))
+
+    def test_rewrite_removes_stale_partitions(self):
+        """בדיקה שכתיבה מחדש מוחקת מחיצות שאינן בשימוש"""
+        first = ledger_store.ensure_store(self.root, self.csv_path)
+        df = ledger_store.read_ledger(self.root)
+
+        manifest = ledger_store.write_ledger(df[df['date'] >= pd.Timestamp('2024-02-01')], self.root)
+
+        self.assertEqual(manifest['version'], 2)
+        self.assertNotIn('2024-01', manifest['partitions'])
+        self.assertFalse(os.path.exists(os.path.join(self.root, ledger_store.partition_file(first, '2024-01'))))
+
+class TestLedgerAppend(unittest.TestCase):
+    """בדיקות להוספה מצטברת עם אינדקס גיבובים"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.root = os.path.join(self.tmp_dir, "ledger")
+        ledger_store.write_ledger(pd.DataFrame({
+            'date': ['2024-01-05', '2024-01-20', '2024-02-10'],
+            'amount': [100.0, -50.0, 200.0],
+            'category': ['Income', 'Expense', 'Income'],
+            'description': ['Sale', None, 'Service']
+        }), self.root)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_find_new_rows_ignores_existing(self):
+        """בדיקה ששורות קיימות וכפילויות בתוך הקובץ מסוננות"""
+        upload = pd.DataFrame({
+            'date': ['2024-01-05', '2024-03-01', '2024-03-01'],
+            'amount': [100, 300, 300],
+            'category': ['Income', 'Income', 'Income'],
+            'description': ['Sale', 'New', 'New']
+        })
+
+        new_rows = ledger_store.find_new_rows(upload, self.root)
+
+        self.assertEqual(len(new_rows), 1)
+        self.assertEqual(new_rows['description'].iloc[0], 'New')
+
+    def test_missing_values_match_stored_rows(self):
+        """בדיקה ששורה עם ערך חסר מזוהה כקיימת"""
+        upload = pd.DataFrame({
+            'date': ['2024-01-20'], 'amount': [-50.0], 'category': ['Expense']
+        })
+
+        self.assertTrue(ledger_store.find_new_rows(upload, self.root).empty)
+
+    def test_append_rows_is_idempotent(self):
+        """בדיקה שהוספה חוזרת של אותו קובץ לא יוצרת כפילויות"""
+        upload = pd.DataFrame({
+            'date': ['2024-02-11', '2024-04-01'],
+            'amount': [10.0, 20.0],
+            'category': ['Income', 'Income'],
+            'description': ['A', 'B']
+        })
+
+        added = ledger_store.append_rows(upload, self.root)
+        added_again = ledger_store.append_rows(upload, self.root)
+
+        self.assertEqual(len(added), 2)
+        self.assertTrue(added_again.empty)
+        manifest = ledger_store.compact(self.root)
+        self.assertEqual(manifest['partitions'], {'2024-01': 2, '2024-02': 2, '2024-04': 1})
+        self.assertEqual(len(ledger_store.read_ledger(self.root)), 5)
+
+    def test_new_optional_column_extends_store(self):
+        """בדיקה שעמודת חשבון בקובץ שהועלה מתווספת לאחסון, והשורות הקיימות נשארות ריקות בה"""
+        upload = pd.DataFrame({
+            'date': ['2024-01-05', '2024-02-12'],
+            'amount': [100.0, 30.0],
+            'category': ['Income', 'Income'],
+            'description': ['Sale', 'Card'],
+            'account': ['Main', 'Visa']
+        })
+
+        added = ledger_store.append_rows(upload, self.root)
+
+        # שורה קיימת מזוהה כקיימת - בשורות שבאחסון החשבון הוא חשבון ברירת המחדל
+        self.assertEqual(list(added['account']), ['Visa'])
+        manifest = ledger_store.read_manifest(self.root)
+        self.assertIn('account', manifest['columns'])
+        df = ledger_store.read_ledger(self.root)
+        self.assertEqual(len(df), 4)
+        self.assertEqual(df['account'].notna().sum(), 1)
+        self.assertTrue(ledger_store.append_rows(upload, self.root).empty)
+
+    def test_rows_differing_by_new_column_are_kept(self):
+        """בדיקה ששורות שנבדלות רק בעמודת חשבון חדשה אינן נזרקות ככפילויות"""
+        ledger_store.append_rows(pd.DataFrame({
+            'date': ['2024-02-15'], 'amount': [-5.0], 'category': ['Expense'], 'description': ['Fee']
+        }), self.root)
+        upload = pd.DataFrame({
+            'date': ['2024-01-05', '2024-01-05', '2024-02-15', '2024-02-15'],
+            'amount': [100.0, 100.0, -5.0, -5.0],
+            'category': ['Income', 'Income', 'Expense', 'Expense'],
+            'description': ['Sale', 'Sale', 'Fee', 'Fee'],
+            'account': [DEFAULT_ACCOUNT, 'Visa', DEFAULT_ACCOUNT, 'Visa']
+        })
+
+        added = ledger_store.append_rows(upload, self.root)
+
+        self.assertEqual(list(added['account']), ['Visa', 'Visa'])
+        self.assertEqual(len(ledger_store.read_ledger(self.root)), 6)
+        self.assertTrue(ledger_store.append_rows(upload, self.root).empty)
+
+    def test_rows_differing_by_currency_are_kept(self):
+        """בדיקה שבהעלאה הראשונה עם מטבעות, שורות שנבדלות רק במטבע אינן נזרקות ככפילויות"""
+        upload = pd.DataFrame({
+            'date': ['2024-01-05', '2024-03-01', '2024-03-01'],
+            'amount': [100.0, 40.0, 40.0],
+            'category': ['Income', 'Income', 'Income'],
+            'description': ['Sale', 'Invoice', 'Invoice'],
+            'currency': ['EUR', 'USD', 'EUR']
+        })
+
+        added = ledger_store.append_rows(upload, self.root)
+
+        self.assertEqual(list(added['currency']), ['EUR', 'USD', 'EUR'])
+        df = ledger_store.read_ledger(self.root)
+        self.assertEqual(len(df), 6)
+        self.assertEqual(df['currency'].isna().sum(), 3)
+        self.assertTrue(ledger_store.append_rows(upload, self.root).empty)
+
+class TestWriteAheadLog(unittest.TestCase):
+    """בדיקות ליומן הכתיבה ולאיחוד המחיצות"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.root = os.path.join(self.tmp_dir, "ledger")
+        self.base = ledger_store.write_ledger(pd.DataFrame({
+            'date': ['2024-01-05', '2024-02-10'],
+            'amount': [100.0, 200.0],
+            'category': ['Income', 'Income']
+        }), self.root)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _upload(self, day, amount):
+        return pd.DataFrame({'date': [day], 'amount': [amount], 'category': ['Expense']})
+
+    def test_append_writes_only_a_log_segment(self):
+        """בדיקה שהוספה אינה כותבת מחדש את המחיצות"""
+        ledger_store.append_rows(self._upload('2024-01-06', -10.0), self.root)
+
+        manifest = ledger_store.read_manifest(self.root)
+        self.assertEqual(manifest['files'], self.base['files'])
+        self.assertEqual(len(manifest['wal']), 1)
+        self.assertEqual(ledger_store.row_count(manifest), 3)
+        self.assertEqual(len(ledger_store.read_ledger(self.root)), 3)
+        # שורה שנמצאת ביומן מזוהה ככפילות
+        self.assertTrue(ledger_store.find_new_rows(self._upload('2024-01-06', -10.0), self.root).empty)
+
+    def test_compact_folds_log_into_partitions(self):
+        """בדיקה שאיחוד היומן כותב רק את החודשים שנגעו בהם ומוחק קבצים ישנים"""
+        ledger_store.append_rows(self._upload('2024-01-06', -10.0), self.root)
+
+        manifest = ledger_store.compact(self.root)
+
+        self.assertEqual(manifest['wal'], [])
+        self.assertEqual(manifest['partitions'], {'2024-01': 2, '2024-02': 1})
+        self.assertEqual(manifest['files']['2024-02'], self.base['files']['2024-02'])
+        self.assertNotEqual(manifest['files']['2024-01'], self.base['files']['2024-01'])
+        self.assertFalse(os.path.exists(os.path.join(self.root, self.base['files']['2024-01'])))
+        self.assertEqual(os.listdir(os.path.join(self.root, ledger_store.WAL_DIR)), [])
+        self.assertEqual(len(ledger_store.read_ledger(self.root)), 3)
+
+    def test_uncommitted_segment_is_ignored(self):
+        """בדיקה שמקטע שנכתב בלי commit למניפסט (נפילה באמצע) אינו נקרא"""
+        os.makedirs(os.path.join(self.root, ledger_store.WAL_DIR), exist_ok=True)
+        self._upload('2024-01-07', -5.0).to_parquet(os.path.join(self.root, ledger_store.WAL_DIR, '000001.parquet'))
+
+        self.assertEqual(len(ledger_store.read_ledger(self.root)), 2)
+        added = ledger_store.append_rows(self._upload('2024-01-08', -6.0), self.root)
+        self.assertEqual(len(added), 1)
+        self.assertEqual(len(ledger_store.read_ledger(self.root)), 3)
+
+    def test_fingerprint_changes_only_on_commit(self):
+        """בדיקה שטביעת האצבע משתנה רק כשהאחסון משתנה בפועל"""
+        before = ledger_store.store_fingerprint(self.root)
+        self.assertEqual(ledger_store.store_fingerprint(self.root), before)
+        ledger_store.append_rows(self._upload('2024-01-05', 100.0).assign(category='Income'), self.root)
+        self.assertEqual(ledger_store.store_fingerprint(self.root), before)  # כפילות - אין commit
+
+        ledger_store.append_rows(self._upload('2024-01-06', -10.0), self.root)
+
+        self.assertNotEqual(ledger_store.store_fingerprint(self.root), before)
+        self.assertIsNone(ledger_store.store_fingerprint(os.path.join(self.tmp_dir, "missing")))
+
+    def test_read_appended_rows(self):
+        """בדיקה שניתן לקרוא רק את השורות שנוספו מאז גרסה, ושאחרי איחוד הן אינן זמינות"""
+        ledger_store.append_rows(self._upload('2024-01-06', -10.0), self.root)
+        ledger_store.append_rows(self._upload('2024-01-07', -20.0), self.root)
+
+        appended = ledger_store.read_appended(self.root, since=self.base['version'] + 1)
+        self.assertEqual(list(appended['amount']), [-20.0])
+        self.assertEqual(len(ledger_store.read_appended(self.root, since=self.base['version'])), 2)
+
+        ledger_store.compact(self.root)
+        self.assertIsNone(ledger_store.read_appended(self.root, since=self.base['version']))
+
+    def _compacting_during_read(self):
+        """read_manifest שמאחד את היומן מיד אחרי הקריאה הראשונה - כמו איחוד מתהליך אחר"""
+        read_manifest = ledger_store.read_manifest
+        pending = [True]
+
+        def read_then_compact(root=ledger_store.LEDGER_DIR):
+            manifest = read_manifest(root)
+            if pending:
+                pending.pop()
+                ledger_store.compact(self.root)
+            return manifest
+
+        return mock.patch.object(ledger_store, 'read_manifest', read_then_compact)
+
+    def test_read_during_compaction(self):
+        """בדיקה שקורא שקבציו נמחקו באיחוד שהסתיים בינתיים קורא מחדש מהמניפסט החדש"""
+        ledger_store.append_rows(self._upload('2024-01-06', -10.0), self.root)
+        ledger_store.append_rows(self._upload('2024-03-01', -20.0), self.root)
+
+        with self._compacting_during_read():
+            manifest, df = ledger_store.read_snapshot(self.root)
+        self.assertEqual(len(df), 4)
+        self.assertEqual(manifest['wal'], [])
+
+        ledger_store.append_rows(self._upload('2024-03-02', -30.0), self.root)
+        since = ledger_store.read_manifest(self.root)['version'] - 1
+        with self._compacting_during_read():
+            self.assertIsNone(ledger_store.read_appended(self.root, since=since))
+
+    def test_missing_file_is_reported(self):
+        """בדיקה שקובץ שחסר כשהמניפסט לא השתנה מדווח כשגיאה"""
+        manifest = ledger_store.read_manifest(self.root)
+        os.remove(os.path.join(self.root, ledger_store.partition_file(manifest, '2024-01')))
+
+        with self.assertRaises(FileNotFoundError):
+            ledger_store.read_ledger(self.root)
+
+    def test_automatic_compaction(self):
+        """בדיקה שהיומן מאוחד אוטומטית כשמגיע לסף המקטעים"""
+        for day in range(1, ledger_store.COMPACT_SEGMENTS + 1):
+            ledger_store.append_rows(self._upload(f'2024-03-{day:02d}', -float(day)), self.root)
+
+        manifest = ledger_store.read_manifest(self.root)
+        self.assertEqual(manifest['wal'], [])
+        self.assertEqual(manifest['partitions']['2024-03'], ledger_store.COMPACT_SEGMENTS)
+
+    def test_concurrent_appends(self):
+        """בדיקה שהוספות במקביל מכמה threads (sessions) נשמרות כולן, כולל איחוד היומן באמצע"""
+        errors = []
+
+        def append(day):
+            try:
+                ledger_store.append_rows(self._upload(f'2024-03-{day:02d}', -float(day)), self.root)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=append, args=(day,)) for day in range(1, 21)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(ledger_store.read_ledger(self.root)), 22)
+        manifest = ledger_store.read_manifest(self.root)
+        self.assertEqual(manifest['version'], self.base['version'] + 20 + 1)
+
+if __name__ == '__main__':
+    unittest.main()
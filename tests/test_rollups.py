@@ -0,0 +1,65 @@
+"""
+tests/test_rollups.py - בדיקות יחידה לסיכומים המצטברים של ספר התנועות
+"""
+import unittest
+import pandas as pd
+import sys
+import os
+
+# הוספת הנתיב של הפרויקט
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data.schema import apply_ledger_schema
+from data.rollups import build_rollups, update_rollups, scale_rollup, totals_by
+
+class TestRollups(unittest.TestCase):
+    """בדיקות לבנייה ולעדכון של הסיכומים"""
+
+    def setUp(self):
+        self.ledger = apply_ledger_schema(pd.DataFrame({
+            'date': ['2024-01-05', '2024-01-05', '2024-01-20', '2024-02-10'],
+            'amount': [100.0, -40.0, -50.0, 200.0],
+            'category': ['Income', 'Expense', 'Expense', 'Income'],
+            'type': ['Sale', 'Material', 'Material', 'Service']
+        }))
+
+    def _sorted(self, rollup):
+        return rollup.astype({'category': str, 'type': str}).sort_values(['date', 'category', 'type']).reset_index(drop=True)
+
+    def test_daily_and_monthly_sums(self):
+        """בדיקה שהסיכומים מחזיקים תקבולים, תשלומים ונטו לכל תקופה, קטגוריה וסוג"""
+        rollups = build_rollups(self.ledger)
+
+        self.assertEqual(len(rollups['daily']), 4)
+        monthly = rollups['monthly']
+        january_material = monthly[(monthly['date'] == '2024-01-01') & (monthly['type'] == 'Material')]
+        self.assertEqual(january_material['outflows'].iloc[0], 90.0)
+        self.assertEqual(january_material['count'].iloc[0], 2)
+        self.assertTrue(rollups['daily'].index.is_monotonic_increasing)
+
+    def test_update_matches_full_rebuild(self):
+        """בדיקה שעדכון מצטבר זהה לבנייה מחדש מכל ספר התנועות"""
+        new_rows = apply_ledger_schema(pd.DataFrame({
+            'date': ['2024-01-05', '2024-03-01'],
+            'amount': [-10.0, 30.0],
+            'category': ['Expense', 'Income'],
+            'type': ['Rent', 'Sale']
+        }))
+
+        updated = update_rollups(build_rollups(self.ledger), new_rows)
+        rebuilt = build_rollups(pd.concat([self.ledger, new_rows]))
+
+        for name in ('daily', 'monthly'):
+            pd.testing.assert_frame_equal(self._sorted(updated[name]), self._sorted(rebuilt[name]))
+
+    def test_totals_and_scaling(self):
+        """בדיקה של סכומים לפי חודש וסוג ושל המרה בשער קבוע"""
+        daily = scale_rollup(build_rollups(self.ledger)['daily'], 2.0)
+
+        by_month = totals_by(daily, 'month')
+        self.assertEqual(list(by_month['inflows']), [200.0, 400.0])
+        self.assertEqual(list(by_month['outflows']), [180.0, 0.0])
+        self.assertEqual(totals_by(daily, 'type').loc['Material', 'outflows'], 180.0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+"""
+tests/test_schema.py - בדיקות יחידה לסכמה הקנונית של ספר התנועות
+"""
+import unittest
+import numpy as np
+import pandas as pd
+import sys
+import os
+
+# הוספת הנתיב של הפרויקט
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data.schema import apply_ledger_schema, category_options, DEFAULT_ACCOUNT
+
+class TestLedgerSchema(unittest.TestCase):
+    """בדיקות להחלת הסכמה"""
+
+    def setUp(self):
+        """נתונים גולמיים כפי שנקראים מ-CSV"""
+        self.raw = pd.DataFrame({
+            'date': ['2024-01-01', '2024-01-21', '2024-02-10'],
+            'amount': ['4448.00', '-1067.52', '-711.68'],
+            'category': ['Income', 'Expense', 'Expense'],
+            'type': ['Sale', 'Material', 'Utility'],
+            'description': ['Product A Sales', 'Raw Materials Purchase', 'Electricity Bill'],
+            'component': [np.nan, 'Metal', np.nan],
+            'inventory_level': [np.nan, 50.0, np.nan]
+        })
+
+    def test_column_types(self):
+        """בדיקה שכל עמודה מקבלת את הטיפוס הקנוני"""
+        typed = apply_ledger_schema(self.raw)
+
+        self.assertEqual(typed['date'].dtype, np.dtype('datetime64[ns]'))
+        self.assertEqual(typed['amount'].dtype, np.dtype('float64'))
+        for column in ['category', 'type', 'description', 'component']:
+            self.assertIsInstance(typed[column].dtype, pd.CategoricalDtype)
+        self.assertEqual(str(typed['inventory_level'].dtype), 'Float32')
+        self.assertTrue(typed['inventory_level'].isna().iloc[0])
+
+    def test_missing_columns_are_added(self):
+        """בדיקה שעמודות חסרות מתווספות כריקות"""
+        typed = apply_ledger_schema(self.raw[['date', 'amount']])
+
+        self.assertIn('category', typed.columns)
+        self.assertTrue(typed['category'].isna().all())
+
+    def test_missing_account_is_default(self):
+        """בדיקה ששורות ללא חשבון שייכות לחשבון ברירת המחדל"""
+        typed = apply_ledger_schema(self.raw.assign(account=['Visa', None, 'Visa']))
+
+        self.assertIsInstance(typed['account'].dtype, pd.CategoricalDtype)
+        self.assertEqual(list(typed['account']), ['Visa', DEFAULT_ACCOUNT, 'Visa'])
+        self.assertTrue((apply_ledger_schema(self.raw)['account'] == DEFAULT_ACCOUNT).all())
+
+    def test_category_options_skip_missing(self):
+        """בדיקה שאפשרויות הסינון אינן כוללות ערכים חסרים"""
+        typed = apply_ledger_schema(self.raw)
+
+        self.assertEqual(category_options(typed, 'component'), ['Metal'])
+        self.assertEqual(category_options(typed, 'category'), ['Income', 'Expense'])
+
+if __name__ == '__main__':
+    unittest.main()
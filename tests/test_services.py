@@ -27,6 +27,12 @@ class TestServices(unittest.TestCase):
         self.assertIsNotNone(rate)
         self.assertGreater(rate, 0)
     
+    def test_exchange_rate_history_same_currency(self):
+        """בדיקה שהיסטוריית שערים של מטבע לעצמו היא שער קבוע 1"""
+        history = services.get_exchange_rate_history("USD", "USD", "2024-01-01", "2024-02-01")
+        self.assertEqual(list(history), [1.0])
+        self.assertEqual(history.index[0], pd.Timestamp("2024-01-01"))
+    
     def test_forecast_cashflow_basic(self):
         """בדיקה בסיסית של תחזית תזרים מזומנים"""
         # יצירת נתוני בדיקה
@@ -61,6 +67,323 @@ class TestServices(unittest.TestCase):
         forecast = services.forecast_cashflow(df, periods=6)
         self.assertEqual(len(forecast), 6)  # עדיין צריך להחזיר תחזית
 
+class TestBatchedForecast(unittest.TestCase):
+    """בדיקות לחיזוי של סדרות רבות בקריאה אחת"""
+    
+    def setUp(self):
+        self.df = pd.DataFrame({
+            'series': ['A', 'A', 'A', 'B', 'B'],
+            'date': pd.to_datetime(['2024-01-31', '2024-02-15', '2024-04-10', '2024-01-05', '2024-01-20']),
+            'amount': [100.0, 300.0, 200.0, -50.0, -30.0]
+        })
+    
+    def test_matches_single_series_forecast(self):
+        """בדיקה שכל סדרה מקבלת את אותה תחזית כמו בקריאה נפרדת"""
+        batched = services.forecast_many(self.df, periods=3)
+        
+        self.assertEqual(list(batched.columns), ['series', 'step', 'date', 'forecast'])
+        for name, group in self.df.groupby('series'):
+            single = services.forecast_cashflow(group[['date', 'amount']], periods=3)
+            rows = batched[batched['series'] == name]
+            np.testing.assert_allclose(rows['forecast'], single['forecast'])
+            self.assertEqual(list(rows['date']), list(single['date']))
+    
+    def test_baseline_values(self):
+        """בדיקה של ממוצע החודשים עם תנועות ושל המגמה, ושל קיצור התאריך לסוף החודש"""
+        forecast = services.forecast_many(self.df, periods=2)
+        a = forecast[forecast['series'] == 'A']
+        
+        # חודשים עם תנועות: 100, 300, 200 -> ממוצע 200, מגמה (200-100)/2 = 50
+        self.assertEqual(list(a['forecast']), [250.0, 300.0])
+        self.assertEqual(list(forecast[forecast['series'] == 'B']['forecast']), [-80.0, -80.0])
+        self.assertEqual(forecast['date'].iloc[0], pd.Timestamp('2024-05-10'))
+    
+    def test_many_series(self):
+        """בדיקה שאלפי סדרות מחושבות במטריצה אחת"""
+        rng = np.random.default_rng(0)
+        rows = 10_000 * 5
+        df = pd.DataFrame({
+            'series': rng.integers(0, 10_000, rows),
+            'date': pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 365, rows), 'D'),
+            'amount': rng.normal(0, 100, rows)
+        })
+        
+        forecast = services.forecast_many(df, periods=4)
+        
+        self.assertEqual(len(forecast), df['series'].nunique() * 4)
+        self.assertFalse(forecast['forecast'].isna().any())
+
+class TestForecastModels(unittest.TestCase):
+    """בדיקות לרשם מודלי החיזוי ולמטמון ההתאמות"""
+    
+    def setUp(self):
+        # שלוש שנים של עונתיות חודשית מושלמת עם מגמה
+        months = pd.date_range('2021-01-15', periods=36, freq='MS') + pd.Timedelta(days=14)
+        self.season = np.tile([100.0, -50.0, 30.0, 0.0, 80.0, -20.0, 10.0, 60.0, -40.0, 20.0, 50.0, -10.0], 3)
+        self.df = pd.DataFrame({'date': months, 'amount': self.season + 5.0 * np.arange(36)})
+    
+    def test_all_models_forecast(self):
+        """בדיקה שכל מודל רשום מחזיר תחזית מלאה"""
+        for model in services.FORECAST_MODELS:
+            forecast = services.forecast_cashflow(self.df, periods=14, model=model)
+            self.assertEqual(len(forecast), 14, model)
+            self.assertFalse(forecast['forecast'].isna().any(), model)
+    
+    def test_seasonal_naive_repeats_last_season(self):
+        """בדיקה שהתחזית העונתית הנאיבית חוזרת על השנה האחרונה"""
+        forecast = services.forecast_cashflow(self.df, periods=12, model='seasonal_naive')
+        np.testing.assert_allclose(forecast['forecast'], self.df['amount'].to_numpy()[-12:])
+    
+    def test_linear_seasonal_recovers_pattern(self):
+        """בדיקה שמגמה ועונתיות מדויקות משוחזרות במלואן"""
+        forecast = services.forecast_cashflow(self.df, periods=12, model='linear_seasonal')
+        expected = self.season[:12] + 5.0 * np.arange(36, 48)
+        np.testing.assert_allclose(forecast['forecast'], expected, atol=1e-6)
+    
+    def test_holt_winters_tracks_season(self):
+        """בדיקה ש-Holt-Winters קרוב לדפוס העונתי יותר מהמודל הבסיסי"""
+        expected = self.season[:12] + 5.0 * np.arange(36, 48)
+        errors = {model: np.abs(services.forecast_cashflow(self.df, 12, model=model)['forecast'] - expected).mean()
+                  for model in ('holt_winters', 'baseline')}
+        self.assertLess(errors['holt_winters'], errors['baseline'])
+    
+    def test_short_history(self):
+        """בדיקה שמודלים עונתיים מסתדרים עם פחות משנה של נתונים"""
+        for model in services.FORECAST_MODELS:
+            forecast = services.forecast_cashflow(self.df.head(3), periods=4, model=model)
+            self.assertFalse(forecast['forecast'].isna().any(), model)
+    
+    def test_fit_is_cached_across_horizons(self):
+        """בדיקה ששינוי אופק החיזוי משתמש בהתאמה השמורה"""
+        matrix = services.monthly_matrix(self.df.assign(series=0))
+        state = services.fit_forecast_model(matrix, 'holt_winters')
+        self.assertIs(services.fit_forecast_model(matrix, 'holt_winters'), state)
+        self.assertIsNot(services.fit_forecast_model(matrix, 'holt_winters', alpha=0.5), state)
+        
+        short = services.predict_forecast_model(state, 'holt_winters', 3)
+        long = services.predict_forecast_model(state, 'holt_winters', 6)
+        np.testing.assert_allclose(long[:, :3], short)
+    
+    def test_unknown_model(self):
+        """בדיקה שמודל או פרמטר לא מוכרים מעלים שגיאה"""
+        with self.assertRaises(ValueError):
+            services.forecast_cashflow(self.df, model='prophet')
+        with self.assertRaises(ValueError):
+            services.forecast_cashflow(self.df, model='baseline', alpha=0.1)
+
+class TestSimulation(unittest.TestCase):
+    """בדיקות לסימולציית מונטה קרלו של היתרה"""
+    
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        self.df = pd.DataFrame({
+            'date': pd.Timestamp('2023-01-01') + pd.to_timedelta(rng.integers(0, 730, 2000), 'D'),
+            'amount': rng.normal(0, 300, 2000)
+        })
+    
+    def test_bands_and_shortfall(self):
+        """בדיקה שהרצועות מסודרות לפי אחוזון ושההסתברות לחוסר מצטברת"""
+        result = services.simulate_cashflow(self.df, periods=6, opening_balance=5_000, n_paths=2_000)
+        bands = result['bands']
+        
+        self.assertEqual(len(bands), 6)
+        self.assertTrue((bands['p5'] <= bands['p50']).all() and (bands['p50'] <= bands['p95']).all())
+        self.assertTrue((np.diff(bands['shortfall']) >= 0).all())
+        self.assertEqual(result['shortfall_probability'], bands['shortfall'].iloc[-1])
+        self.assertEqual(list(bands['date']), list(services.forecast_cashflow(self.df, 6)['date']))
+    
+    def test_simulation_from_state(self):
+        """בדיקה שסימולציה ממצב החיזוי זהה לסימולציה מהנתונים ושהשאריות נשמרות במצב"""
+        state = services.forecast_state(self.df)
+        result = services.simulate_from_state(state, periods=6, opening_balance=5_000, n_paths=2_000,
+                                              model='holt_winters')
+        expected = services.simulate_cashflow(self.df, periods=6, opening_balance=5_000, n_paths=2_000,
+                                              model='holt_winters')
+        
+        pd.testing.assert_frame_equal(result['bands'], expected['bands'])
+        self.assertEqual(len(state['residuals']), 1)
+    
+    def test_residual_median_follows_forecast(self):
+        """בדיקה שחציון היתרה בשיטת השאריות קרוב ליתרה החזויה ועוד ההטיה הממוצעת של המודל"""
+        result = services.simulate_cashflow(self.df, periods=3, opening_balance=1_000, n_paths=20_000)
+        residuals = services.one_step_residuals(services.monthly_matrix(self.df.assign(series=0)))
+        expected = 1_000 + (result['bands']['forecast'] + np.nanmean(residuals)).cumsum()
+        spread = result['bands']['p95'] - result['bands']['p5']
+        self.assertTrue((np.abs(result['bands']['p50'] - expected) < 0.05 * spread).all())
+    
+    def test_residuals_come_from_the_model(self):
+        """בדיקה שמגמה ועונתיות שהמודל חוזה אינן נדגמות כרעש"""
+        months = pd.date_range('2021-01-01', periods=36, freq='MS')
+        season = np.tile([100.0, -50.0, 30.0, 0.0, 80.0, -20.0, 10.0, 60.0, -40.0, 20.0, 50.0, -10.0], 3)
+        df = pd.DataFrame({'date': months, 'amount': season + 5.0 * np.arange(36)})
+
+        fitted = services.simulate_cashflow(df, periods=6, model='linear_seasonal', n_paths=1_000)['bands']
+        naive = services.simulate_cashflow(df, periods=6, model='baseline', n_paths=1_000)['bands']
+
+        self.assertLess((fitted['p95'] - fitted['p5']).max(), 1e-6)
+        self.assertGreater((naive['p95'] - naive['p5']).min(), 10)
+
+    def test_one_step_residuals(self):
+        """בדיקה של שגיאת צעד-אחד מול חישוב ידני"""
+        df = pd.DataFrame({'series': 0, 'date': pd.date_range('2024-01-01', periods=4, freq='MS'),
+                           'amount': [10.0, 20.0, 40.0, 80.0]})
+        matrix = services.monthly_matrix(df)
+        # פחות מעונה מלאה - החודש הקודם חוזר על עצמו: 20-10, 40-20, 80-40
+        np.testing.assert_array_equal(services.one_step_residuals(matrix, 'seasonal_naive')[0],
+                                      [np.nan, 10.0, 20.0, 40.0])
+        # ללא 'fitted' - התאמה מתגלגלת: [10, 20] -> 15 + 10 = 25; [10, 20, 40] -> 23.33 + 15
+        np.testing.assert_allclose(services.one_step_residuals(matrix, 'baseline', min_train=2)[0],
+                                   [np.nan, np.nan, 15.0, 80.0 - (70.0 / 3 + 15.0)])
+
+    def test_deterministic_across_workers(self):
+        """בדיקה שאותו זרע נותן אותה תוצאה עם ובלי מאגר תהליכים"""
+        original = services.SIMULATION_CHUNK_PATHS
+        services.SIMULATION_CHUNK_PATHS = 500
+        try:
+            serial = services.simulate_cashflow(self.df, periods=4, n_paths=2_000, method='bootstrap', max_workers=1)
+            parallel = services.simulate_cashflow(self.df, periods=4, n_paths=2_000, method='bootstrap', max_workers=2)
+        finally:
+            services.SIMULATION_CHUNK_PATHS = original
+        pd.testing.assert_frame_equal(serial['bands'], parallel['bands'])
+    
+    def test_no_history(self):
+        """בדיקה שללא נתונים מוחזרות רצועות ריקות"""
+        empty = pd.DataFrame({'date': pd.to_datetime([None, None]), 'amount': [1.0, 2.0]})
+        result = services.simulate_cashflow(empty, periods=3)
+        self.assertTrue(np.isnan(result['shortfall_probability']))
+        self.assertEqual(len(result['bands']), 3)
+
+class TestBacktest(unittest.TestCase):
+    """בדיקות לבדיקה ההיסטורית של מודלי החיזוי"""
+    
+    def setUp(self):
+        rng = np.random.default_rng(5)
+        self.df = pd.DataFrame({
+            'series': rng.integers(0, 20, 3000),
+            'date': pd.Timestamp('2022-01-01') + pd.to_timedelta(rng.integers(0, 730, 3000), 'D'),
+            'amount': rng.normal(50, 200, 3000)
+        })
+    
+    def test_scores_every_model(self):
+        """בדיקה שכל מודל רשום מקבל ציון על כל נקודות החיתוך"""
+        result = services.backtest_models(self.df, horizon=2, series_col='series', max_workers=1)
+        
+        self.assertEqual(set(result['scores'].index), set(services.FORECAST_MODELS))
+        self.assertEqual(result['origins'], 24 - services.BACKTEST_MIN_TRAIN_MONTHS - 2 + 1)
+        self.assertTrue((result['scores']['count'] == 20 * 2 * result['origins']).all())
+        self.assertTrue(result['scores']['mae'].is_monotonic_increasing)
+        self.assertEqual(len(result['by_step']), len(services.FORECAST_MODELS) * 2)
+    
+    def test_matches_manual_errors(self):
+        """בדיקה של MAE, MAPE והטיה מול חישוב ידני לסדרה אחת"""
+        months = pd.date_range('2023-01-01', periods=10, freq='MS')
+        df = pd.DataFrame({'date': months, 'amount': np.arange(1.0, 11.0)})
+        scores = services.backtest_models(df, horizon=1, models=['seasonal_naive'], min_train=8)['scores']
+        
+        # חיתוך 8: תחזית 8 מול 9; חיתוך 9: תחזית 9 מול 10 (כשאין עונה מלאה החודש האחרון חוזר)
+        self.assertAlmostEqual(scores.loc['seasonal_naive', 'mae'], 1.0)
+        self.assertAlmostEqual(scores.loc['seasonal_naive', 'bias'], -1.0)
+        self.assertAlmostEqual(scores.loc['seasonal_naive', 'mape'], 100 * (1 / 9 + 1 / 10) / 2)
+    
+    def test_parallel_matches_serial(self):
+        """בדיקה שחלוקה לקבוצות ולתהליכים לא משנה את התוצאה"""
+        originals = services.BACKTEST_ORIGIN_CHUNK, services.BACKTEST_SERIES_CHUNK
+        serial = services.backtest_models(self.df, series_col='series', max_workers=1)
+        services.BACKTEST_ORIGIN_CHUNK, services.BACKTEST_SERIES_CHUNK = 4, 7
+        try:
+            parallel = services.backtest_models(self.df, series_col='series', max_workers=2)
+        finally:
+            services.BACKTEST_ORIGIN_CHUNK, services.BACKTEST_SERIES_CHUNK = originals
+        pd.testing.assert_frame_equal(serial['scores'], parallel['scores'])
+    
+    def test_cached_per_version(self):
+        """בדיקה שהתוצאה נשמרת לפי גרסת הנתונים"""
+        first = services.backtest_models(self.df, series_col='series', key='v1')
+        self.assertIs(services.backtest_models(self.df, series_col='series', key='v1'), first)
+        self.assertIsNot(services.backtest_models(self.df, series_col='series', key='v2'), first)
+    
+    def test_late_series_is_excluded_before_it_starts(self):
+        """בדיקה שסדרה שמתחילה מאוחר לא הופכת את הציונים ל-NaN ונספרת רק מתחילתה"""
+        a = pd.DataFrame({'series': 'A', 'date': pd.date_range('2022-01-01', '2024-12-01', freq='MS'),
+                          'amount': 100.0})
+        b = pd.DataFrame({'series': 'B', 'date': pd.date_range('2024-01-01', '2024-12-01', freq='MS'),
+                          'amount': -40.0})
+        result = services.backtest_models(pd.concat([a, b]), horizon=1, series_col='series', max_workers=1)
+        scores = result['scores']
+
+        self.assertFalse(scores[['mae', 'mape', 'bias']].isna().any().any())
+        # A בכל 30 נקודות החיתוך, B רק מהחיתוך שאחרי החודש הראשון שלו (11 חיתוכים)
+        self.assertTrue((scores['count'] == 30 + 11).all())
+        self.assertAlmostEqual(scores.loc['baseline', 'mae'], 0.0)
+
+    def test_baseline_without_history(self):
+        """בדיקה שלסדרה ללא חודשים עם תנועות המודל הבסיסי חוזה 0 ולא NaN"""
+        state = services.FORECAST_MODELS['baseline']['fit'](np.zeros((1, 3)), np.zeros((1, 3), dtype=bool))
+        np.testing.assert_array_equal(services.FORECAST_MODELS['baseline']['predict'](state, 2), [[0.0, 0.0]])
+
+    def test_unknown_model(self):
+        """בדיקה שמודל לא מוכר מעלה שגיאה"""
+        with self.assertRaises(ValueError):
+            services.backtest_models(self.df, models=['prophet'])
+
+class TestIncrementalForecastState(unittest.TestCase):
+    """בדיקות למצב החיזוי המצטבר"""
+    
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        dates = pd.Timestamp('2021-01-01') + pd.to_timedelta(np.sort(rng.integers(0, 1000, 3000)), 'D')
+        self.df = pd.DataFrame({'date': dates, 'amount': rng.normal(20, 300, 3000)})
+    
+    def test_update_matches_full_fit(self):
+        """בדיקה שעדכון בתנועות חדשות נותן את אותה תחזית כמו התאמה על כל הנתונים"""
+        state = services.forecast_state(self.df.iloc[:-100])
+        for model in services.FORECAST_MODELS:
+            services.forecast_from_state(state, 6, model)
+        updated = services.update_forecast_state(state, self.df.iloc[-100:])
+        
+        for model in services.FORECAST_MODELS:
+            expected = services.forecast_cashflow(self.df, 6, model=model)
+            result = services.forecast_from_state(updated, 6, model)
+            np.testing.assert_allclose(result['forecast'], expected['forecast'], rtol=1e-9)
+            self.assertEqual(list(result['date']), list(expected['date']))
+    
+    def test_append_resumes_from_checkpoint(self):
+        """בדיקה שהוספה לחודש האחרון ממשיכה את Holt-Winters מנקודת הביקורת ולא מתאימה מחדש"""
+        state = services.forecast_state(self.df.iloc[:-10])
+        services.forecast_from_state(state, 6, 'holt_winters')
+        services.forecast_from_state(state, 6, 'baseline')
+        updated = services.update_forecast_state(state, self.df.iloc[-10:])
+        
+        self.assertEqual([model for model, _ in updated['fits']], ['holt_winters'])
+        self.assertEqual(len(state['fits']), 2)
+    
+    def test_backdated_append_refits(self):
+        """בדיקה שהוספה לחודש מוקדם מבטלת את ההתאמות השמורות ועדיין מדויקת"""
+        old = self.df.iloc[[0]].assign(amount=1_000.0)
+        state = services.forecast_state(self.df)
+        services.forecast_from_state(state, 6, 'holt_winters')
+        updated = services.update_forecast_state(state, old)
+        
+        self.assertEqual(updated['fits'], {})
+        expected = services.forecast_cashflow(pd.concat([self.df, old]), 6, model='holt_winters')
+        np.testing.assert_allclose(services.forecast_from_state(updated, 6, 'holt_winters')['forecast'],
+                                   expected['forecast'])
+    
+    def test_new_series(self):
+        """בדיקה שסדרה חדשה מתווספת למטריצה"""
+        df = pd.DataFrame({'series': ['A', 'B'], 'date': pd.to_datetime(['2024-01-05', '2024-02-05']),
+                           'amount': [10.0, 20.0]})
+        state = services.forecast_state(df.iloc[:1], series_col='series')
+        updated = services.update_forecast_state(state, df.iloc[1:])
+        
+        pd.testing.assert_frame_equal(services.forecast_from_state(updated, 2),
+                                      services.forecast_many(df, 2))
+    
+    def test_state_cached_per_key(self):
+        """בדיקה שמצב עם מזהה גרסה נשמר במטמון"""
+        state = services.forecast_state(self.df, key='v1')
+        self.assertIs(services.forecast_state(self.df, key='v1'), state)
+
 class TestExchangeRateFallback(unittest.TestCase):
     """בדיקות למנגנון ה-fallback של שערי חליפין"""
     
@@ -0,0 +1,204 @@
+"""
+tests/test_statement.py - בדיקות יחידה למנוע דוח התזרים היומי
+"""
+import unittest
+import numpy as np
+import pandas as pd
+import sys
+import os
+
+# הוספת הנתיב של הפרויקט
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data.statement import (
+    daily_statement, format_statement, sort_statement, page_count, page_for_date, statement_page, STATEMENT_COLUMNS,
+    account_balances, statement_from_balances, statement_window, top_distinct, seasonal_notes, daily_notes,
+    project_balances, forecast_statement
+)
+
+class TestDailyStatement(unittest.TestCase):
+    """בדיקות לחישוב הדוח"""
+
+    def setUp(self):
+        self.transactions = pd.DataFrame({
+            'date': pd.to_datetime(['2024-01-01 09:00', '2024-01-01 15:00', '2024-01-02', '2024-01-04'], format='mixed'),
+            'amount': [500.0, -200.0, -1000.0, 250.0],
+            'description': pd.Categorical(['Sale', 'Rent', 'Salary', 'Sale'])
+        })
+
+    def test_balances_roll_forward(self):
+        """בדיקה שיתרת הסגירה של יום היא יתרת הפתיחה של היום הבא"""
+        statement = daily_statement(self.transactions, opening_balance=1000.0)
+
+        self.assertEqual(list(statement.columns), STATEMENT_COLUMNS)
+        self.assertEqual(list(statement['opening_balance']), [1000.0, 1300.0, 300.0])
+        self.assertEqual(list(statement['closing_balance']), [1300.0, 300.0, 550.0])
+        self.assertEqual(statement['closing_balance'].dtype, np.dtype('float64'))
+
+    def test_inflows_and_outflows_split_daily_net(self):
+        """בדיקה שהתקבולים והתשלומים מחושבים מהתנועה היומית נטו"""
+        statement = daily_statement(self.transactions)
+
+        self.assertEqual(list(statement['cash_inflows']), [300.0, 0.0, 250.0])
+        self.assertEqual(list(statement['cash_outflows']), [0.0, 1000.0, 0.0])
+
+    def test_notes_are_limited(self):
+        """בדיקה שההערות כוללות עד שלושה תיאורים שונים"""
+        busy = pd.DataFrame({
+            'date': pd.to_datetime(['2024-01-01'] * 5),
+            'amount': [1.0] * 5,
+            'description': ['A', 'B', 'A', 'C', 'D']
+        })
+
+        self.assertEqual(daily_statement(busy)['notes'].iloc[0], 'A, B, C...')
+        self.assertEqual(daily_statement(self.transactions)['notes'].iloc[0], 'Sale, Rent')
+
+    def test_format_statement(self):
+        """בדיקה שהעיצוב מוחל רק על השורות שהועברו"""
+        statement = daily_statement(self.transactions, opening_balance=1000.0)
+
+        table = format_statement(statement.tail(1))
+
+        self.assertEqual(len(table), 1)
+        self.assertEqual(table['Date'].iloc[0], '04/01/2024')
+        self.assertEqual(table['Closing Balance'].iloc[0], '$550.00')
+
+class TestTopDistinct(unittest.TestCase):
+    """בדיקות לצבירת הערכים השונים לכל קבוצה"""
+
+    def test_order_of_appearance_and_limit(self):
+        """בדיקה שהסדר הוא סדר ההופעה, שכפילויות וחסרים מושמטים ושנוסף '...' מעבר למגבלה"""
+        notes = top_distinct(['b', 'a', 'b', 'b', 'b', 'a', 'b'],
+                             ['Rent', 'Sale', None, 'Rent', 'Tax', 'Sale', 'Fuel'], limit=2)
+
+        self.assertEqual(list(notes.index), ['a', 'b'])
+        self.assertEqual(list(notes), ['Sale', 'Rent, Tax...'])
+
+    def test_deterministic(self):
+        """בדיקה שאותו קלט נותן תמיד אותה תוצאה, גם עם ערכים קטגוריאליים"""
+        values = pd.Categorical(['Z', 'A', 'M', 'A'])
+        first = top_distinct([1, 1, 1, 2], values)
+
+        self.assertEqual(list(first), ['Z, A, M', 'A'])
+        pd.testing.assert_series_equal(first, top_distinct([1, 1, 1, 2], values))
+
+    def test_seasonal_notes(self):
+        """בדיקה שהערות התחזית הן התנועות הגדולות מאותו חודש בשנה"""
+        history = pd.DataFrame({
+            'date': pd.to_datetime(['2023-01-10', '2023-01-20', '2023-02-01', '2024-01-05']),
+            'amount': [-50.0, 900.0, 10.0, -400.0],
+            'description': ['Fuel', 'Bonus', 'Fee', 'Rent']
+        })
+
+        notes = seasonal_notes(history, pd.to_datetime(['2025-01-31', '2025-03-31']), limit=2)
+
+        self.assertEqual(list(notes), ['Bonus, Rent...', ''])
+
+    def test_notes_cached_by_key(self):
+        """בדיקה שעם מזהה ההערות מחושבות פעם אחת, ושמזהה אחר מחושב מחדש"""
+        history = pd.DataFrame({
+            'date': pd.to_datetime(['2023-01-10', '2023-02-01']),
+            'amount': [-50.0, 10.0],
+            'description': ['Fuel', 'Fee']
+        })
+        dates = pd.to_datetime(['2025-01-31', '2025-02-28'])
+        first = seasonal_notes(history, dates, key=('v1', 'test'))
+        daily = daily_notes(history, key=('v1', 'test'))
+
+        self.assertEqual(list(seasonal_notes(history.iloc[:0], dates, key=('v1', 'test'))), list(first))
+        self.assertIs(daily_notes(history.iloc[:0], key=('v1', 'test')), daily)
+        self.assertEqual(list(seasonal_notes(history.iloc[:1], dates, key=('v2', 'test'))), ['Fuel', ''])
+
+class TestAccountBalances(unittest.TestCase):
+    """בדיקות ליתרות לפי חשבון ולתצוגה המאוחדת"""
+
+    def setUp(self):
+        self.transactions = pd.DataFrame({
+            'date': pd.to_datetime(['2024-01-01', '2024-01-01', '2024-01-02', '2024-01-03']),
+            'amount': [100.0, -30.0, 50.0, -20.0],
+            'account': pd.Categorical(['Main', 'Visa', 'Main', 'Visa']),
+            'description': ['Sale', 'Fuel', 'Sale', 'Food']
+        })
+        self.opening = {'Main': 1000.0, 'Visa': 200.0}
+
+    def test_grouped_balances(self):
+        """בדיקה שכל חשבון מתגלגל מיתרת הפתיחה שלו"""
+        balances = account_balances(self.transactions, self.opening)
+
+        main = balances[balances['account'] == 'Main']
+        visa = balances[balances['account'] == 'Visa']
+        self.assertEqual(list(main['closing_balance']), [1100.0, 1150.0])
+        self.assertEqual(list(visa['closing_balance']), [170.0, 150.0])
+
+    def test_consolidated_matches_accounts(self):
+        """בדיקה שהיתרה המאוחדת היא סכום יתרות החשבונות"""
+        balances = account_balances(self.transactions, self.opening)
+
+        consolidated = statement_from_balances(balances)
+        self.assertEqual(list(consolidated['opening_balance']), [1200.0, 1270.0, 1320.0])
+        self.assertEqual(consolidated['closing_balance'].iloc[-1], 1300.0)
+
+        visa = daily_statement(self.transactions, self.opening, account='Visa')
+        self.assertEqual(list(visa['notes']), ['Fuel', 'Food'])
+        self.assertEqual(visa['opening_balance'].iloc[0], 200.0)
+
+    def test_window_keeps_history_balance(self):
+        """בדיקה שחיתוך טווח תאריכים נפתח ביתרה בפועל ולא ביתרת הפתיחה"""
+        statement = daily_statement(self.transactions, self.opening)
+
+        window = statement_window(statement, '2024-01-02', '2024-01-03')
+
+        self.assertEqual(len(window), 2)
+        self.assertEqual(window['opening_balance'].iloc[0], 1270.0)
+
+class TestForecastProjection(unittest.TestCase):
+    """בדיקות להטלת התחזית על מבנה הדוח"""
+
+    def test_forecast_statement(self):
+        """בדיקה שהתחזית מתגלגלת מהיתרה בפועל, עם תקבולים, תשלומים והערות"""
+        forecast = pd.DataFrame({
+            'date': pd.to_datetime(['2025-01-31', '2025-02-28', '2025-03-31']),
+            'forecast': [100.0, -300.0, 50.0]
+        })
+
+        statement = forecast_statement(forecast, 1000.0, notes=['Rent', '', 'Sale'])
+
+        self.assertEqual(list(statement['opening_balance']), [1000.0, 1100.0, 800.0])
+        self.assertEqual(list(statement['closing_balance']), [1100.0, 800.0, 850.0])
+        self.assertEqual(list(statement['cash_outflows']), [0.0, 300.0, 0.0])
+        self.assertEqual(list(statement['forecast']), [100.0, -300.0, 50.0])
+        self.assertEqual(list(statement['notes']), ['Rent', '', 'Sale'])
+
+    def test_scenarios_in_one_pass(self):
+        """בדיקה שמטריצת תרחישים מתגלגלת עם יתרת פתיחה לכל תרחיש"""
+        closing = project_balances([[1.0, 2.0], [-1.0, -2.0]], [10.0, 20.0])
+
+        np.testing.assert_array_equal(closing, [[11.0, 13.0], [19.0, 17.0]])
+
+class TestStatementPaging(unittest.TestCase):
+    """בדיקות לחלוקת הדוח לעמודים"""
+
+    def setUp(self):
+        days = pd.date_range('2024-01-01', periods=10, freq='D')
+        self.statement = daily_statement(pd.DataFrame({'date': days, 'amount': [float(i) for i in range(10)]}))
+
+    def test_pages(self):
+        """בדיקה של מספר העמודים ושל חיתוך עמוד"""
+        self.assertEqual(page_count(self.statement, 4), 3)
+        self.assertEqual(page_count(self.statement.iloc[:0], 4), 1)
+        self.assertEqual(list(statement_page(self.statement, 2, 4)['amount']), [8.0, 9.0])
+
+    def test_jump_to_date(self):
+        """בדיקה שהקפיצה לתאריך מוצאת את העמוד הנכון בשני כיווני המיון"""
+        self.assertEqual(page_for_date(self.statement, '2024-01-05', 4), 1)
+        self.assertEqual(page_for_date(self.statement, '2024-01-05', 4, ascending=False), 1)
+        self.assertEqual(page_for_date(self.statement, '2030-01-01', 4), 2)
+
+    def test_sort(self):
+        """בדיקה של מיון לפי תאריך ולפי עמודה אחרת"""
+        self.assertEqual(sort_statement(self.statement, ascending=False)['amount'].iloc[0], 9.0)
+        by_inflows = sort_statement(self.statement, 'cash_inflows', ascending=False)
+        self.assertEqual(list(by_inflows['cash_inflows'].iloc[:2]), [9.0, 8.0])
+
+if __name__ == '__main__':
+    unittest.main()
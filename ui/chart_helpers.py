@@ -1,11 +1,22 @@
 """
 ui/chart_helpers.py - Helper functions for improved chart display
 """
+import hashlib
+import io
+import threading
+from collections import OrderedDict
 import matplotlib.pyplot as plt
 import matplotlib.ticker as ticker
+import numpy as np
 import pandas as pd
 from datetime import datetime
 
+# Rendered charts, keyed on a fingerprint of the inputs plus the drawing function and size
+CHART_CACHE_SIZE = 64
+CHART_DPI = 200  # same resolution st.pyplot uses
+_chart_cache = OrderedDict()
+_chart_cache_lock = threading.Lock()
+
 def format_currency(value, pos=None):
     """Format currency with comma thousands separator"""
     return f'${value:,.0f}'
@@ -55,4 +66,89 @@ def format_month_labels(dates):
     if isinstance(dates[0], str):
         return [datetime.strptime(d, '%Y-%m').strftime('%b %Y') for d in dates]
     else:
-        return [d.strftime('%b %Y') for d in dates] 
\ No newline at end of file
+        return [d.strftime('%b %Y') for d in dates] 
+
+def chart_fingerprint(*inputs):
+    """Stable content hash of chart inputs (DataFrames/Series are hashed by value, including the index)"""
+    digest = hashlib.blake2b(digest_size=16)
+    for value in inputs:
+        if isinstance(value, (pd.DataFrame, pd.Series)):
+            names = tuple(value.columns) if isinstance(value, pd.DataFrame) else (value.name,)
+            digest.update(repr((type(value).__name__, names, str(value.index.dtype))).encode())
+            digest.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+        else:
+            digest.update(repr(value).encode())
+    return digest.hexdigest()
+
+def render_chart(draw, *inputs, width=4, height=3, fmt="png", dpi=CHART_DPI):
+    """
+    Render a chart to image bytes, reusing the cached bytes for identical inputs.
+    :param draw: function(ax, *inputs) that draws the chart; it defines the chart's style
+    :param inputs: data the chart is drawn from (part of the cache key)
+    :param fmt: 'png' or 'svg'
+    :return: the rendered image bytes
+    """
+    key = (draw.__module__, draw.__qualname__, chart_fingerprint(*inputs), width, height, fmt, dpi)
+    with _chart_cache_lock:
+        if key in _chart_cache:
+            _chart_cache.move_to_end(key)
+            return _chart_cache[key]
+
+    fig, ax = create_figure(width, height)
+    try:
+        ax.set_facecolor('#181943')
+        draw(ax, *inputs)
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format=fmt, dpi=dpi, bbox_inches="tight", facecolor=fig.get_facecolor())
+    finally:
+        plt.close(fig)  # always release the figure, even if drawing failed
+    image = buffer.getvalue()
+
+    with _chart_cache_lock:
+        _chart_cache[key] = image
+        while len(_chart_cache) > CHART_CACHE_SIZE:
+            _chart_cache.popitem(last=False)
+    return image
+
+def point_budget(width, dpi=CHART_DPI):
+    """Number of points worth drawing on a chart: one per horizontal pixel of the rendered image"""
+    return max(3, int(width * dpi))
+
+def lttb_indices(x, y, threshold):
+    """
+    Largest-Triangle-Three-Buckets: positions of the points that best preserve the shape of the line.
+    The first and last points are always kept; every bucket in between contributes the point that
+    forms the largest triangle with the previously kept point and the next bucket's average.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = x - x[0]
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    anchor = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_start, next_end = (end, edges[bucket + 2]) if bucket + 2 < len(edges) else (n - 1, n)
+        avg_x, avg_y = x[next_start:next_end].mean(), y[next_start:next_end].mean()
+        area = np.abs((x[anchor] - avg_x) * (y[start:end] - y[anchor])
+                      - (x[anchor] - x[start:end]) * (avg_y - y[anchor]))
+        anchor = start + int(np.argmax(area))
+        selected[bucket + 1] = anchor
+    return selected
+
+def downsample(data, max_points, column=None):
+    """
+    Reduce a time series to at most about max_points points for plotting (LTTB).
+    The global minimum and maximum are always kept, so peaks and troughs survive.
+    :param data: Series, or DataFrame with the plotted values in `column`, indexed by date
+    :return: the same type, with a subset of the rows (unchanged if already small enough)
+    """
+    if len(data) <= max_points:
+        return data
+    values = (data[column] if column is not None else data).to_numpy(dtype="float64")
+    x = data.index.to_numpy().astype("int64").astype("float64")
+    keep = lttb_indices(x, values, max_points)
+    keep = np.union1d(keep, [int(np.argmin(values)), int(np.argmax(values))])
+    return data.iloc[keep]
@@ -4,6 +4,7 @@ ui/components.py - רכיבי UI משותפים
 import streamlit as st
 from PIL import Image
 import pandas as pd
+from ui.chart_helpers import render_chart
 
 def display_header():
     """הצגת כותרת ולוגו של האפליקציה"""
@@ -44,6 +45,17 @@ def render_warning_table(val, title):
     elif val:
         st.warning(f"{title}: {val}")
 
+def chart_tab_selector(labels, key):
+    """
+    בורר לשוניות לגרפים: בניגוד ל-st.tabs, רק הלשונית הנבחרת מחושבת ומוצגת.
+    :return: התווית הנבחרת
+    """
+    return st.radio("Chart", labels, horizontal=True, key=key, label_visibility="collapsed")
+
+def display_chart(draw, *inputs, width=4, height=3):
+    """הצגת גרף דרך מטמון התמונות של render_chart - גרף זהה אינו מצויר מחדש"""
+    st.image(render_chart(draw, *inputs, width=width, height=height), use_container_width=True)
+
 def convert_df_to_csv(df):
     """המרת DataFrame ל-CSV להורדה"""
     return df.to_csv(index=False).encode('utf-8')